@@ -0,0 +1,137 @@
+"""Runs the agent against a local fake controller and reports latency, throughput, payload and memory figures.
+
+Usage: python -m benchmarks.agent [--clusters 1,10,50] [--duration 3] [--heartbeat-interval 0.05] [--output FILE]
+
+Results are printed (or written to FILE) as a single JSON document so runs can be compared between releases.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import sys
+import time
+
+import kubernaut
+import kubernaut.agent as agent
+
+from benchmarks.controller import FakeController
+from benchmarks.payloads import make_clusters
+from kubernaut.backoff import Backoff
+from kubernaut.endpoints import EndpointPool
+from kubernaut.heartbeat import Heartbeat
+from kubernaut.model import AgentState, ClusterRegistry
+from typing import Any, Dict, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not samples:
+        return float("nan")
+
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def rss_bytes() -> int:
+    """Returns the current resident set size of this process, or the peak if the current size is unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def run_scenario(cluster_count: int, duration: float, heartbeat_interval: float) -> Dict[str, Any]:
+    controller = FakeController()
+    await controller.start()
+
+    rss_before = rss_bytes()
+    agent.agent_id = "00000000-0000-0000-0000-benchmark000"
+    agent.agent_state = AgentState.STARTING
+    agent.clusters = ClusterRegistry()
+    agent.teardowns = {}
+    for c in make_clusters(cluster_count, state="UNREGISTERED"):
+        agent.clusters.add(c)
+
+    started = time.monotonic()
+    task = asyncio.ensure_future(agent._run_agent(
+        EndpointPool([controller.url]),
+        cluster_shutdown=False,
+        heartbeat=Heartbeat(interval=heartbeat_interval, jitter=0.0),
+        backoff=Backoff()
+    ))
+
+    await asyncio.sleep(duration)
+    rss_after = rss_bytes()
+
+    await controller.release_all()
+    await asyncio.wait_for(task, timeout=10)
+    elapsed = time.monotonic() - started
+    await controller.stop()
+
+    frames = sum(controller.frames.values())
+    heartbeats = controller.frames["cluster-heartbeat"]
+    snapshots = controller.frames["clusters-snapshot"]
+    beats = heartbeats + snapshots
+
+    return {
+        "clusters": cluster_count,
+        "heartbeat_interval_s": heartbeat_interval,
+        "duration_s": round(elapsed, 3),
+        "startup_to_first_snapshot_ms": round((controller.first_snapshot_at - started) * 1000, 3),
+        "ping_rtt_ms": {
+            "samples": len(controller.ping_rtts),
+            "p50": round(percentile(controller.ping_rtts, 50) * 1000, 3),
+            "p99": round(percentile(controller.ping_rtts, 99) * 1000, 3),
+        },
+        "frames": dict(controller.frames),
+        "frames_per_second": round(frames / elapsed, 2),
+        "bytes_per_beat": round((controller.bytes["cluster-heartbeat"] + controller.bytes["clusters-snapshot"]) /
+                                max(beats, 1), 1),
+        "bytes_per_heartbeat": round(controller.bytes["cluster-heartbeat"] / max(heartbeats, 1), 1),
+        "bytes_per_snapshot": round(controller.bytes["clusters-snapshot"] / max(snapshots, 1), 1),
+        "rss_per_cluster_bytes": max(0, rss_after - rss_before) // cluster_count,
+    }
+
+
+def run(cluster_counts: List[int], duration: float, heartbeat_interval: float) -> Dict[str, Any]:
+    loop = asyncio.get_event_loop()
+    results = [loop.run_until_complete(run_scenario(n, duration, heartbeat_interval)) for n in cluster_counts]
+    return {
+        "benchmark": "agent",
+        "version": kubernaut.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clusters", default="1,10,50", help="comma separated cluster counts, one scenario each")
+    parser.add_argument("--duration", default=3.0, type=float, help="seconds to run each scenario")
+    parser.add_argument("--heartbeat-interval", default=0.05, type=float, help="agent heartbeat interval in seconds")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    agent.logger.disabled = True
+    agent.logging.getLogger().setLevel("WARNING")
+
+    report = run([int(c) for c in args.clusters.split(",")], args.duration, args.heartbeat_interval)
+    document = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+    else:
+        sys.stdout.write(document + "\n")
+
+
+if __name__ == "__main__":
+    main()
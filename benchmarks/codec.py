@@ -0,0 +1,57 @@
+"""Compares the JSON codecs available to the agent on realistic clusters-snapshot payloads.
+
+Usage: python -m benchmarks.codec [--clusters 1,10,50] [--repeat 200]
+"""
+
+import argparse
+import json
+import timeit
+
+from benchmarks.payloads import make_clusters
+from kubernaut.protocol import clusters_snapshot, encode_clusters_snapshot
+from kubernaut.util import available_codecs, codec
+
+
+def pretty_encode(obj):
+    """The encoding the agent used before the codec layer existed."""
+    return json.dumps(obj, indent=True).encode("utf-8")
+
+
+def run(cluster_counts, repeat: int):
+    results = []
+    for count in cluster_counts:
+        clusters = make_clusters(count)
+        message = clusters_snapshot(clusters)
+        encoders = [("json-indent", pretty_encode, json.loads)]
+        encoders += [(name, c.encode, c.decode) for name, c in available_codecs().items()]
+
+        # Snapshot assembled from each cluster's cached fragment, as the agent sends it when nothing has changed.
+        encoders += [("cached-fragments", lambda _: encode_clusters_snapshot(clusters), codec.decode)]
+
+        for name, encode, decode in encoders:
+            data = encode(message)
+            encode_time = min(timeit.repeat(lambda: encode(message), number=repeat, repeat=3)) / repeat
+            decode_time = min(timeit.repeat(lambda: decode(data), number=repeat, repeat=3)) / repeat
+            results.append({
+                "codec": name,
+                "clusters": count,
+                "bytes": len(data),
+                "encode_us": round(encode_time * 1e6, 2),
+                "decode_us": round(decode_time * 1e6, 2),
+            })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clusters", default="1,10,50", help="comma separated cluster counts per snapshot")
+    parser.add_argument("--repeat", default=200, type=int, help="encodes/decodes per timing sample")
+    args = parser.parse_args()
+
+    results = run([int(c) for c in args.clusters.split(",")], args.repeat)
+    print(json.dumps({"benchmark": "codec", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
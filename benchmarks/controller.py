@@ -0,0 +1,137 @@
+"""A local stand-in for the Kubernaut Controller that speaks enough of CAPv1 to exercise the agent.
+
+Usage: python -m benchmarks.controller [--host 127.0.0.1] [--port 8765]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import websockets
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("fake-controller")
+
+
+class FakeController:
+
+    """Accepts agent connections and records what they send.
+
+    Snapshots are answered with a clusters-snapshot that moves every cluster to ``UNCLAIMED``, the sync handshake is
+    answered with whatever claim state the controller already holds and heartbeats are not answered at all, as a real
+    controller would behave. The controller pings agents at ``ping_interval`` to measure how quickly their event loop
+    answers.
+
+    :argument host the interface to listen on.
+    :argument port the port to listen on, 0 picks a free port.
+    :argument ping_interval seconds between pings to a connected agent, 0 disables pinging.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ping_interval: float = 0.05):
+        self.host = host
+        self.port = port
+        self.ping_interval = ping_interval
+        self.server = None
+
+        self.connections = 0
+        self.frames = Counter()
+        self.bytes = Counter()
+        self.states: Dict[str, str] = {}
+        self.ping_rtts: List[float] = []
+        self.first_snapshot_at: Optional[float] = None
+        self._agents = set()
+
+    @property
+    def url(self) -> str:
+        return "ws://{}:{}/ws/kapv1".format(self.host, self.port)
+
+    async def start(self):
+        self.server = await websockets.serve(self._handle, self.host, self.port, compression=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def release_all(self):
+        """Pushes a cluster-released message for every cluster to every connected agent."""
+        message = json.dumps({"@type": "cluster-released", "clusters": list(self.states)})
+        for websocket in list(self._agents):
+            await websocket.send(message)
+
+    async def disconnect_all(self):
+        """Closes the connection of every connected agent from the controller's side, as a controller restart would."""
+        for websocket in list(self._agents):
+            await websocket.close()
+
+    async def _handle(self, websocket, path=None):
+        self.connections += 1
+        self._agents.add(websocket)
+        pinger = asyncio.ensure_future(self._ping(websocket)) if self.ping_interval else None
+        try:
+            async for data in websocket:
+                await self._dispatch(websocket, data)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self._agents.discard(websocket)
+            if pinger:
+                pinger.cancel()
+
+    async def _dispatch(self, websocket, data):
+        message = json.loads(data)
+        message_type = message.get("@type")
+        self.frames[message_type] += 1
+        self.bytes[message_type] += len(data.encode("utf-8") if isinstance(data, str) else data)
+
+        if message_type == "agent-sync-request":
+            await websocket.send(json.dumps({
+                "@type": "agent-sync-response",
+                "clusters": {cluster_id: {"claimStatus": state} for cluster_id, state in self.states.items()}
+            }))
+        elif message_type == "clusters-snapshot":
+            if self.first_snapshot_at is None:
+                self.first_snapshot_at = time.monotonic()
+
+            for cluster_id in message["clusters"]:
+                self.states.setdefault(cluster_id, "UNCLAIMED")
+
+            await websocket.send(json.dumps({
+                "@type": "clusters-snapshot",
+                "clusters": {cluster_id: {"status": self.states[cluster_id]} for cluster_id in message["clusters"]}
+            }))
+
+    async def _ping(self, websocket):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            started = time.monotonic()
+            try:
+                pong = await websocket.ping()
+                await asyncio.wait_for(pong, timeout=10)
+            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+                return
+
+            self.ping_rtts.append(time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8765, type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    controller = FakeController(args.host, args.port, ping_interval=0)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(controller.start())
+    logger.info("Fake controller listening on %s", controller.url)
+    loop.run_forever()
+
+
+if __name__ == "__main__":
+    main()
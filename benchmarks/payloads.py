@@ -0,0 +1,51 @@
+import base64
+import random
+
+from kubernaut.model import Cluster
+
+KUBECONFIG_TEMPLATE = """apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: {ca}
+    server: https://10.0.{octet}.10:6443
+  name: kubernetes
+contexts:
+- context:
+    cluster: kubernetes
+    user: admin
+  name: admin@kubernetes
+current-context: admin@kubernetes
+kind: Config
+preferences: {{}}
+users:
+- name: admin
+  user:
+    client-certificate-data: {cert}
+    client-key-data: {key}
+"""
+
+
+def _pem_blob(rng: random.Random, size: int) -> str:
+    return base64.b64encode(bytes(rng.getrandbits(8) for _ in range(size))).decode("ascii")
+
+
+def make_kubeconfig(seed: int = 0) -> str:
+    """Returns a kubeconfig shaped like the ones kubeadm writes, with embedded certificate and key data."""
+    rng = random.Random(seed)
+    return KUBECONFIG_TEMPLATE.format(
+        ca=_pem_blob(rng, 1025),
+        octet=seed % 250,
+        cert=_pem_blob(rng, 1090),
+        key=_pem_blob(rng, 1675)
+    )
+
+
+def make_clusters(count: int, state: str = "UNCLAIMED"):
+    return [
+        Cluster(
+            cluster_id="00000000-0000-0000-0000-{:012d}".format(n),
+            state=state,
+            kubeconfig=make_kubeconfig(seed=n),
+            token="cluster-group-token"
+        ) for n in range(count)
+    ]
@@ -1,39 +1,242 @@
 import asyncio
+import atexit
 import click
 import logging
+import os
 import sys
 import websockets
 
-from kubernaut.model import Cluster
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from kubernaut.api import ApiClient, ApiError
+from kubernaut.backoff import Backoff
+from kubernaut.cache import ClusterIdCache, cluster_key
+from kubernaut.compression import CompressionStats, PayloadEnvelope, deflate_extensions
+from kubernaut.endpoints import EndpointPool
+from kubernaut.heartbeat import Heartbeat
+from kubernaut.kubeconfig import Kubeconfig
+from kubernaut.model import AgentState, Baseline, Cluster, ClusterRegistry, ClusterState
+from kubernaut.protocol import *
+from kubernaut.proxy import KubectlProxy, ProxyApiClient
+from kubernaut.readiness import ReadinessProbe
+from kubernaut.session import Session
+from kubernaut.teardown import DryRun
 from kubernaut.kubernetes import *
 from kubernaut.util import *
 from pathlib import Path
-from time import sleep
+from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import UUID, uuid4
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger("agent")
 
-cluster: Cluster = None
+clusters: ClusterRegistry = ClusterRegistry()
+teardowns: Dict[str, asyncio.Future] = {}
+cluster_shutdown_enabled: bool = True
+shutdown_parallelism: int = 4
+shutdown_node_timeout: Optional[float] = None
+shutdown_budget: Optional[float] = None
+shutdown_batch_size: Optional[int] = None
+shutdown_dry_run: bool = False
+release_action: str = "shutdown"
+recycles: Dict[str, asyncio.Future] = {}
+baseline_captures: Dict[str, asyncio.Future] = {}
+current_session: Optional[Session] = None
+readiness_gate: bool = True
+readiness_max_delay: float = 10.0
+readiness_probes: Dict[str, asyncio.Future] = {}
 
 agent_id = None
-agent_state: str = "starting"
+agent_state: AgentState = AgentState.STARTING
+
+
+class FloatRange(click.ParamType):
+
+    """A float option restricted to a range, like click.IntRange; click.FloatRange is not available in click 6.
+
+    :argument min the lowest value allowed, or None for no lower bound.
+    :argument max the highest value allowed, or None for no upper bound.
+    :argument min_open whether ``min`` itself is excluded, e.g. for values that must be positive.
+    """
+
+    name = "float range"
+
+    def __init__(self, min: float = None, max: float = None, min_open: bool = False):
+        self.min = min
+        self.max = max
+        self.min_open = min_open
+
+    def convert(self, value, param, ctx):
+        value = click.FLOAT.convert(value, param, ctx)
+        below = self.min is not None and (value <= self.min if self.min_open else value < self.min)
+        above = self.max is not None and value > self.max
+        if below or above:
+            self.fail("{} is not in the valid range of {}.".format(value, self._describe()), param, ctx)
+
+        return value
+
+    def _describe(self) -> str:
+        bounds = []
+        if self.min is not None:
+            bounds.append("{} {}".format(">" if self.min_open else ">=", self.min))
+        if self.max is not None:
+            bounds.append("<= {}".format(self.max))
+
+        return " and ".join(bounds)
+
+    def __repr__(self):
+        return "FloatRange({}, {})".format(self.min, self.max)
 
 
 @click.command()
 @click.option(
     "--controller",
     envvar="KUBERNAUT_CONTROLLER_ADDRESS",
-    help="Configure remote Kubernaut Controller address",
-    default="wss://next.kubernaut.io/beta/ws/kapv1",
+    help="Configure remote Kubernaut Controller address. Repeat to configure failover controllers",
+    default=["wss://next.kubernaut.io/beta/ws/kapv1"],
+    multiple=True,
     type=str
 )
+@click.option(
+    "--controller-probe-interval",
+    envvar="KUBERNAUT_CONTROLLER_PROBE_INTERVAL",
+    help="Seconds between health and round-trip probes of the configured controllers",
+    default=30.0,
+    type=FloatRange(min=0, min_open=True)
+)
+@click.option(
+    "--kubectl-proxy",
+    envvar="KUBERNAUT_KUBECTL_PROXY",
+    help="Talk to each cluster through a supervised, long-lived kubectl proxy instead of a client of the agent's own",
+    default=False,
+    type=bool
+)
 @click.option(
     "--cluster-shutdown",
     envvar="KUBERNAUT_CLUSTER_SHUTDOWN",
     default=True,
     type=bool
 )
+@click.option(
+    "--release-action",
+    envvar="KUBERNAUT_RELEASE_ACTION",
+    help="What to do with a released cluster: shut it down, or recycle it by deleting what its user added and "
+         "registering it again, falling back to shutting it down if that fails",
+    default="shutdown",
+    type=click.Choice(["shutdown", "recycle"])
+)
+@click.option(
+    "--shutdown-parallelism",
+    envvar="KUBERNAUT_SHUTDOWN_PARALLELISM",
+    help="Maximum number of nodes drained and deleted at the same time during cluster shutdown",
+    default=4,
+    type=click.IntRange(min=1)
+)
+@click.option(
+    "--shutdown-node-timeout",
+    envvar="KUBERNAUT_SHUTDOWN_NODE_TIMEOUT",
+    help="Seconds allowed to drain and delete a single node during cluster shutdown, 0 waits indefinitely",
+    default=300.0,
+    type=FloatRange(min=0)
+)
+@click.option(
+    "--shutdown-budget",
+    envvar="KUBERNAUT_SHUTDOWN_BUDGET",
+    help="Seconds allowed to drain and delete every node before resetting and powering off the host, 0 waits forever",
+    default=900.0,
+    type=FloatRange(min=0)
+)
+@click.option(
+    "--shutdown-batch-size",
+    envvar="KUBERNAUT_SHUTDOWN_BATCH_SIZE",
+    help="Most nodes drained or deleted by one kubectl call, 0 splits the nodes evenly across --shutdown-parallelism",
+    default=0,
+    type=click.IntRange(min=0)
+)
+@click.option(
+    "--shutdown-dry-run",
+    envvar="KUBERNAUT_SHUTDOWN_DRY_RUN",
+    help="Only pretend to drain, delete, reset and power off released clusters, logging where the time would go",
+    default=False,
+    type=bool
+)
+@click.option(
+    "--readiness-gate",
+    envvar="KUBERNAUT_READINESS_GATE",
+    help="Advertise a cluster only once its API server, nodes and kube-system pods are ready",
+    default=True,
+    type=bool
+)
+@click.option(
+    "--readiness-max-delay",
+    envvar="KUBERNAUT_READINESS_MAX_DELAY",
+    help="Maximum seconds between readiness polls of a cluster that is not ready yet, at least 0.5",
+    default=10.0,
+    type=FloatRange(min=0.5)
+)
+@click.option(
+    "--heartbeat-interval",
+    envvar="KUBERNAUT_HEARTBEAT_INTERVAL",
+    help="Seconds between cluster heartbeats sent to the controller",
+    default=5.0,
+    type=FloatRange(min=0, min_open=True)
+)
+@click.option(
+    "--heartbeat-jitter",
+    envvar="KUBERNAUT_HEARTBEAT_JITTER",
+    help="Maximum random heartbeat offset as a fraction of the heartbeat interval, at most 0.5",
+    default=0.1,
+    type=FloatRange(0, 0.5)
+)
+@click.option(
+    "--reconnect-max-delay",
+    envvar="KUBERNAUT_RECONNECT_MAX_DELAY",
+    help="Maximum seconds to wait between controller reconnect attempts, at least 0.25",
+    default=30.0,
+    type=FloatRange(min=0.25)
+)
+@click.option(
+    "--json-codec",
+    envvar="KUBERNAUT_JSON_CODEC",
+    help="JSON codec used for controller messages, by default the fastest one installed",
+    default="auto",
+    type=click.Choice(["auto", "orjson", "ujson", "json"])
+)
+@click.option(
+    "--compression",
+    envvar="KUBERNAUT_COMPRESSION",
+    help="Offer permessage-deflate compression to the controller",
+    default="deflate",
+    type=click.Choice(["deflate", "none"])
+)
+@click.option(
+    "--compression-level",
+    envvar="KUBERNAUT_COMPRESSION_LEVEL",
+    help="zlib compression level (1-9)",
+    default=6,
+    type=click.IntRange(1, 9)
+)
+@click.option(
+    "--compression-window-bits",
+    envvar="KUBERNAUT_COMPRESSION_WINDOW_BITS",
+    help="Base two logarithm of the compression window (9-15)",
+    default=15,
+    type=click.IntRange(9, 15)
+)
+@click.option(
+    "--compression-envelope",
+    envvar="KUBERNAUT_COMPRESSION_ENVELOPE",
+    help="Wrap large frames in a compressed-payload message if the controller does not negotiate permessage-deflate",
+    default=False,
+    type=bool
+)
+@click.option(
+    "--kubeconfig",
+    "extra_kubeconfigs",
+    help="Another kubeconfig file, or directory of kubeconfig files, of a cluster to manage. Repeat to add more",
+    multiple=True,
+    type=click.Path(exists=True)
+)
 @click.argument(
     "kubeconfig_file",
     envvar="KUBERNAUT_CLUSTER_KUBECONFIG",
@@ -44,83 +247,504 @@ agent_state: str = "starting"
     envvar="KUBERNAUT_CLUSTER_GROUP_TOKEN",
     type=str
 )
-def run_agent(controller: str, cluster_shutdown: bool, kubeconfig_file: str, token: str):
-    logging.info("Agent is %s", agent_state)
-    logging.info("Agent is connecting to %s", controller)
+def run_agent(controller: List[str],
+              controller_probe_interval: float,
+              kubectl_proxy: bool,
+              cluster_shutdown: bool,
+              release_action: str,
+              shutdown_parallelism: int,
+              shutdown_node_timeout: float,
+              shutdown_budget: float,
+              shutdown_batch_size: int,
+              shutdown_dry_run: bool,
+              readiness_gate: bool,
+              readiness_max_delay: float,
+              heartbeat_interval: float,
+              heartbeat_jitter: float,
+              reconnect_max_delay: float,
+              json_codec: str,
+              compression: str,
+              compression_level: int,
+              compression_window_bits: int,
+              compression_envelope: bool,
+              extra_kubeconfigs: List[str],
+              kubeconfig_file: str,
+              token: str):
+    logging.info("Agent is %s", agent_state.value)
+    logging.info("Agent is connecting to %s", ", ".join(controller))
     logging.info("Agent cluster shutdown %s", ("enabled" if cluster_shutdown else "disabled"))
+    logging.info("Agent release action is %s", release_action)
+    if cluster_shutdown and shutdown_dry_run:
+        logging.info("Agent cluster shutdown is a dry run")
+    logging.info("Agent JSON codec is %s", set_codec(json_codec).name)
 
-    global agent_id, cluster
+    global agent_id
 
     agent_data = ensure_data_dir_exists(Path(click.get_app_dir("kubernaut-agent", force_posix=True)))
     agent_id = get_agent_id(agent_data)
 
     logging.info("Agent ID is: %s", agent_id)
 
-    kubeconfig = read_kubeconfig(Path(kubeconfig_file))
-    cluster_id = discover_cluster_id(namespace="default", kubeconfig=Path(kubeconfig_file))
+    cluster_ids = ClusterIdCache(agent_data / "cluster-ids.json")
+    cached = []
+    seen = {}
+    kubeconfig_files = [kubeconfig_file] + list(extra_kubeconfigs)
+    for kubeconfig_file in find_kubeconfigs([Path(p) for p in kubeconfig_files]):
+        kubeconfig = read_kubeconfig(kubeconfig_file)
+        if kubeconfig in seen:
+            logging.warning("Kubeconfig %s is identical to %s, skipping it", kubeconfig_file, seen[kubeconfig])
+            continue
 
-    logging.info("Cluster ID is: %s", cluster_id)
+        seen[kubeconfig] = kubeconfig_file
+        api = _api_client(kubeconfig, kubeconfig_file, kubectl_proxy)
+        key = cluster_key(kubeconfig)
+        cluster_id = cluster_ids.get(key)
+        if cluster_id is None:
+            cluster_id, api = _discover_cluster_id(kubeconfig, api)
+            cluster_ids.put(key, cluster_id)
+            logging.info("Cluster ID is: %s (%s)", cluster_id, kubeconfig_file)
+        else:
+            cached.append((kubeconfig, key, cluster_id, api))
+            logging.info("Cluster ID is: %s (%s, cached)", cluster_id, kubeconfig_file)
+
+        if cluster_id in clusters:
+            logging.warning("Cluster %s is already registered, skipping %s", cluster_id, kubeconfig_file)
+            continue
+
+        clusters.add(Cluster(
+            cluster_id=cluster_id,
+            state=ClusterState.UNREGISTERED,
+            kubeconfig=kubeconfig,
+            token=token,
+            api=api
+        ))
+
+    require_not_empty(clusters, "No kubeconfig files found in {}".format(", ".join(kubeconfig_files)))
+
+    heartbeat = Heartbeat(interval=heartbeat_interval, jitter=heartbeat_jitter)
+    backoff = Backoff(cap=reconnect_max_delay)
+
+    envelope = PayloadEnvelope(level=compression_level) if compression_envelope else None
+
+    loop = asyncio.get_event_loop()
+    if cached:
+        asyncio.ensure_future(_revalidate_cluster_ids(cluster_ids, cached))
+
+    loop.run_until_complete(_run_agent(
+        EndpointPool(list(controller)),
+        cluster_shutdown,
+        heartbeat,
+        backoff,
+        deflate=(compression == "deflate"),
+        compression_level=compression_level,
+        compression_window_bits=compression_window_bits,
+        envelope=envelope,
+        probe_interval=controller_probe_interval,
+        parallelism=shutdown_parallelism,
+        node_timeout=(shutdown_node_timeout or None),
+        budget=(shutdown_budget or None),
+        batch_size=(shutdown_batch_size or None),
+        dry_run=shutdown_dry_run,
+        action=release_action,
+        readiness=readiness_gate,
+        readiness_delay=readiness_max_delay
+    ))
 
-    cluster = Cluster(
-        cluster_id=cluster_id,
-        state="UNREGISTERED",
-        kubeconfig=kubeconfig,
-        token=token
-    )
+
+def _discover_cluster_id(kubeconfig: Kubeconfig, api: Optional[ApiClient]) -> Tuple[str, Optional[ApiClient]]:
+    """Discovers a cluster ID through the API client if there is one, otherwise or if the API request fails, kubectl."""
+    if api is not None:
+        try:
+            return discover_cluster_id(namespace="default", client=api), api
+        except (ApiError, OSError) as e:
+            logging.warning("Kubernetes API request failed, falling back to kubectl (%s): %s", kubeconfig.source, e)
+
+    return discover_cluster_id(namespace="default", kubeconfig=kubeconfig.path), None
+
+
+async def _revalidate_cluster_ids(cache: ClusterIdCache,
+                                  cached: List[Tuple[Kubeconfig, str, str, Optional[ApiClient]]]):
+
+    """Checks cluster IDs that were taken from the cache against the clusters themselves.
+
+    This runs in the background once the agent is connecting so that a slow or still starting API server does not delay
+    startup. A cluster whose ID has changed is only corrected in the cache, taking effect when the agent restarts.
+    """
 
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(_run_agent(controller, cluster_shutdown))
-
-
-async def _run_agent(controller: str, cluster_shutdown: bool):
-    global agent_id, agent_state, cluster
-    controller_url = "{}?agent-id={}".format(controller, str(agent_id))
-    async with websockets.connect(controller_url) as websocket:
-        agent_state = "connected"
-        logging.info("Agent is %s", agent_state)
-        while True:
-
-            cluster_json = jsonify({
-                "@type": "clusters-snapshot",
-                "clusters": {
-                    cluster.cluster_id: {
-                        "id": cluster.cluster_id,
-                        "token": cluster.token,
-                        "detail": {"kubeconfig": cluster.kubeconfig},
-                        "status": cluster.state
-                    }
-                }
-            }, indent=True)
-
-            await websocket.send(cluster_json)
-            logger.info("Cluster snapshot sent,     cluster: %s, state: %s", cluster.cluster_id, cluster.state)
-            response = await websocket.recv()
-
-            json_dict = unjsonify(response)
-            if json_dict["@type"] == "clusters-snapshot":
-                status = json_dict["clusters"][cluster.cluster_id]["status"]
-                logger.info("Cluster snapshot received, cluster: %s, state: %s", cluster.cluster_id, status)
-                cluster.state = status
-            else:
-                logger.warning("Received unknown message type: %s", json_dict["@type"])
-
-            if cluster.state.lower() in ["discarded", "expired", "released"]:
-                agent_state = "shutdown"
-
-            if agent_state == "shutdown":
-                if cluster_shutdown:
-                    logging.info("Cluster shutdown starting")
-                    cluster.shutdown(
-                        kubectl_handler=kubectl,
-                        kubeadm_handler=kubeadm,
-                        system_handler=os.system,
+    for kubeconfig, key, cluster_id, api in cached:
+        try:
+            discovered, _ = await loop.run_in_executor(None, _discover_cluster_id, kubeconfig, api)
+        except (ValueError, ApiError, OSError) as e:
+            logger.info("Cluster ID revalidation failed, keeping cached ID %s (%s): %s", cluster_id, kubeconfig.source,
+                        e)
+            continue
+
+        cache.put(key, discovered)
+        if discovered != cluster_id:
+            logger.warning("Cluster ID of %s changed from %s to %s, restart the agent to register the new ID",
+                           kubeconfig.source, cluster_id, discovered)
+
+
+def _api_client(kubeconfig: Kubeconfig, kubeconfig_file: Path, proxy: bool = False) -> Optional[ApiClient]:
+
+    """Returns a client for the kubeconfig's API server or None if kubectl has to be used instead.
+
+    With ``proxy`` the client talks to a kubectl proxy the agent runs for the lifetime of the process.
+    """
+
+    if proxy:
+        client = ProxyApiClient(KubectlProxy(env=dict(os.environ, KUBECONFIG=kubeconfig.path)))
+        atexit.register(client.close)
+        return client
+
+    try:
+        return ApiClient.from_kubeconfig(kubeconfig)
+    except (ValueError, TypeError, OSError) as e:
+        logging.info("Kubernetes API client unavailable, using kubectl (%s): %s", kubeconfig_file, e)
+        return None
+
+
+async def _run_agent(controllers: EndpointPool,
+                     cluster_shutdown: bool,
+                     heartbeat: Heartbeat,
+                     backoff: Backoff,
+                     deflate: bool = True,
+                     compression_level: int = 6,
+                     compression_window_bits: int = 15,
+                     envelope: PayloadEnvelope = None,
+                     probe_interval: float = 30.0,
+                     parallelism: int = 4,
+                     node_timeout: float = None,
+                     budget: float = None,
+                     batch_size: int = None,
+                     dry_run: bool = False,
+                     action: str = "shutdown",
+                     readiness: bool = False,
+                     readiness_delay: float = 10.0):
+
+    global agent_id, agent_state, cluster_shutdown_enabled, current_session, release_action
+    global readiness_gate, readiness_max_delay
+    global shutdown_parallelism, shutdown_node_timeout, shutdown_budget, shutdown_batch_size, shutdown_dry_run
+    cluster_shutdown_enabled = cluster_shutdown
+    shutdown_parallelism = parallelism
+    shutdown_node_timeout = node_timeout
+    shutdown_budget = budget
+    shutdown_batch_size = batch_size
+    shutdown_dry_run = dry_run
+    release_action = action
+    readiness_gate = readiness
+    readiness_max_delay = readiness_delay
+    for cluster in clusters:
+        _probe_readiness(cluster)
+
+    announcer = Announcer()
+    traffic = TrafficCounter()
+    while True:
+        endpoint = await controllers.select()
+        controller_url = "{}?agent-id={}".format(endpoint.url, str(agent_id))
+        stats = CompressionStats()
+        extensions = deflate_extensions(stats, compression_level, compression_window_bits) if deflate else []
+        try:
+            async with websockets.connect(controller_url, compression=None, extensions=extensions) as websocket:
+                agent_state = AgentState.CONNECTED
+                logging.info("Agent is %s to %s, permessage-deflate %s",
+                             agent_state.value, endpoint.url, ("negotiated" if stats.deflate else "not negotiated"))
+                announcer.reset()
+                heartbeat.reset()
+
+                session = Session(
+                    websocket,
+                    HANDLERS,
+                    traffic,
+                    envelope=(None if stats.deflate else envelope),
+                    compression=stats
+                )
+                current_session = session
+                session.send(agent_sync_request())
+                _update_agent_state(session)
+                try:
+                    await session.run(
+                        _send_heartbeats(session, heartbeat, announcer, backoff),
+                        controllers.monitor(probe_interval)
                     )
-                else:
-                    logging.info("Cluster shutdown disabled")
+                finally:
+                    logging.info("Agent connection compression: %s", jsonify(stats.summary()))
+        except (OSError, asyncio.TimeoutError, ConnectionClosed, InvalidHandshake) as e:
+            agent_state = AgentState.RECONNECTING
+            if controllers.fail(endpoint):
+                logger.warning("Connection to controller %s lost (%s), failing over",
+                               endpoint.url, str(e) or type(e).__name__)
+                continue
+
+            delay = backoff.next_delay()
+            logger.warning("Connection to controller %s lost (%s), reconnecting in %.2fs",
+                           endpoint.url, str(e) or type(e).__name__, delay)
+            await asyncio.sleep(delay)
+            continue
+
+        logging.info("Agent traffic: %s", jsonify(traffic.summary()))
+        for probe in list(readiness_probes.values()):
+            probe.cancel()
+
+        if teardowns:
+            await asyncio.wait(list(teardowns.values()))
+
+        if cluster_shutdown and len(clusters) == 1:
+            logging.info("Cluster shutdown starting")
+            for cluster in clusters:
+                await _shutdown_cluster(cluster, reset_host=True)
+        elif not cluster_shutdown:
+            logging.info("Cluster shutdown disabled")
+
+        return
+
+
+async def _send_heartbeats(session: Session, heartbeat: Heartbeat, announcer: Announcer, backoff: Backoff):
+
+    """Queues a heartbeat (or a full snapshot when something changed) for every active cluster on every beat.
+
+    The first beat waits for the agent-sync-response so that restored claim state is what gets announced. Controllers
+    that do not implement the handshake are tolerated; after one interval the agent carries on with the state it holds
+    in memory. Only then is the reconnect backoff reset, so that a controller that accepts connections and drops them
+    straight away is retried less and less often.
+    """
+
+    try:
+        await asyncio.wait_for(session.synced.wait(), timeout=heartbeat.interval)
+    except asyncio.TimeoutError:
+        logger.warning("Agent sync response not received within %.1fs", heartbeat.interval)
+
+    backoff.reset()
+
+    while True:
+        await heartbeat.wait()
+        if heartbeat.drift > heartbeat.interval / 2:
+            logger.warning("Heartbeat is late by %.3fs", heartbeat.drift)
+
+        active = clusters.advertised()
+        if not active:
+            continue
+
+        message_type, data = announcer.next_frame(active)
+        session.send_encoded(message_type, data)
+        logger.info("Cluster %s queued, clusters: %d", message_type, len(active))
+
+
+def _on_agent_sync_response(session: Session, message: Dict[str, Any]):
+    forgotten = restore_from_sync(clusters, message)
+    logger.info("Agent sync received, clusters: %s, re-announcing: %s",
+                {c.cluster_id: c.state.value for c in clusters}, [c.cluster_id for c in forgotten])
+    session.synced.set()
+    for cluster in clusters:
+        _ensure_baseline(cluster)
+
+    _update_agent_state(session)
+
+
+def _on_clusters_snapshot(session: Session, message: Dict[str, Any]):
+    for cluster_id, detail in message["clusters"].items():
+        cluster = clusters.get(cluster_id)
+        if cluster is None:
+            logger.warning("Cluster snapshot received for unknown cluster: %s", cluster_id)
+            continue
+
+        logger.info("Cluster snapshot received, cluster: %s, state: %s", cluster_id, detail["status"])
+        _transition(cluster, detail["status"])
+
+    _update_agent_state(session)
+
+
+def _on_cluster_released(session: Session, message: Dict[str, Any]):
+    for cluster_id in cluster_ids(message):
+        cluster = clusters.get(cluster_id)
+        if cluster is None:
+            logger.warning("Cluster release received for unknown cluster: %s", cluster_id)
+            continue
+
+        logger.info("Cluster released, cluster: %s", cluster_id)
+        _transition(cluster, ClusterState.RELEASED)
+
+    _update_agent_state(session)
+
+
+def _transition(cluster: Cluster, state: Union[ClusterState, str]):
+    was_released = cluster.released
+    try:
+        cluster.state = state
+    except ValueError as e:
+        logger.warning("Cluster state change ignored, cluster: %s: %s", cluster.cluster_id, e)
+        return
+
+    _ensure_baseline(cluster)
+    if cluster.released and not was_released:
+        claimed_for = cluster.lifecycle.latency(ClusterState.CLAIMED, cluster.state)
+        logger.info("Cluster %s, cluster: %s, claimed for: %s, state timings: %s", cluster.state.value,
+                    cluster.cluster_id, "-" if claimed_for is None else "{:.3f}s".format(claimed_for),
+                    jsonify({k: round(v, 3) for k, v in cluster.lifecycle.timings().items()}))
+
+
+def _on_cluster_registration_response(session: Session, message: Dict[str, Any]):
+    for cluster_id, detail in message["clusters"].items():
+        logger.info("Cluster registration response received, cluster: %s, status: %s", cluster_id, detail["status"])
+
+
+HANDLERS = {
+    AGENT_SYNC_RESPONSE: _on_agent_sync_response,
+    CLUSTERS_SNAPSHOT: _on_clusters_snapshot,
+    CLUSTER_RELEASED: _on_cluster_released,
+    CLUSTER_REGISTRATION_RESPONSE: _on_cluster_registration_response,
+}
+
+
+def _update_agent_state(session: Session):
+
+    """Tears down released clusters and stops the session once every cluster has been released.
+
+    With the recycle release action a released cluster that has a baseline is recycled in the background first; only
+    if that fails is it torn down. A multi-cluster agent removes the nodes of each released cluster in the background
+    as soon as it is released. The host of a single-cluster agent is reset and powered off after the session ends.
+    """
+
+    global agent_state
+    for cluster in clusters:
+        if cluster.released and cluster.cluster_id in readiness_probes:
+            readiness_probes.pop(cluster.cluster_id).cancel()
+
+    if release_action == "recycle":
+        for cluster in clusters:
+            if cluster.released and cluster.baseline is not None and cluster.cluster_id not in recycles:
+                logging.info("Cluster recycle starting, cluster: %s", cluster.cluster_id)
+                recycles[cluster.cluster_id] = asyncio.ensure_future(_recycle_cluster(cluster))
+
+    if len(clusters) > 1 and cluster_shutdown_enabled:
+        for cluster in clusters:
+            if cluster.released and cluster.cluster_id not in teardowns and cluster.cluster_id not in recycles:
+                logging.info("Cluster shutdown starting, cluster: %s", cluster.cluster_id)
+                teardowns[cluster.cluster_id] = asyncio.ensure_future(_shutdown_cluster(cluster, reset_host=False))
+
+    if not clusters.active() and not recycles:
+        agent_state = AgentState.SHUTDOWN
+        session.stop()
+
+
+def _ensure_baseline(cluster: Cluster):
+    """Captures the baseline a cluster is recycled to when it is first seen unclaimed, i.e. before anyone used it."""
+    if release_action != "recycle" or cluster.state is not ClusterState.UNCLAIMED:
+        return
+
+    if cluster.baseline is None and cluster.cluster_id not in baseline_captures:
+        baseline_captures[cluster.cluster_id] = asyncio.ensure_future(_capture_baseline(cluster))
+
+
+async def _capture_baseline(cluster: Cluster):
+    try:
+        baseline = await Baseline.capture(kubectl_async, {"KUBECONFIG": cluster.kubeconfig.path})
+    except (ValueError, OSError) as e:
+        logger.warning("Cluster baseline capture failed, cluster: %s, it will be shut down when released: %s",
+                       cluster.cluster_id, e)
+        return
+    finally:
+        baseline_captures.pop(cluster.cluster_id, None)
+
+    # A cluster claimed while its baseline was being captured may already hold objects of its user.
+    if cluster.state is not ClusterState.UNCLAIMED:
+        logger.warning("Cluster baseline discarded, cluster: %s, state changed to %s during capture",
+                       cluster.cluster_id, cluster.state.value)
+        return
+
+    cluster.baseline = baseline
+    logger.info("Cluster baseline captured, cluster: %s, %s", cluster.cluster_id, baseline)
+
+
+async def _recycle_cluster(cluster: Cluster):
+    kubectl_handler = kubectl_async
+    if shutdown_dry_run:
+        # Nothing is deleted, so a cluster its user added anything to fails verification and is "shut down" instead.
+        kubectl_handler = DryRun(kubectl_handler=kubectl_async).kubectl
+
+    started = asyncio.get_event_loop().time()
+    try:
+        recycled = await cluster.recycle(kubectl_handler)
+    except ValueError as e:
+        logger.warning("Cluster recycle impossible, cluster: %s: %s", cluster.cluster_id, e)
+        recycled = False
+    finally:
+        recycles.pop(cluster.cluster_id, None)
+
+    if cluster.teardown is not None:
+        logging.info("Cluster recycle stages, cluster: %s\n%s", cluster.cluster_id, cluster.teardown.report())
+
+    if recycled:
+        logging.info("Cluster recycled, cluster: %s, took: %.2fs, registering again", cluster.cluster_id,
+                     asyncio.get_event_loop().time() - started)
+        _probe_readiness(cluster)
+    else:
+        # Without a baseline the cluster is not recycled again but shut down like any other released cluster.
+        logger.warning("Cluster recycle failed, cluster: %s, shutting it down instead", cluster.cluster_id)
+        cluster.baseline = None
+
+    if current_session is not None and not current_session.stopped:
+        _update_agent_state(current_session)
+
+
+def _probe_readiness(cluster: Cluster):
+    """Hides a cluster from the controller until a ReadinessProbe finds it ready, if the readiness gate is enabled."""
+    if readiness_gate and cluster.cluster_id not in readiness_probes:
+        cluster.ready = False
+        readiness_probes[cluster.cluster_id] = asyncio.ensure_future(_await_readiness(cluster))
+
+
+async def _await_readiness(cluster: Cluster):
+    probe = ReadinessProbe(
+        cluster.cluster_id,
+        kubectl_async,
+        {"KUBECONFIG": cluster.kubeconfig.path},
+        api=cluster.api,
+        backoff=Backoff(base=0.5, cap=max(0.5, readiness_max_delay))
+    )
+
+    try:
+        await probe.wait()
+    finally:
+        readiness_probes.pop(cluster.cluster_id, None)
+
+    cluster.ready = True
+    logging.info("Cluster readiness: %s", jsonify({
+        "cluster": cluster.cluster_id, "timeToReady": round(probe.time_to_ready, 3), "polls": probe.polls
+    }))
+
+
+async def _shutdown_cluster(cluster: Cluster, reset_host: bool):
+    handlers = (kubectl_async, kubeadm_async, system_async)
+    api = None
+    if shutdown_dry_run:
+        # Listing the nodes is harmless so the plan is made with the cluster's real nodes.
+        dry_run = DryRun(kubectl_handler=kubectl_async, api=cluster.api)
+        handlers = (dry_run.kubectl, dry_run.kubeadm, dry_run.system)
+        api = dry_run.api
+
+    started = asyncio.get_event_loop().time()
+    results = await cluster.shutdown(
+        kubectl_handler=handlers[0],
+        kubeadm_handler=handlers[1],
+        system_handler=handlers[2],
+        reset_host=reset_host,
+        parallelism=shutdown_parallelism,
+        node_timeout=shutdown_node_timeout,
+        budget=shutdown_budget,
+        batch_size=shutdown_batch_size,
+        api=api
+    )
+
+    failed = [r for r in results if not r.ok]
+    logging.info("Cluster shutdown finished, cluster: %s, nodes: %d, failed: %d, took: %.2fs",
+                 cluster.cluster_id, len(results), len(failed), asyncio.get_event_loop().time() - started)
+    for result in failed:
+        logger.warning("Node teardown failed, cluster: %s, node: %s, error: %s",
+                       cluster.cluster_id, result.name, result.error)
 
-                return
-            else:
-                sleep(5)
+    logging.info("Cluster shutdown stages, cluster: %s\n%s", cluster.cluster_id, cluster.teardown.report())
 
 
 def ensure_data_dir_exists(data_dir: Path) -> Path:
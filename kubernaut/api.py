@@ -0,0 +1,241 @@
+import http.client
+import json
+import queue
+import ssl
+
+from kubernaut.kubeconfig import Kubeconfig, _materialize, section_data
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urlparse
+
+
+class ApiError(Exception):
+
+    """Raised when the Kubernetes API server answers with a non-2xx status."""
+
+    def __init__(self, status: int, reason: str, body: str = ""):
+        super().__init__("Kubernetes API request failed 'status = {} {}'".format(status, reason))
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+class Credentials:
+
+    """The parts of a kubeconfig needed to talk to the API server of its current context.
+
+    PEM data is held in memory, either decoded from the ``*-data`` fields or read from the referenced files.
+    """
+
+    def __init__(self,
+                 server: str,
+                 ca_data: Optional[bytes] = None,
+                 client_cert_data: Optional[bytes] = None,
+                 client_key_data: Optional[bytes] = None,
+                 token: Optional[str] = None,
+                 insecure: bool = False):
+
+        self.server = server
+        self.ca_data = ca_data
+        self.client_cert_data = client_cert_data
+        self.client_key_data = client_key_data
+        self.token = token
+        self.insecure = insecure
+
+
+def load_credentials(kubeconfig: Union[Kubeconfig, str], context: str = None) -> Credentials:
+
+    """Extracts the API server address and credentials from a kubeconfig.
+
+    :argument kubeconfig the kubeconfig.
+    :argument context the context to use, by default the kubeconfig's current-context.
+
+    :return: the credentials of the context's cluster and user.
+    """
+
+    if not isinstance(kubeconfig, Kubeconfig):
+        kubeconfig = Kubeconfig(kubeconfig)
+
+    cluster = kubeconfig.cluster(context)
+    user = kubeconfig.user(context)
+
+    token = user.get("token")
+    if not token and user.get("tokenFile"):
+        with open(user["tokenFile"]) as f:
+            token = f.read().strip()
+
+    return Credentials(
+        server=kubeconfig.server(context),
+        ca_data=section_data(cluster, "certificate-authority"),
+        client_cert_data=section_data(user, "client-certificate"),
+        client_key_data=section_data(user, "client-key"),
+        token=token,
+        insecure=bool(cluster.get("insecure-skip-tls-verify"))
+    )
+
+
+def _ssl_context(credentials: Credentials) -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    if credentials.ca_data:
+        context.load_verify_locations(cadata=credentials.ca_data.decode("ascii"))
+
+    if credentials.insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    if credentials.client_cert_data and credentials.client_key_data:
+        # The ssl module can only load a certificate chain from files. Like kubeconfigs they are kept in memory rather
+        # than on disk, and removed as soon as they are loaded.
+        (cert_file, remove_cert) = _materialize(credentials.client_cert_data, "client-cert")
+        try:
+            (key_file, remove_key) = _materialize(credentials.client_key_data, "client-key")
+            try:
+                context.load_cert_chain(cert_file, key_file)
+            finally:
+                remove_key()
+        finally:
+            remove_cert()
+
+    return context
+
+
+class ApiClient:
+
+    """A minimal Kubernetes API client that keeps connections to the API server alive between requests.
+
+    The client is safe to share between threads, e.g. when called through ``loop.run_in_executor``. Each request
+    borrows a connection from a pool of at most ``pool_size`` idle connections, so consecutive reads reuse an already
+    negotiated TLS session instead of paying for a new process, kubeconfig parse and handshake as kubectl does.
+
+    :argument credentials where the API server is and how to authenticate with it.
+    :argument pool_size the maximum number of idle connections kept open.
+    :argument timeout the socket timeout in seconds for each request.
+    """
+
+    def __init__(self, credentials: Credentials, pool_size: int = 4, timeout: float = 10.0):
+        server = urlparse(credentials.server)
+        self.credentials = credentials
+        self.host = server.hostname
+        self.port = server.port
+        self.secure = server.scheme == "https"
+        self.base_path = server.path.rstrip("/")
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._ssl_context = _ssl_context(credentials) if self.secure else None
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    @classmethod
+    def from_kubeconfig(cls, kubeconfig: Union[Kubeconfig, str], context: str = None, **kwargs) -> "ApiClient":
+        return cls(load_credentials(kubeconfig, context), **kwargs)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.connections_opened += 1
+        if self.secure:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._ssl_context)
+
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _borrow(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, connection: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def request(self, method: str, path: str, body: Dict[str, Any] = None) -> Dict[str, Any]:
+
+        """Sends a request and decodes the JSON response.
+
+        A request on a pooled connection that the server has since closed is retried once on a new connection.
+
+        :argument method the HTTP method.
+        :argument path the API path, e.g. /api/v1/nodes.
+        :argument body an optional JSON request body.
+
+        :return: the decoded response body.
+        """
+
+        data = self._send(method, path, body)
+        return json.loads(data.decode("utf-8")) if data else {}
+
+    def _send(self, method: str, path: str, body: Dict[str, Any] = None, accept: str = "application/json") -> bytes:
+        headers = {"Accept": accept}
+        if self.credentials.token:
+            headers["Authorization"] = "Bearer {}".format(self.credentials.token)
+
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            connection = self._borrow()
+            try:
+                connection.request(method, self.base_path + path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionError):
+                # If the server dropped one idle connection it has most likely dropped them all.
+                connection.close()
+                self._discard_idle()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+
+            if not 200 <= response.status < 300:
+                raise ApiError(response.status, response.reason, data.decode("utf-8", "replace"))
+
+            return data
+
+    def get(self, path: str) -> Dict[str, Any]:
+        return self.request("GET", path)
+
+    def delete(self, path: str) -> Dict[str, Any]:
+        return self.request("DELETE", path)
+
+    def get_namespace(self, name: str) -> Dict[str, Any]:
+        return self.get("/api/v1/namespaces/{}".format(name))
+
+    def list_nodes(self) -> Dict[str, Any]:
+        return self.get("/api/v1/nodes")
+
+    def list_pods(self, namespace: str) -> Dict[str, Any]:
+        return self.get("/api/v1/namespaces/{}/pods".format(namespace))
+
+    def health(self) -> str:
+
+        """Asks the API server whether it is ready to serve requests.
+
+        :return: the body of /readyz, or of /healthz if the API server predates /readyz (Kubernetes 1.16).
+        :raises ApiError: if the API server is not ready.
+        """
+
+        try:
+            return self._send("GET", "/readyz", accept="text/plain").decode("utf-8", "replace")
+        except ApiError as e:
+            if e.status != 404:
+                raise
+
+        return self._send("GET", "/healthz", accept="text/plain").decode("utf-8", "replace")
+
+    def _discard_idle(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def close(self):
+        self._discard_idle()
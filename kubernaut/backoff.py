@@ -0,0 +1,35 @@
+import random
+
+
+class Backoff:
+
+    """Exponential backoff with jitter and an upper bound.
+
+    The nth delay is drawn uniformly from the upper half of ``min(cap, base * factor ** n)`` which keeps retries spread
+    out across a fleet of agents while guaranteeing the delay still grows between attempts.
+
+    :argument base the delay in seconds before the first retry.
+    :argument factor the multiplier applied to the delay after each failed attempt.
+    :argument cap the maximum delay in seconds.
+    :argument rng a random number source, replaceable for tests.
+    """
+
+    def __init__(self, base: float = 0.25, factor: float = 2.0, cap: float = 30.0, rng: random.Random = None):
+        if base <= 0 or factor < 1 or cap < base:
+            raise ValueError("Backoff requires base > 0, factor >= 1 and cap >= base")
+
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.rng = rng or random.Random()
+        self.attempts = 0
+
+    def reset(self):
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.cap, self.base * (self.factor ** self.attempts))
+        if ceiling < self.cap:
+            self.attempts += 1
+
+        return self.rng.uniform(ceiling / 2, ceiling)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from kubernaut.kubeconfig import Kubeconfig, section_data
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+def cluster_key(kubeconfig: Kubeconfig) -> Optional[str]:
+
+    """Identifies the cluster a kubeconfig points at without contacting it.
+
+    The key is a hash of the API server URL and the certificate authority of the current context. Kubeconfigs for the
+    same cluster but different users share a key, while a cluster reinstalled at the same address gets a new CA and so a
+    new key.
+
+    :return: the key or None if the kubeconfig cannot be parsed.
+    """
+
+    try:
+        server = kubeconfig.server()
+        ca_data = section_data(kubeconfig.cluster(), "certificate-authority")
+    except (ValueError, OSError):
+        return None
+
+    digest = hashlib.sha256(server.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(ca_data or b"")
+    return digest.hexdigest()
+
+
+class ClusterIdCache:
+
+    """Remembers discovered cluster IDs between agent restarts.
+
+    The cache is a small JSON document in the agent data directory. It is rewritten atomically on every change so a
+    crash never leaves a partially written file behind; an unreadable file is treated as empty.
+
+    :argument path the file the cache is stored in.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            entries = json.loads(self.path.read_text(encoding="UTF-8"))
+        except (OSError, ValueError):
+            return {}
+
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        entry = self._entries.get(key) if key else None
+        return entry.get("cluster_id") if isinstance(entry, dict) else None
+
+    def put(self, key: Optional[str], cluster_id: str):
+        if not key:
+            return
+
+        self._entries[key] = {"cluster_id": cluster_id, "verified_at": int(time.time())}
+        self._save()
+
+    def _save(self):
+        fd, tmp = tempfile.mkstemp(dir=str(self.path.parent), prefix=".cluster-ids-")
+        try:
+            with os.fdopen(fd, "w", encoding="UTF-8") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+
+            os.replace(tmp, str(self.path))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,140 @@
+import base64
+import zlib
+
+from typing import Any, Dict, List
+
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+
+COMPRESSED_PAYLOAD = "compressed-payload"
+
+# Text, binary and continuation frames. Control frames (ping, pong, close) are never compressed and are not counted.
+_MAX_DATA_OPCODE = 0x2
+
+
+class CompressionStats:
+
+    """Uncompressed and on-the-wire payload byte counts for a single controller connection.
+
+    Whichever compression layer is in effect records into the stats: the permessage-deflate extension when the
+    controller negotiated it, otherwise the session (with or without the compressed-payload envelope).
+    """
+
+    def __init__(self):
+        self.deflate = False
+        self.uncompressed_sent = 0
+        self.compressed_sent = 0
+        self.uncompressed_received = 0
+        self.compressed_received = 0
+
+    def record_sent(self, uncompressed: int, compressed: int):
+        self.uncompressed_sent += uncompressed
+        self.compressed_sent += compressed
+
+    def record_received(self, uncompressed: int, compressed: int):
+        self.uncompressed_received += uncompressed
+        self.compressed_received += compressed
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "permessage-deflate": self.deflate,
+            "sent": {"uncompressed": self.uncompressed_sent, "compressed": self.compressed_sent},
+            "received": {"uncompressed": self.uncompressed_received, "compressed": self.compressed_received},
+        }
+
+
+class _CountingExtension:
+
+    """Wraps a negotiated extension to record frame payload sizes either side of it."""
+
+    def __init__(self, extension, stats: CompressionStats):
+        self.extension = extension
+        self.name = extension.name
+        self.stats = stats
+
+    def encode(self, frame):
+        encoded = self.extension.encode(frame)
+        if frame.opcode <= _MAX_DATA_OPCODE:
+            self.stats.record_sent(len(frame.data), len(encoded.data))
+
+        return encoded
+
+    def decode(self, frame, *args, **kwargs):
+        decoded = self.extension.decode(frame, *args, **kwargs)
+        if frame.opcode <= _MAX_DATA_OPCODE:
+            self.stats.record_received(len(decoded.data), len(frame.data))
+
+        return decoded
+
+    def __repr__(self):
+        return repr(self.extension)
+
+
+class CountingPerMessageDeflateFactory(ClientPerMessageDeflateFactory):
+
+    """Offers permessage-deflate and records compressed and uncompressed sizes when the controller accepts it."""
+
+    def __init__(self, stats: CompressionStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        self.stats.deflate = True
+        return _CountingExtension(extension, self.stats)
+
+
+def deflate_extensions(stats: CompressionStats, level: int = 6, window_bits: int = 15) -> List:
+
+    """Returns the client extensions offering permessage-deflate with the given settings.
+
+    :argument stats where to record compressed and uncompressed byte counts if the extension is negotiated.
+    :argument level the zlib compression level (1 - 9).
+    :argument window_bits the base two logarithm of the compression window (9 - 15). A smaller window trades
+                          compression ratio for less memory per connection and is requested of the controller too.
+    """
+
+    if not 1 <= level <= 9:
+        raise ValueError("Compression level must be between 1 and 9")
+
+    if not 9 <= window_bits <= 15:
+        raise ValueError("Compression window bits must be between 9 and 15")
+
+    return [CountingPerMessageDeflateFactory(
+        stats,
+        client_max_window_bits=window_bits,
+        server_max_window_bits=window_bits if window_bits < 15 else None,
+        compress_settings={"level": level}
+    )]
+
+
+class PayloadEnvelope:
+
+    """Wraps large frames in a compressed-payload message for controllers that do not negotiate permessage-deflate.
+
+    Frames smaller than the threshold, or that would not get any smaller, are sent as they are.
+
+    :argument level the zlib compression level (1 - 9).
+    :argument threshold the size in bytes below which frames are not compressed.
+    """
+
+    def __init__(self, level: int = 6, threshold: int = 1024):
+        self.level = level
+        self.threshold = threshold
+
+    def wrap(self, data: bytes) -> bytes:
+        if len(data) < self.threshold:
+            return data
+
+        payload = base64.b64encode(zlib.compress(data, self.level))
+        wrapped = b'{"@type":"' + COMPRESSED_PAYLOAD.encode("utf-8") + b'","encoding":"deflate","payload":"' + \
+                  payload + b'"}'
+
+        return wrapped if len(wrapped) < len(data) else data
+
+
+def unwrap_payload(message: Dict[str, Any]) -> bytes:
+    """Returns the original frame carried by a compressed-payload message."""
+    if message.get("encoding") != "deflate":
+        raise ValueError("Unsupported compressed-payload encoding: {}".format(message.get("encoding")))
+
+    return zlib.decompress(base64.b64decode(message["payload"]))
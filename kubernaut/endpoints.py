@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import websockets
+
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger("endpoints")
+
+DEFAULT_PORTS = {"ws": 80, "wss": 443}
+
+
+class Endpoint:
+
+    """A controller URL and what the agent has observed about it.
+
+    :argument url the websocket URL of the controller.
+    """
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        if parsed.scheme not in DEFAULT_PORTS or not parsed.hostname:
+            raise ValueError("Invalid controller address: {}".format(url))
+
+        self.url = url
+        self.host = parsed.hostname
+        self.port = parsed.port or DEFAULT_PORTS[parsed.scheme]
+        self.secure = parsed.scheme == "wss"
+        self.healthy = True
+        self.rtt: Optional[float] = None
+        self.failures = 0
+
+    def record_probe(self, rtt: Optional[float], smoothing: float = 0.3):
+        """Records a probe result, None meaning the probe failed. Round-trip times are exponentially smoothed."""
+        if rtt is None:
+            self.record_failure()
+            return
+
+        self.healthy = True
+        self.rtt = rtt if self.rtt is None else (1 - smoothing) * self.rtt + smoothing * rtt
+
+    def record_failure(self):
+        self.healthy = False
+        self.failures += 1
+
+    def __repr__(self):
+        return "Endpoint({}, healthy={}, rtt={})".format(self.url, self.healthy, self.rtt)
+
+
+Probe = Callable[[Endpoint, float], Awaitable[Optional[float]]]
+
+
+async def probe_endpoint(endpoint: Endpoint, timeout: float) -> Optional[float]:
+
+    """Opens a websocket to an endpoint, as the agent does, and measures the round trip of a ping over it.
+
+    Completing the websocket handshake means the controller sees an ordinary connection open and close rather than a
+    malformed request, and the ping is answered by the controller itself, so the round-trip time includes how busy it
+    is and not only the network path to it.
+
+    :return: the round-trip time in seconds or None if the endpoint did not answer within the timeout.
+    """
+
+    loop = asyncio.get_event_loop()
+    websocket = None
+    try:
+        websocket = await asyncio.wait_for(
+            websockets.connect(endpoint.url, compression=None, ping_interval=None, close_timeout=timeout),
+            timeout=timeout
+        )
+        started = loop.time()
+        await asyncio.wait_for(await websocket.ping(), timeout=timeout)
+        return loop.time() - started
+    except (OSError, asyncio.TimeoutError, ConnectionClosed, InvalidHandshake) as e:
+        logger.debug("Probe of %s failed: %s", endpoint.url, str(e) or type(e).__name__)
+        return None
+    finally:
+        if websocket is not None:
+            await websocket.close()
+
+
+class EndpointPool:
+
+    """Selects the fastest healthy controller endpoint and fails over between them.
+
+    :argument urls the controller websocket URLs in order of preference.
+    :argument probe_timeout seconds to wait for an endpoint to answer a probe.
+    :argument probe the probe used to measure an endpoint, replaceable for tests.
+    """
+
+    def __init__(self, urls: List[str], probe_timeout: float = 2.0, probe: Probe = probe_endpoint):
+        if not urls:
+            raise ValueError("At least one controller address is required")
+
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.probe_timeout = probe_timeout
+        self.probe = probe
+        self.current: Optional[Endpoint] = None
+
+    async def probe_all(self):
+        """Probes every endpoint concurrently."""
+        results = await asyncio.gather(*[self.probe(e, self.probe_timeout) for e in self.endpoints])
+        for endpoint, rtt in zip(self.endpoints, results):
+            endpoint.record_probe(rtt)
+
+    def best(self) -> Optional[Endpoint]:
+        """Returns the healthy endpoint with the lowest round-trip time, preferring earlier URLs on a tie."""
+        healthy = [e for e in self.endpoints if e.healthy]
+        if not healthy:
+            return None
+
+        return min(healthy, key=lambda e: float("inf") if e.rtt is None else e.rtt)
+
+    async def select(self) -> Endpoint:
+
+        """Picks the endpoint to connect to next.
+
+        If no endpoint is known to be healthy, or none has been measured yet, every endpoint is probed first. If none
+        answer, the endpoints are taken in turn so the caller keeps retrying (with its own backoff) across all of them.
+        """
+
+        endpoint = self.best()
+        if endpoint is None or endpoint.rtt is None:
+            await self.probe_all()
+            endpoint = self.best() or self._next_in_turn()
+
+        self.current = endpoint
+        return endpoint
+
+    def _next_in_turn(self) -> Endpoint:
+        if self.current is None:
+            return self.endpoints[0]
+
+        return self.endpoints[(self.endpoints.index(self.current) + 1) % len(self.endpoints)]
+
+    def fail(self, endpoint: Endpoint) -> bool:
+        """Marks an endpoint failed. Returns True if another endpoint is still believed healthy to fail over to."""
+        endpoint.record_failure()
+        return self.best() is not None
+
+    async def monitor(self, interval: float):
+        """Re-probes every endpoint periodically so failover decisions use fresh round-trip times."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.probe_all()
+            logger.debug("Controller endpoints: %s", self.endpoints)
@@ -0,0 +1,74 @@
+import asyncio
+import random
+import time
+
+from typing import Callable
+
+
+class Heartbeat:
+
+    """Paces periodic work on the event loop without blocking it.
+
+    Beats are scheduled against a fixed timeline (``start + n * interval``) rather than relative to the end of the
+    previous beat, so the time spent sending a snapshot or waiting on the controller does not accumulate as drift. Each
+    beat is offset by a bounded random jitter so a fleet of agents started at the same moment does not beat in lockstep.
+
+    :argument interval the nominal number of seconds between beats.
+    :argument jitter the maximum random offset applied to a beat as a fraction of interval (0.0 - 0.5).
+    :argument clock a monotonic clock, replaceable for tests.
+    :argument rng a random number source, replaceable for tests.
+    """
+
+    def __init__(self,
+                 interval: float = 5.0,
+                 jitter: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic,
+                 rng: random.Random = None):
+
+        if interval <= 0:
+            raise ValueError("Heartbeat interval must be greater than zero")
+
+        if not 0.0 <= jitter <= 0.5:
+            raise ValueError("Heartbeat jitter must be between 0.0 and 0.5")
+
+        self.interval = interval
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng or random.Random()
+
+        self.beats = 0
+        self.skipped = 0
+        self.drift = 0.0
+        self._next = None
+
+    def reset(self):
+        """Restarts the timeline so the next call to wait() returns immediately."""
+        self._next = None
+
+    def delay(self) -> float:
+        """Returns the number of seconds until the next beat is due and advances the timeline."""
+        now = self.clock()
+        if self._next is None:
+            self._next = now
+            return 0.0
+
+        self._next += self.interval
+        if self._next < now:
+            # We fell more than a full interval behind (e.g. the loop was starved). Skip the missed beats instead of
+            # firing them back to back.
+            missed = int((now - self._next) // self.interval) + 1
+            self.skipped += missed
+            self._next += missed * self.interval
+
+        offset = self.rng.uniform(-self.jitter, self.jitter) * self.interval
+        return max(0.0, self._next + offset - now)
+
+    async def wait(self):
+        """Sleeps until the next beat is due, recording how late the wakeup was as drift."""
+        delay = self.delay()
+        target = self.clock() + delay
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self.drift = self.clock() - target
+        self.beats += 1
@@ -0,0 +1,241 @@
+import atexit
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import yaml
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# Memory backed directories a kubeconfig is written to when the platform has no memfd_create.
+TMPFS_DIRECTORIES = ["/dev/shm", "/run/user/{uid}"]
+
+# Fields of kubeconfig clusters and users that name other files, which kubectl resolves relative to the kubeconfig.
+_FILE_FIELDS = ["certificate-authority", "client-certificate", "client-key", "tokenFile"]
+
+_removers: List[Callable[[], None]] = []
+_removers_lock = threading.Lock()
+
+
+class Kubeconfig:
+
+    """A kubeconfig document.
+
+    The document is kept exactly as it was read so it can be forwarded to the controller or handed to kubectl without
+    being re-serialized. It is only parsed the first time its contents are needed, after which contexts, clusters and
+    users are indexed by name.
+
+    Tools are pointed at the document through ``path``, a single file per document shared by every kubectl and kubeadm
+    invocation for the life of the process.
+
+    :argument raw the document, as bytes or text.
+    :argument source the file the document was read from, if any.
+    """
+
+    def __init__(self, raw: Union[bytes, str], source: Path = None):
+        self.raw = raw.encode("utf-8") if isinstance(raw, str) else bytes(raw)
+        self.source = source
+        self._text: Optional[str] = raw if isinstance(raw, str) else None
+        self._fingerprint: Optional[str] = None
+        self._document: Optional[Dict[str, Any]] = None
+        self._index: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def read(cls, path: Path) -> "Kubeconfig":
+        return cls(Path(path).read_bytes(), source=Path(path))
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.raw.decode("utf-8")
+
+        return self._text
+
+    @property
+    def fingerprint(self) -> str:
+        """A SHA-256 of the document. Identical files have identical fingerprints wherever they were read from."""
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(self.raw).hexdigest()
+
+        return self._fingerprint
+
+    @property
+    def document(self) -> Dict[str, Any]:
+
+        """The parsed document.
+
+        :return: the document as a mapping.
+        :raises ValueError: if the document is not a YAML mapping.
+        """
+
+        if self._document is None:
+            try:
+                document = yaml.safe_load(self.raw) or {}
+            except yaml.YAMLError as e:
+                raise ValueError("Kubeconfig is not valid YAML: {}".format(e))
+
+            if not isinstance(document, dict):
+                raise ValueError("Kubeconfig is not a YAML mapping")
+
+            self._document = document
+
+        return self._document
+
+    def _named(self, kind: str) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            self._index = {}
+            for plural, singular in [("contexts", "context"), ("clusters", "cluster"), ("users", "user")]:
+                self._index[plural] = {e["name"]: e.get(singular) or {}
+                                       for e in self.document.get(plural) or [] if isinstance(e, dict) and "name" in e}
+
+        return self._index[kind]
+
+    @property
+    def contexts(self) -> Dict[str, Dict[str, Any]]:
+        return self._named("contexts")
+
+    @property
+    def clusters(self) -> Dict[str, Dict[str, Any]]:
+        return self._named("clusters")
+
+    @property
+    def users(self) -> Dict[str, Dict[str, Any]]:
+        return self._named("users")
+
+    @property
+    def current_context(self) -> Optional[str]:
+        return self.document.get("current-context")
+
+    def context(self, name: str = None) -> Dict[str, Any]:
+        """Returns the named context, by default the current context."""
+        return _lookup(self.contexts, name or self.current_context, "context")
+
+    def cluster(self, context: str = None) -> Dict[str, Any]:
+        """Returns the cluster of the named context, by default the current context."""
+        return _lookup(self.clusters, self.context(context).get("cluster"), "cluster")
+
+    def user(self, context: str = None) -> Dict[str, Any]:
+        """Returns the user of the named context, by default the current context, or an empty user if it has none."""
+        name = self.context(context).get("user")
+        return _lookup(self.users, name, "user") if name else {}
+
+    def server(self, context: str = None) -> str:
+        cluster = self.cluster(context)
+        if not cluster.get("server"):
+            raise ValueError("Kubeconfig cluster has no server")
+
+        return cluster["server"]
+
+    @property
+    def path(self) -> str:
+
+        """A file holding the document, suitable for $KUBECONFIG.
+
+        The file is written the first time it is needed and reused afterwards. It lives in memory, as a memfd opened
+        through /proc or in a tmpfs, so credentials do not reach persistent storage, and it is removed when the process
+        exits. A document read from a file that refers to other files by relative paths is used in place instead,
+        since those paths would not resolve against a copy.
+
+        :return: the path of the file.
+        """
+
+        with self._lock:
+            if self._path is None:
+                if self.source is not None and self._refers_to_relative_files():
+                    self._path = str(Path(self.source).resolve())
+                else:
+                    self._path, remove = _materialize(self.raw)
+                    with _removers_lock:
+                        _removers.append(remove)
+
+            return self._path
+
+    def _refers_to_relative_files(self) -> bool:
+        try:
+            sections = list(self.clusters.values()) + list(self.users.values())
+        except ValueError:
+            return False
+
+        return any(isinstance(s.get(f), str) and not os.path.isabs(s[f]) for s in sections for f in _FILE_FIELDS)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Kubeconfig) and self.raw == other.raw
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    def __repr__(self):
+        return "Kubeconfig({}, fingerprint={})".format(self.source or "<memory>", self.fingerprint[:12])
+
+
+def _lookup(entries: Dict[str, Dict[str, Any]], name: str, kind: str) -> Dict[str, Any]:
+    if name not in entries:
+        raise ValueError("Kubeconfig has no {} named '{}'".format(kind, name))
+
+    return entries[name]
+
+
+def section_data(section: Dict[str, Any], field: str) -> Optional[bytes]:
+    """Returns PEM data given inline as ``<field>-data`` or by reference to a file as ``<field>``, if either is set."""
+    if section.get(field + "-data"):
+        return base64.b64decode(section[field + "-data"])
+
+    if section.get(field):
+        with open(section[field], "rb") as f:
+            return f.read()
+
+    return None
+
+
+def _materialize(raw: bytes, name: str = "kubeconfig") -> Tuple[str, Callable[[], None]]:
+
+    """Writes a document, e.g. a kubeconfig or a client key, to a file kept in memory if the platform allows it.
+
+    A memfd is preferred. Other processes open it through /proc/<pid>/fd, which keeps working after the descriptor is
+    closed on exec. Without memfd_create, e.g. before Python 3.8, the file is created in the first writable tmpfs of
+    TMPFS_DIRECTORIES and only as a last resort in the default temporary directory. In every case only the agent's
+    user can read it.
+
+    :argument name what the document is, naming the file.
+    :return: the path of the file and a function that removes it.
+    """
+
+    if hasattr(os, "memfd_create"):
+        try:
+            fd = os.memfd_create(name)
+        except OSError:
+            fd = None
+
+        if fd is not None:
+            with open(fd, "wb", closefd=False) as f:
+                f.write(raw)
+
+            return "/proc/{}/fd/{}".format(os.getpid(), fd), lambda: os.close(fd)
+
+    directories = [d.format(uid=os.getuid()) for d in TMPFS_DIRECTORIES]
+    directory = next((d for d in directories if os.path.isdir(d) and os.access(d, os.W_OK)), None)
+    fd, path = tempfile.mkstemp(prefix="{}-".format(name), dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(raw)
+
+    def remove():
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    return path, remove
+
+
+def remove_materialized():
+    """Removes every kubeconfig file written for ``Kubeconfig.path``."""
+    with _removers_lock:
+        while _removers:
+            _removers.pop()()
+
+
+atexit.register(remove_materialized)
@@ -1,16 +1,43 @@
+import asyncio
+import codecs
 import json
 import os
+import signal
+import threading
+import time
 
+from collections import deque
+from kubernaut.api import ApiClient
+from kubernaut.kubeconfig import Kubeconfig
 from pathlib import Path
-from subprocess import run, STDOUT, PIPE
-from typing import List, Mapping, Tuple
+from subprocess import Popen, STDOUT, PIPE
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
 
 
 BIN_PATHS = ["/bin", "/usr/bin", "/usr/local/bin", os.path.expanduser("~/bin")]
 
+# Environment variables that override where a tool is found. The value may be a path or a program name to search for.
+TOOL_OVERRIDES = {
+    "kubectl": "KUBERNAUT_KUBECTL",
+    "kubeadm": "KUBERNAUT_KUBEADM",
+}
+
+_resolved_tools: Dict[Tuple[str, str], str] = {}
+
+# The most output, in characters, retained from a single tool invocation. Older lines are discarded first.
+MAX_OUTPUT = 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def search_paths() -> List[str]:
+    """Returns the directories in $PATH followed by any of BIN_PATHS that $PATH does not already contain."""
+    paths = [p for p in os.getenv("PATH", "").split(os.pathsep) if p]
+    return paths + [p for p in BIN_PATHS if p not in paths]
+
 
 def which(program: str, search: List[str] = None) -> str:
-    for p in search:
+    for p in (search if search is not None else search_paths()):
         p = Path(p)
         p = p / program
         if p.is_file() and os.access(str(p), os.X_OK):
@@ -19,11 +46,70 @@ def which(program: str, search: List[str] = None) -> str:
     raise ValueError("Unable to find `{}` program on system".format(program))
 
 
-def read_kubeconfig(kubeconfig_file: Path) -> str:
-    return kubeconfig_file.read_text(encoding="UTF-8")
+def resolve_tool(program: str) -> str:
+
+    """Resolves the path of a tool such as kubectl, remembering the answer.
+
+    The first lookup honors the tool's override variable (see TOOL_OVERRIDES) and otherwise searches $PATH and
+    BIN_PATHS. Later lookups are answered from memory without touching the filesystem until the tool is invalidated,
+    which happens automatically when running the remembered path fails with ENOENT.
+
+    :argument program the name of the tool.
+
+    :return: the path of the tool.
+    """
+
+    override = os.getenv(TOOL_OVERRIDES.get(program, ""), "")
+    key = (program, override)
+    path = _resolved_tools.get(key)
+    if path is None:
+        if override and os.sep in override:
+            path = override
+        else:
+            path = which(override or program)
+
+        _resolved_tools[key] = path
+
+    return path
+
+
+def invalidate_tool(program: str = None):
+    """Forgets the resolved path of a tool, or of every tool if no program is given."""
+    for key in list(_resolved_tools):
+        if program is None or key[0] == program:
+            del _resolved_tools[key]
 
 
-def discover_cluster_id(namespace: str = "kube-system", kubeconfig: Path = (Path.home() / ".kube" / "config")) -> str:
+def read_kubeconfig(kubeconfig_file: Path) -> Kubeconfig:
+    return Kubeconfig.read(kubeconfig_file)
+
+
+def find_kubeconfigs(paths: List[Path]) -> List[Path]:
+
+    """Expands a list of kubeconfig files and directories of kubeconfig files.
+
+    Directories are not searched recursively and hidden files within them are ignored.
+
+    :argument paths kubeconfig files or directories containing kubeconfig files.
+
+    :return: the kubeconfig files in the order given with each directory's files sorted by name.
+    """
+
+    found = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            found.extend(sorted(f for f in p.iterdir() if f.is_file() and not f.name.startswith(".")))
+        else:
+            found.append(p)
+
+    return found
+
+
+def discover_cluster_id(namespace: str = "kube-system",
+                        kubeconfig: Path = None,
+                        client: ApiClient = None,
+                        timeout: float = 60.0) -> str:
 
     """Gets a Kubernetes cluster ID.
 
@@ -32,33 +118,374 @@ def discover_cluster_id(namespace: str = "kube-system", kubeconfig: Path = (Path
     the canonical ID. Selection of the namespace is important however.
 
     :argument namespace the namespace to retrieve the UID from.
-    :argument kubeconfig the path to the kubeconfig file to use.
+    :argument kubeconfig the path to the kubeconfig file to use. If not given then $KUBECONFIG or ~/.kube/config.
+    :argument client an API client for the cluster. If given the namespace is read from the API server directly
+                     instead of running kubectl.
+    :argument timeout seconds to wait for kubectl before giving up.
 
     :return: the given namespaces UID acting as cluster ID.
     """
 
+    if client is not None:
+        return client.get_namespace(namespace)["metadata"]["uid"]
+
     env_kubectl = {}
-    if os.getenv("KUBECONFIG"):
+    if kubeconfig is not None:
+        env_kubectl = {"KUBECONFIG": os.path.expanduser(str(kubeconfig))}
+    elif os.getenv("KUBECONFIG"):
         env_kubectl = {"KUBECONFIG": os.getenv("KUBECONFIG")}
     else:
-        env_kubectl = {"KUBECONFIG": os.path.expanduser(str(kubeconfig))}
+        env_kubectl = {"KUBECONFIG": str(Path.home() / ".kube" / "config")}
+
+    args = ["get", "namespace", namespace, "--output=json"]
+    with ToolStream("kubectl", args, env=env_kubectl, timeout=timeout) as stream:
+        try:
+            namespace_object = next(stream.json(), None)
+        except ValueError:
+            namespace_object = None
 
-    (status, output) = kubectl(args=["get", "namespace", namespace, "--output=json"], env=env_kubectl)
-    if status == 0:
-        return json.loads(output)["metadata"]["uid"]
+        status = stream.wait()
+
+    if stream.timed_out:
+        raise ValueError("Get namespace 'name = {}' timed out after {}s".format(namespace, timeout))
+    elif status == 0 and namespace_object is not None:
+        return namespace_object["metadata"]["uid"]
     else:
-        raise ValueError("Get namespace 'name = {}' failed 'exitcode = {}'", namespace, status)
+        raise ValueError("Get namespace 'name = {}' failed 'exitcode = {}': {}".format(
+            namespace, status, stream.stderr.text().strip()))
+
+
+class OutputBuffer:
+
+    """A ring buffer of output lines that retains at most ``limit`` characters, discarding the oldest lines first.
+
+    The most recent line is always retained, even if it alone is longer than the limit.
+    """
+
+    def __init__(self, limit: int = MAX_OUTPUT):
+        self.limit = limit
+        self.discarded = 0
+        self._lines = deque()
+        self._size = 0
+
+    def append(self, line: str):
+        self._lines.append(line)
+        self._size += len(line)
+        while self._size > self.limit and len(self._lines) > 1:
+            self._size -= len(self._lines.popleft())
+            self.discarded += 1
+
+    def extend(self, lines: Iterable[str]):
+        for line in lines:
+            self.append(line)
+
+    @property
+    def truncated(self) -> bool:
+        return self.discarded > 0
+
+    def text(self) -> str:
+        return "".join(self._lines)
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decodes UTF-8 chunks into lines, newline included, as soon as each line is complete."""
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_json(lines: Iterable[str]) -> Iterator[Any]:
+
+    """Decodes a stream of JSON documents, such as kubectl --output=json or --watch output, one document at a time.
+
+    Only the document currently being read is held in memory. Decoding is attempted when a line could close a
+    top-level document (it is not indented and ends with a closing bracket) so that a pretty-printed document is
+    decoded once rather than once per line.
+
+    :argument lines the lines of the stream.
+
+    :return: an iterator of the decoded documents.
+    """
+
+    decoder = json.JSONDecoder()
+    pending = []
+    for line in lines:
+        pending.append(line)
+        if line[:1].isspace() or not line.rstrip().endswith(("}", "]")):
+            continue
+
+        remainder = yield from _decode_documents(decoder, "".join(pending))
+        pending = [remainder] if remainder else []
+
+    remainder = yield from _decode_documents(decoder, "".join(pending))
+    if remainder:
+        raise ValueError("Incomplete JSON document at end of stream: {}".format(remainder[:80]))
+
+
+def _decode_documents(decoder: json.JSONDecoder, text: str):
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+
+        if position == len(text):
+            return ""
+
+        try:
+            document, position = decoder.raw_decode(text, position)
+        except ValueError:
+            return text[position:]
+
+        yield document
+
+
+class ToolResult(tuple):
+
+    """The outcome of running a tool.
+
+    Unpacks as ``(status, output)`` like the plain tuples tools have always returned, and additionally records whether
+    the tool was killed because it ran past its deadline and how long it ran for.
+    """
+
+    def __new__(cls, status: int, output: str, timed_out: bool = False, duration: float = None):
+        result = super().__new__(cls, (status, output))
+        result.timed_out = timed_out
+        result.duration = duration
+        return result
+
+    @property
+    def status(self) -> int:
+        return self[0]
+
+    @property
+    def output(self) -> str:
+        return self[1]
+
+
+def kill_process_group(process):
+
+    """Kills a tool and every process it started.
+
+    Tools are started in a session, and so a process group, of their own so that killing a tool also kills anything it
+    spawned (e.g. a credential plugin) that would otherwise keep the output pipe open.
+    """
+
+    if process.returncode is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class _Deadline:
+
+    """Kills a synchronously run tool's process group if it is still running after ``timeout`` seconds."""
+
+    def __init__(self, process: Popen, timeout: float = None):
+        self.expired = False
+        self._timer = threading.Timer(timeout, self._expire, [process]) if timeout is not None else None
+        if self._timer:
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self, process: Popen):
+        self.expired = True
+        kill_process_group(process)
+
+    def cancel(self):
+        if self._timer:
+            self._timer.cancel()
+
+
+def _start(program: str, args: List[str], env: Mapping[str, str], stderr) -> Popen:
+    try:
+        return Popen([resolve_tool(program)] + args, shell=False, stdout=PIPE, stderr=stderr, env=env,
+                     start_new_session=True)
+    except FileNotFoundError:
+        # The remembered binary went away (e.g. it was upgraded to a new location) so look for it again, once.
+        invalidate_tool(program)
+        return Popen([resolve_tool(program)] + args, shell=False, stdout=PIPE, stderr=stderr, env=env,
+                     start_new_session=True)
+
+
+def _chunks(pipe) -> Iterator[bytes]:
+    return iter(lambda: pipe.read1(_CHUNK_SIZE), b"")
+
+
+class ToolStream:
+
+    """Runs a tool and hands its standard output to the caller as it is produced.
+
+    Standard error is read separately, in the background, into a bounded OutputBuffer so a failure can still be
+    explained without the caller having to hold onto everything the tool printed. Use as a context manager so the tool
+    is killed if the caller stops reading early.
+
+    :argument program the name of the tool, see resolve_tool.
+    :argument args the arguments to the tool.
+    :argument env the environment of the tool.
+    :argument limit the most standard error output, in characters, to retain.
+    :argument timeout seconds after which the tool is killed, ending its output, or None to let it run.
+    """
+
+    def __init__(self,
+                 program: str,
+                 args: List[str],
+                 env: Mapping[str, str] = None,
+                 limit: int = MAX_OUTPUT,
+                 timeout: float = None):
+
+        self.process = _start(program, args, env, stderr=PIPE)
+        self.stderr = OutputBuffer(limit)
+        self._deadline = _Deadline(self.process, timeout)
+        self._stderr_reader = threading.Thread(
+            target=lambda: self.stderr.extend(iter_lines(_chunks(self.process.stderr))), daemon=True)
+        self._stderr_reader.start()
+
+    @property
+    def timed_out(self) -> bool:
+        return self._deadline.expired
+
+    def chunks(self) -> Iterator[bytes]:
+        return _chunks(self.process.stdout)
+
+    def lines(self) -> Iterator[str]:
+        return iter_lines(self.chunks())
+
+    def json(self) -> Iterator[Any]:
+        return iter_json(self.lines())
+
+    def wait(self) -> int:
+        """Discards any standard output that was not read and waits for the tool to exit."""
+        for _ in self.chunks():
+            pass
+
+        self._stderr_reader.join()
+        return self.process.wait()
+
+    def close(self):
+        self._deadline.cancel()
+        kill_process_group(self.process)
+        self.process.wait()
+        self._stderr_reader.join()
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+    def __enter__(self) -> "ToolStream":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_tool(program: str,
+             args: List[str],
+             env: Mapping[str, str] = None,
+             limit: int = MAX_OUTPUT,
+             timeout: float = None) -> ToolResult:
+
+    """Runs a tool to completion.
+
+    Standard error is merged into standard output and at most ``limit`` characters of the most recent output are
+    retained, so a long running, chatty command such as kubectl drain cannot exhaust memory. A tool still running after
+    ``timeout`` seconds is killed along with everything it started.
+
+    :return: the exit code and the retained output.
+    """
+
+    started = time.monotonic()
+    process = _start(program, args, env, stderr=STDOUT)
+    deadline = _Deadline(process, timeout)
+    output = OutputBuffer(limit)
+    try:
+        with process.stdout:
+            output.extend(iter_lines(_chunks(process.stdout)))
+
+        status = process.wait()
+    finally:
+        deadline.cancel()
+        kill_process_group(process)
+
+    return ToolResult(status, output.text(), deadline.expired, time.monotonic() - started)
+
+
+async def run_tool_async(program: str,
+                         args: List[str],
+                         env: Mapping[str, str] = None,
+                         limit: int = MAX_OUTPUT,
+                         timeout: float = None) -> ToolResult:
+
+    """Runs a tool without blocking the event loop.
+
+    Has the same contract as run_tool: stderr is merged into stdout, output beyond ``limit`` characters is discarded
+    oldest first and a tool running past ``timeout`` seconds is killed. Cancelling the call kills the tool too.
+    """
+
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            resolve_tool(program), *args, stdout=PIPE, stderr=STDOUT, env=env, start_new_session=True)
+    except FileNotFoundError:
+        invalidate_tool(program)
+        process = await asyncio.create_subprocess_exec(
+            resolve_tool(program), *args, stdout=PIPE, stderr=STDOUT, env=env, start_new_session=True)
+
+    output = OutputBuffer(limit)
+    timed_out = False
+    try:
+        await asyncio.wait_for(_read_output(process.stdout, output), timeout=timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_process_group(process)
+    except asyncio.CancelledError:
+        kill_process_group(process)
+        await process.wait()
+        raise
+
+    status = await process.wait()
+    return ToolResult(status, output.text(), timed_out, loop.time() - started)
+
+
+async def _read_output(stream: asyncio.StreamReader, output: OutputBuffer):
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    pending = ""
+    while True:
+        chunk = await stream.read(_CHUNK_SIZE)
+        pending += decoder.decode(chunk, final=not chunk)
+        *lines, pending = pending.split("\n")
+        output.extend(line + "\n" for line in lines)
+        if not chunk:
+            break
+
+    if pending:
+        output.append(pending)
+
+
+def kubectl(args: List[str], env: Mapping[str, str] = None, timeout: float = None) -> ToolResult:
+    return run_tool("kubectl", args, env, timeout=timeout)
+
+
+def kubeadm(args: List[str], env: Mapping[str, str] = None, timeout: float = None) -> ToolResult:
+    return run_tool("kubeadm", args, env, timeout=timeout)
 
 
-def kubectl(args: List[str], env: Mapping[str, str] = None) -> Tuple[int, str]:
-    args.insert(0, which("kubectl", BIN_PATHS))
-    completed = run(args, shell=False, stdout=PIPE, stderr=STDOUT, env=env)
+async def kubectl_async(args: List[str], env: Mapping[str, str] = None, timeout: float = None) -> ToolResult:
+    return await run_tool_async("kubectl", args, env, timeout=timeout)
 
-    return completed.returncode, completed.stdout.decode("utf-8")
 
+async def kubeadm_async(args: List[str], env: Mapping[str, str] = None, timeout: float = None) -> ToolResult:
+    return await run_tool_async("kubeadm", args, env, timeout=timeout)
 
-def kubeadm(args: List[str], env: Mapping[str, str] = None) -> Tuple[int, str]:
-    args.insert(0, which("kubeadm", BIN_PATHS))
-    completed = run(args, shell=False, stdout=PIPE, stderr=STDOUT, env=env)
 
-    return completed.returncode, completed.stdout.decode("utf-8")
+async def system_async(command: str) -> int:
+    """An awaitable equivalent of os.system."""
+    process = await asyncio.create_subprocess_shell(command)
+    return await process.wait()
@@ -1,31 +1,796 @@
-import tempfile
+import asyncio
+import inspect
+import logging
+import time
+
+from collections import OrderedDict
+from enum import Enum
+from kubernaut.api import ApiClient, ApiError
+from kubernaut.kubeconfig import Kubeconfig
+from kubernaut.kubernetes import ToolResult
+from kubernaut.teardown import Pipeline, Stage, SUCCEEDED
+from kubernaut.util import encode
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger("model")
+
+
+class AgentState(str, Enum):
+
+    STARTING = "starting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    SHUTDOWN = "shutdown"
+
+
+class ClusterState(str, Enum):
+
+    """The claim status of a cluster as agreed with the controller."""
+
+    UNREGISTERED = "UNREGISTERED"
+    UNCLAIMED = "UNCLAIMED"
+    CLAIMED = "CLAIMED"
+    RELEASED = "RELEASED"
+    DISCARDED = "DISCARDED"
+    EXPIRED = "EXPIRED"
+
+    @classmethod
+    def parse(cls, value: Union["ClusterState", str]) -> "ClusterState":
+        """Returns the state named by a status string from the controller, ignoring case."""
+        if isinstance(value, cls):
+            return value
+
+        try:
+            return cls[value.upper()]
+        except (KeyError, AttributeError):
+            raise ValueError("Unknown cluster state: {}".format(value))
+
+    @property
+    def released(self) -> bool:
+        return self in RELEASED_STATES
+
+
+RELEASED_STATES: FrozenSet[ClusterState] = frozenset([
+    ClusterState.RELEASED, ClusterState.DISCARDED, ClusterState.EXPIRED
+])
+
+# The states a cluster may move to from each state. The controller may forget a cluster (e.g. after the agent
+# reconnects), release it at any time and report the released states in any order, but a released cluster never
+# becomes available again; only the agent recycling it does that (see ClusterLifecycle.recycle).
+TRANSITIONS: Dict[ClusterState, FrozenSet[ClusterState]] = {
+    ClusterState.UNREGISTERED: frozenset([ClusterState.UNCLAIMED, ClusterState.CLAIMED]) | RELEASED_STATES,
+    ClusterState.UNCLAIMED: frozenset([ClusterState.UNREGISTERED, ClusterState.CLAIMED]) | RELEASED_STATES,
+    ClusterState.CLAIMED: frozenset([ClusterState.UNREGISTERED, ClusterState.UNCLAIMED]) | RELEASED_STATES,
+    ClusterState.RELEASED: RELEASED_STATES,
+    ClusterState.DISCARDED: RELEASED_STATES,
+    ClusterState.EXPIRED: RELEASED_STATES,
+}
+
+Hook = Callable[["ClusterLifecycle", ClusterState, ClusterState], None]
+
+
+class ClusterLifecycle:
+
+    """The state machine of a single cluster.
+
+    Transitions are checked against TRANSITIONS. Hooks registered with on_enter and on_exit are called with the
+    lifecycle, the previous state and the next state; exit hooks before the state changes and entry hooks after. The
+    time spent in each state and when each state was last entered are recorded so that, for example, the time from
+    claim to release can be reported.
+
+    :argument state the initial state.
+    :argument clock the monotonic clock used for timing, replaceable for tests.
+    """
+
+    __slots__ = ("state", "entered_at", "_entered", "_durations", "_hooks", "_clock")
+
+    def __init__(self, state: ClusterState, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.state = state
+        self.entered_at = clock()
+        self._entered: Dict[ClusterState, float] = {state: self.entered_at}
+        self._durations: Dict[ClusterState, float] = {}
+        self._hooks: Optional[Dict[Tuple[bool, ClusterState], List[Hook]]] = None
+
+    def can(self, state: ClusterState) -> bool:
+        return state in TRANSITIONS[self.state]
+
+    def transition(self, state: ClusterState) -> bool:
+
+        """Moves to another state.
+
+        :return: True if the state changed, False if the lifecycle was already in the state.
+        :raises ValueError: if the transition is not allowed.
+        """
+
+        previous = self.state
+        if state is previous:
+            return False
+
+        if state not in TRANSITIONS[previous]:
+            raise ValueError("Cluster cannot move from {} to {}".format(previous.value, state.value))
+
+        self._move(state)
+        return True
+
+    def recycle(self):
+
+        """Moves a released cluster back to UNREGISTERED once the agent has reset it in place.
+
+        This is the only way out of a released state, so a controller that reports a stale status cannot make a
+        released cluster available again.
+
+        :raises ValueError: if the cluster is not released.
+        """
+
+        if not self.state.released:
+            raise ValueError("Cluster cannot be recycled from {}".format(self.state.value))
+
+        self._move(ClusterState.UNREGISTERED)
+
+    def _move(self, state: ClusterState):
+        previous = self.state
+        self._run_hooks(False, previous, previous, state)
+
+        now = self._clock()
+        self._durations[previous] = self._durations.get(previous, 0.0) + now - self.entered_at
+        self.state = state
+        self.entered_at = now
+        self._entered[state] = now
+
+        self._run_hooks(True, state, previous, state)
+
+    def on_enter(self, state: ClusterState, hook: Hook):
+        self._add_hook(True, state, hook)
+
+    def on_exit(self, state: ClusterState, hook: Hook):
+        self._add_hook(False, state, hook)
+
+    def _add_hook(self, entry: bool, state: ClusterState, hook: Hook):
+        if self._hooks is None:
+            self._hooks = {}
+
+        self._hooks.setdefault((entry, state), []).append(hook)
+
+    def _run_hooks(self, entry: bool, state: ClusterState, previous: ClusterState, next_state: ClusterState):
+        if self._hooks:
+            for hook in self._hooks.get((entry, state), []):
+                hook(self, previous, next_state)
+
+    def time_in(self, state: ClusterState) -> float:
+        """Returns the total seconds spent in a state, including the time so far if it is the current state."""
+        total = self._durations.get(state, 0.0)
+        if state is self.state:
+            total += self._clock() - self.entered_at
+
+        return total
+
+    def latency(self, source: ClusterState, target: ClusterState) -> Optional[float]:
+        """Returns the seconds from last entering ``source`` to last entering ``target``, if both happened in order."""
+        started, finished = self._entered.get(source), self._entered.get(target)
+        if started is None or finished is None or finished < started:
+            return None
+
+        return finished - started
+
+    def timings(self) -> Dict[str, float]:
+        return {state.value: self.time_in(state) for state in ClusterState if state in self._entered}
 
 
 class Cluster:
 
-    def __init__(self, cluster_id: str, state: str, kubeconfig: str, token: str):
+    """A cluster managed by the agent.
+
+    The cluster's state is tracked by a ClusterLifecycle in ``lifecycle``; ``state`` accepts a ClusterState or a status
+    string from the controller and rejects transitions the lifecycle does not allow with a ValueError.
+
+    Changes to ``state``, ``kubeconfig`` or ``token`` bump ``revision`` and mark the cluster dirty. The encoded snapshot
+    sent to the controller is cached and only re-encoded the first time it is needed after a change.
+
+    When the agent could build an API client from the kubeconfig it is kept in ``api`` and used for reads and deletes
+    during shutdown instead of kubectl.
+
+    A cluster with a ``baseline`` can be recycled rather than shut down once released.
+
+    A cluster that is not ``ready`` is not advertised to the controller until it is, unless it is already claimed.
+    """
+
+    def __init__(self, cluster_id: str, state: Union[ClusterState, str], kubeconfig: Union[Kubeconfig, str], token: str,
+                 api: ApiClient = None):
         self.cluster_id = cluster_id
-        self.state = state
-        self.kubeconfig = kubeconfig
-        self.token = token
+        self.api = api
+        self.lifecycle = ClusterLifecycle(ClusterState.parse(state))
+        self._kubeconfig = _as_kubeconfig(kubeconfig)
+        self._token = token
+        self.revision = 0
+        self.teardown: Pipeline = None
+        self.baseline: Baseline = None
+        self.ready = True
+        self._fragment: bytes = None
+
+    @property
+    def state(self) -> ClusterState:
+        return self.lifecycle.state
+
+    @state.setter
+    def state(self, value: Union[ClusterState, str]):
+        if self.lifecycle.transition(ClusterState.parse(value)):
+            self._changed()
+
+    @property
+    def kubeconfig(self) -> Kubeconfig:
+        return self._kubeconfig
+
+    @kubeconfig.setter
+    def kubeconfig(self, value: Union[Kubeconfig, str]):
+        value = _as_kubeconfig(value)
+        if value != self._kubeconfig:
+            self._kubeconfig = value
+            self._changed()
+
+    @property
+    def token(self) -> str:
+        return self._token
+
+    @token.setter
+    def token(self, value: str):
+        if value != self._token:
+            self._token = value
+            self._changed()
+
+    @property
+    def dirty(self) -> bool:
+        """True when the cluster has changed since its snapshot fragment was last encoded."""
+        return self._fragment is None
+
+    def _changed(self):
+        self.revision += 1
+        self._fragment = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "id": self.cluster_id,
+            "token": self.token,
+            "detail": {"kubeconfig": self.kubeconfig.text},
+            "status": self.state.value
+        }
+
+    def snapshot_fragment(self) -> bytes:
+        """Returns the encoded snapshot, re-encoding it only if the cluster changed since the last call."""
+        if self._fragment is None:
+            self._fragment = encode(self.snapshot())
+
+        return self._fragment
+
+    def fingerprint(self) -> Tuple[str, int]:
+        return self.cluster_id, self.revision
+
+    @property
+    def released(self) -> bool:
+        return self.state in RELEASED_STATES
+
+    async def shutdown(self,
+                       kubectl_handler,
+                       kubeadm_handler,
+                       system_handler,
+                       reset_host: bool = True,
+                       parallelism: int = 4,
+                       node_timeout: float = None,
+                       budget: float = None,
+                       reset_timeout: float = 120.0,
+                       batch_size: int = None,
+                       api: ApiClient = None) -> List["NodeTeardown"]:
+
+        """Drains and deletes every node of the cluster then resets and powers off the host.
+
+        Handlers may be plain functions, such as kubectl(), or coroutines, such as kubectl_async(). Prefer the
+        coroutines when shutting down from the agent's event loop so it can keep answering the controller, so that
+        up to ``parallelism`` batches of nodes are drained and deleted at the same time and so that the timeouts below
+        can interrupt them.
+
+        Nodes are drained and deleted in batches, one kubectl invocation per batch (``kubectl drain a b c``, ``kubectl
+        delete node a b c``), rather than one per node. If a batch invocation fails each of its nodes is retried on its
+        own so that the failure is attributed to the right nodes.
+
+        The teardown runs as a Pipeline of stages, list-nodes, drain-delete-nodes, kubeadm-reset and poweroff, each
+        started once the stages before it have finished whether they succeeded or not. The pipeline is kept in
+        ``teardown`` afterwards with the status and duration of every stage and the critical path.
+
+        :argument parallelism the maximum number of batches drained and deleted concurrently.
+        :argument node_timeout seconds allowed to drain, and again to delete, a single node, or None to wait
+                               indefinitely. A batch invocation is allowed this much time per node it contains and
+                               kubectl handlers are passed it as ``timeout``. An invocation that runs out of time is
+                               retried node by node like one that failed, and nodes are deleted even if they could not
+                               be drained.
+        :argument batch_size the most nodes handled by one kubectl invocation. By default the nodes are split evenly
+                             into ``parallelism`` batches. A batch size of 1 drains and deletes nodes individually.
+        :argument budget seconds allowed for listing, draining and deleting every node. Once it is spent any node
+                         teardown still running is abandoned and the host is reset and powered off regardless.
+        :argument reset_timeout seconds allowed for kubeadm reset before the host is powered off anyway.
+        :argument api the API client to list and delete nodes with instead of the cluster's own, e.g. a DryRun's.
+
+        :return: the outcome of tearing down each node, including any that failed, timed out or were abandoned.
+        """
+
+        if parallelism < 1:
+            raise ValueError("Shutdown parallelism must be at least 1")
+
+        loop = asyncio.get_event_loop()
+        deadline = None if budget is None else loop.time() + budget
+        results: List[NodeTeardown] = []
+
+        env_kubectl = {"KUBECONFIG": self.kubeconfig.path}
+        api = self.api if api is None else api
+
+        async def list_nodes():
+            results.extend(NodeTeardown(name) for name in await self._node_names(kubectl_handler, env_kubectl, api))
+
+        async def drain_and_delete():
+            await self._teardown_nodes(kubectl_handler, env_kubectl, results, parallelism, batch_size,
+                                       node_timeout, budget, deadline, api)
+
+        async def reset():
+            await _call(kubeadm_handler, ["reset"])
+
+        async def poweroff():
+            await _call(system_handler, "systemctl poweroff")
+
+        stages = [
+            Stage("list-nodes", list_nodes, timeout=budget),
+            Stage("drain-delete-nodes", drain_and_delete, after=["list-nodes"])
+        ]
+
+        # When a single agent handles many clusters it is not installed on any one of them so only the nodes are
+        # removed and the host is left alone. The host is powered off even if the reset failed or timed out.
+        if reset_host:
+            stages.append(Stage("kubeadm-reset", reset, after=["drain-delete-nodes"], timeout=reset_timeout))
+            stages.append(Stage("poweroff", poweroff, after=["kubeadm-reset"]))
+
+        self.teardown = Pipeline(stages)
+        await self.teardown.run()
+
+        for result in results:
+            logger.info("Node teardown, cluster: %s, node: %s, drain: %s, delete: %s, result: %s", self.cluster_id,
+                        result.name, _seconds(result.drain_seconds), _seconds(result.delete_seconds),
+                        result.error or "ok")
+
+        return results
+
+    async def _teardown_nodes(self, kubectl_handler, env_kubectl: Dict[str, str], results: List["NodeTeardown"],
+                              parallelism: int, batch_size: Optional[int], node_timeout: Optional[float],
+                              budget: Optional[float], deadline: Optional[float], api: ApiClient = None):
+        batches = _batches(results, batch_size or -(-len(results) // parallelism))
+        slots = asyncio.Semaphore(parallelism)
+        tasks = [asyncio.ensure_future(self._teardown_batch(kubectl_handler, env_kubectl, b, slots, node_timeout, api))
+                 for b in batches]
+
+        if not tasks:
+            return
+
+        remaining = None if deadline is None else max(0.0, deadline - asyncio.get_event_loop().time())
+        _, pending = await asyncio.wait(tasks, timeout=remaining)
+        if pending:
+            logger.warning("Cluster shutdown budget of %gs exhausted, cluster: %s, abandoning nodes: %d", budget,
+                           self.cluster_id, sum(len(b) for b, t in zip(batches, tasks) if t in pending))
+            for task in pending:
+                task.cancel()
+
+            await asyncio.wait(pending)
+            for batch, task in zip(batches, tasks):
+                if task in pending:
+                    for result in batch:
+                        result.fail("abandoned, shutdown budget of {:g}s exhausted".format(budget))
+
+    async def _teardown_batch(self, kubectl_handler, env_kubectl: Dict[str, str], batch: List["NodeTeardown"],
+                              slots: asyncio.Semaphore, node_timeout: float = None, api: ApiClient = None):
+        async with slots:
+            try:
+                await self._drain_and_delete(kubectl_handler, env_kubectl, batch, node_timeout, api)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                for result in batch:
+                    result.fail("{}: {}".format(type(e).__name__, e))
+
+    async def _drain_and_delete(self, kubectl_handler, env_kubectl: Dict[str, str], batch: List["NodeTeardown"],
+                                node_timeout: float = None, api: ApiClient = None):
+        def timeout(nodes: List[str]) -> Optional[float]:
+            return None if node_timeout is None else node_timeout * len(nodes)
+
+        async def drain(nodes: List[str], retry: bool):
+            args = ["drain"] + nodes + ["--delete-local-data", "--force", "--ignore-daemonsets"]
+            return await _bounded(_call_kubectl(kubectl_handler, args, env_kubectl, timeout(nodes)), timeout(nodes))
+
+        async def delete(nodes: List[str], retry: bool):
+            return await _bounded(self._delete_nodes(kubectl_handler, env_kubectl, nodes, retry, timeout(nodes), api),
+                                  timeout(nodes))
+
+        # A node that cannot be drained is deleted anyway; the cluster is going away regardless.
+        try:
+            await _step(batch, "drain", "drain_seconds", drain)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            for result in batch:
+                result.fail("drain {}: {}".format(type(e).__name__, e))
+
+        await _step(batch, "delete", "delete_seconds", delete)
+
+    async def _node_names(self, kubectl_handler, env_kubectl: Dict[str, str], api: ApiClient = None) -> List[str]:
+        # An API server that cannot be reached directly may still be reachable by kubectl (e.g. through a proxy or
+        # an exec credential plugin) so kubectl remains the fallback.
+        if api is not None:
+            loop = asyncio.get_event_loop()
+            try:
+                nodes = await loop.run_in_executor(None, api.list_nodes)
+                return [n["metadata"]["name"] for n in nodes.get("items", [])]
+            except (ApiError, OSError):
+                pass
+
+        (status, output) = await _call(
+            kubectl_handler, ["get", "nodes", "--output=jsonpath={.items[*].metadata.name}"], env_kubectl)
+
+        return output.split(" ") if status == 0 and len(output) > 0 else []
+
+    async def _delete_nodes(self, kubectl_handler, env_kubectl: Dict[str, str], names: List[str],
+                            retry: bool = False, timeout: float = None, api: ApiClient = None) -> Tuple[int, str]:
+        if api is not None:
+            loop = asyncio.get_event_loop()
+            try:
+                for name in names:
+                    await loop.run_in_executor(None, api.delete, "/api/v1/nodes/{}".format(name))
+
+                return 0, ""
+            except (ApiError, OSError):
+                pass
+
+        # A retry follows a batch that may have deleted some of the nodes already, which is not an error.
+        args = ["delete", "node"] + names + (["--ignore-not-found"] if retry else [])
+        return await _call_kubectl(kubectl_handler, args, env_kubectl, timeout)
+
+    async def recycle(self, kubectl_handler, stage_timeout: float = 300.0) -> bool:
+
+        """Resets a released cluster in place so it can be claimed again without reinstalling its hosts.
+
+        Every object of the baseline's kinds that is not part of the baseline is deleted, then the cluster is
+        checked against the baseline. Objects users added to the namespaces of the baseline, such as a deployment in
+        default, are deleted one by one; those in namespaces they created go with the namespace. Webhook configurations
+        are deleted first so that they cannot intercept the other deletions, the other kinds at the same time, and
+        persistent volumes once the claims on them are gone. The stages run as a Pipeline kept in ``teardown``, like
+        those of shutdown.
+
+        :argument kubectl_handler a kubectl handler, e.g. kubectl_async().
+        :argument stage_timeout seconds allowed for each stage.
+
+        :return: True if the cluster is back to its baseline and has moved to UNREGISTERED to be registered again,
+                 False if it stays released and has to be shut down instead.
+        :raises ValueError: if the cluster has no baseline or is not released.
+        """
+
+        if self.baseline is None:
+            raise ValueError("Cluster has no baseline to recycle to")
+
+        if not self.released:
+            raise ValueError("Cluster cannot be recycled from {}".format(self.state.value))
+
+        env_kubectl = {"KUBECONFIG": self.kubeconfig.path}
+
+        kinds = self.baseline.kinds
+
+        def delete(kind: str):
+            async def stage():
+                names = await _object_names(kubectl_handler, env_kubectl, kind)
+                added = sorted(set(names) - self.baseline.objects[kind])
+                for args in _deletions(kind, added, self.baseline.objects["namespaces"]):
+                    _check(await _call(kubectl_handler, args + ["--ignore-not-found"], env_kubectl), "delete " + kind)
+
+            return stage
+
+        async def verify():
+            current = await Baseline.capture(kubectl_handler, env_kubectl, self.baseline.namespaced_kinds)
+            differences = self.baseline.differences(current)
+            if differences:
+                raise ValueError("cluster differs from its baseline: {}".format("; ".join(differences)))
+
+        def after(kind: str) -> List[str]:
+            if kind in WEBHOOK_KINDS:
+                return []
+
+            claims = ["namespaces", "persistentvolumeclaims"] if kind == "persistentvolumes" else []
+            return ["delete-{}".format(k) for k in WEBHOOK_KINDS + claims if k in kinds]
+
+        deletions = ["delete-{}".format(kind) for kind in kinds]
+        self.teardown = Pipeline(
+            [Stage("delete-{}".format(kind), delete(kind), after=after(kind), timeout=stage_timeout)
+             for kind in kinds] +
+            [Stage("verify-baseline", verify, after=deletions, timeout=stage_timeout)])
+        await self.teardown.run()
+
+        if self.teardown.stages["verify-baseline"].status != SUCCEEDED:
+            return False
+
+        self.lifecycle.recycle()
+        self._changed()
+        return True
+
+
+async def _step(batch: List["NodeTeardown"], step: str, timing: str, run):
+
+    """Runs one teardown step for a batch of nodes, retrying node by node if the batch invocation fails.
+
+    :argument batch the nodes of the batch.
+    :argument step the name of the step, used when recording failures.
+    :argument timing the NodeTeardown attribute to record the step's duration in.
+    :argument run a coroutine function that runs the step for a list of node names and whether it is a retry.
+    """
+
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    outcome = await run([r.name for r in batch], False)
+    elapsed = loop.time() - started
+    for result in batch:
+        setattr(result, timing, elapsed)
+
+    if len(batch) == 1:
+        batch[0].check(step, outcome)
+        return
+
+    if outcome[0] == 0 and not getattr(outcome, "timed_out", False):
+        return
+
+    logger.info("Batch %s of %d nodes failed, retrying each node", step, len(batch))
+    for result in batch:
+        started = loop.time()
+        result.check(step, await run([result.name], True))
+        setattr(result, timing, getattr(result, timing) + loop.time() - started)
+
+
+def _batches(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)] if size > 0 else []
+
+
+def _as_kubeconfig(kubeconfig: Union[Kubeconfig, str]) -> Kubeconfig:
+    return kubeconfig if isinstance(kubeconfig, Kubeconfig) else Kubeconfig(kubeconfig)
+
+
+# The kinds of object recycling removes when a user added them and checks against the baseline afterwards. Webhook
+# configurations are removed before anything else.
+WEBHOOK_KINDS = ["mutatingwebhookconfigurations", "validatingwebhookconfigurations"]
+CLUSTER_KINDS = WEBHOOK_KINDS + ["namespaces", "customresourcedefinitions", "persistentvolumes", "storageclasses",
+                                 "priorityclasses", "clusterroles", "clusterrolebindings"]
+
+# Namespaced kinds are recorded as namespace/name. What users add to the namespaces of the baseline, e.g. default, is
+# removed object by object since those namespaces stay. The namespaced kinds are those the API server can list and
+# delete when the baseline is captured, custom resources included; these are used if it cannot tell.
+NAMESPACED_KINDS = ["pods", "replicasets", "deployments", "daemonsets", "statefulsets", "jobs", "cronjobs", "services",
+                    "ingresses", "secrets", "configmaps", "persistentvolumeclaims", "serviceaccounts", "roles",
+                    "rolebindings", "networkpolicies", "resourcequotas", "limitranges", "horizontalpodautoscalers",
+                    "poddisruptionbudgets"]
+
+# Kinds whose objects come and go by themselves. They are neither recorded in a baseline nor deleted.
+EPHEMERAL_KINDS = ["events", "events.events.k8s.io"]
+
+# Objects the cluster adds and removes by itself, e.g. kubeadm's bootstrap tokens which expire, by kind and name prefix.
+# They are neither recorded in a baseline nor deleted.
+EPHEMERAL_OBJECTS = {"secrets": "kube-system/bootstrap-token-"}
+
+# Namespaced objects are listed with the kinds of their owners, if any, so that owned ones can be left out.
+NAMESPACED_JSONPATH = ('{range .items[*]}{.metadata.namespace}{"/"}{.metadata.name}'
+                       '{" "}{.metadata.ownerReferences[*].kind}{"\\n"}{end}')
+
+
+class Baseline:
+
+    """The objects a cluster holds before anybody used it, by kind.
+
+    Cluster-scoped objects, of CLUSTER_KINDS, are recorded by name, namespaced ones as namespace/name. Namespaced
+    objects owned by another, such as the pods of a deployment, are not recorded: they come and go with their owner.
+
+    :argument objects the names of the objects by kind.
+    :argument namespaced_kinds the namespaced kinds recorded, NAMESPACED_KINDS by default.
+    """
+
+    def __init__(self, objects: Dict[str, Iterable[str]], namespaced_kinds: Iterable[str] = None):
+        self.namespaced_kinds = list(NAMESPACED_KINDS if namespaced_kinds is None else namespaced_kinds)
+        self.kinds = CLUSTER_KINDS + self.namespaced_kinds
+        self.objects: Dict[str, FrozenSet[str]] = {kind: frozenset(objects.get(kind, [])) for kind in self.kinds}
+
+    @classmethod
+    async def capture(cls, kubectl_handler, env_kubectl: Dict[str, str],
+                      namespaced_kinds: List[str] = None) -> "Baseline":
+        """Lists the objects of each kind, raising a ValueError if kubectl fails.
+
+        :argument namespaced_kinds the namespaced kinds to list, by default every one the API server can list and
+                                   delete.
+        """
+        if namespaced_kinds is None:
+            namespaced_kinds = await _namespaced_kinds(kubectl_handler, env_kubectl)
+
+        kinds = CLUSTER_KINDS + namespaced_kinds
+        names = await asyncio.gather(*[_object_names(kubectl_handler, env_kubectl, kind) for kind in kinds])
+        return cls(dict(zip(kinds, names)), namespaced_kinds)
+
+    def differences(self, current: "Baseline") -> List[str]:
+        """Describes how another capture of the cluster differs from this one, if at all."""
+        differences = []
+        for kind in self.kinds:
+            for change, names in [("added", current.objects.get(kind, frozenset()) - self.objects[kind]),
+                                  ("missing", self.objects[kind] - current.objects.get(kind, frozenset()))]:
+                if names:
+                    differences.append("{} {}: {}".format(kind, change, ", ".join(sorted(names))))
+
+        return differences
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Baseline) and self.objects == other.objects
+
+    def __repr__(self):
+        return "Baseline({})".format(", ".join("{}={}".format(k, len(v)) for k, v in self.objects.items()))
+
+
+async def _namespaced_kinds(kubectl_handler, env_kubectl: Dict[str, str]) -> List[str]:
+    outcome = await _call(
+        kubectl_handler, ["api-resources", "--namespaced=true", "--verbs=list,delete", "--output=name"], env_kubectl)
+
+    # kubectl fails when any API group, e.g. an aggregated one whose server is down, cannot be discovered.
+    if outcome[0] != 0 or getattr(outcome, "timed_out", False):
+        logger.warning("Namespaced kinds not discovered, tracking the usual ones: %s", _last_line(outcome[1]))
+        return list(NAMESPACED_KINDS)
+
+    return [k for k in outcome[1].split() if k not in EPHEMERAL_KINDS]
+
+
+async def _object_names(kubectl_handler, env_kubectl: Dict[str, str], kind: str) -> List[str]:
+    if kind not in CLUSTER_KINDS:
+        args = ["get", kind, "--all-namespaces", "--output=jsonpath={}".format(NAMESPACED_JSONPATH)]
+    else:
+        args = ["get", kind, "--output=jsonpath={.items[*].metadata.name}"]
+
+    outcome = await _call(kubectl_handler, args, env_kubectl)
+    _check(outcome, "get " + kind)
+    ephemeral = EPHEMERAL_OBJECTS.get(kind)
+    if kind in CLUSTER_KINDS:
+        names = outcome[1].split()
+    else:
+        # A line naming an owner after the object is that of an owned object.
+        names = [f[0] for f in (line.split() for line in outcome[1].splitlines()) if len(f) == 1]
+
+    return [n for n in names if ephemeral is None or not n.startswith(ephemeral)]
+
+
+def _deletions(kind: str, names: List[str], namespaces: Iterable[str]) -> List[List[str]]:
+    """Returns the kubectl delete commands for objects of a kind, one per namespace of the baseline for namespaced ones.
+
+    Namespaced objects outside the given namespaces are left for the deletion of their namespace.
+    """
+    if kind in CLUSTER_KINDS:
+        return [["delete", kind] + names] if names else []
+
+    by_namespace: Dict[str, List[str]] = OrderedDict()
+    for name in names:
+        (namespace, _, short_name) = name.partition("/")
+        if namespace in namespaces:
+            by_namespace.setdefault(namespace, []).append(short_name)
+
+    return [["delete", kind, "--namespace={}".format(n)] + members for n, members in by_namespace.items()]
+
+
+def _check(outcome: Tuple[int, str], command: str):
+    (status, output) = outcome
+    if getattr(outcome, "timed_out", False):
+        raise ValueError("kubectl {} timed out after {:.1f}s".format(command, outcome.duration))
+
+    if status != 0:
+        raise ValueError("kubectl {} exited {}: {}".format(command, status, _last_line(output)))
+
+
+class NodeTeardown:
+
+    """The outcome of draining and deleting a single node during cluster shutdown."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.drain_seconds: float = None
+        self.delete_seconds: float = None
+        self.errors: List[str] = []
+
+    def fail(self, error: str):
+        self.errors.append(error)
+
+    def check(self, step: str, outcome: Tuple[int, str]):
+        """Records a failed step. Outcomes that say they timed out, such as a ToolResult, are reported as such."""
+        (status, output) = outcome
+        if getattr(outcome, "timed_out", False):
+            self.fail("{} timed out after {:.1f}s".format(step, outcome.duration))
+        elif status != 0:
+            self.fail("{} exited {}: {}".format(step, status, _last_line(output)))
+
+    @property
+    def error(self) -> str:
+        return "; ".join(self.errors) or None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def _seconds(value: float) -> str:
+    return "-" if value is None else "{:.2f}s".format(value)
+
+
+def _last_line(output: str) -> str:
+    lines = (output or "").strip().splitlines()
+    return lines[-1] if lines else ""
+
+
+async def _call(handler, *args):
+    """Calls a handler, awaiting the result if the handler is a coroutine."""
+    result = handler(*args)
+    if inspect.isawaitable(result):
+        result = await result
+
+    return result
+
+
+async def _call_kubectl(kubectl_handler, args: List[str], env_kubectl: Dict[str, str], timeout: float = None):
+    """Calls a kubectl handler, passing it ``timeout`` if there is one, like kubectl() and kubectl_async() accept."""
+    if timeout is None:
+        return await _call(kubectl_handler, args, env_kubectl)
+
+    result = kubectl_handler(args, env_kubectl, timeout=timeout)
+    return (await result) if inspect.isawaitable(result) else result
+
+
+async def _bounded(work: Awaitable[Tuple[int, str]], timeout: Optional[float]) -> Tuple[int, str]:
+
+    """Awaits a teardown invocation, reporting one still running after ``timeout`` seconds as a timed out ToolResult.
+
+    Handlers such as kubectl_async() kill their tool once it runs out of time, but this also bounds handlers that do
+    not, such as API calls.
+    """
+
+    if timeout is None:
+        return await work
+
+    try:
+        return await asyncio.wait_for(work, timeout=timeout)
+    except asyncio.TimeoutError:
+        return ToolResult(-1, "", timed_out=True, duration=timeout)
+
+
+class ClusterRegistry:
+
+    """The clusters managed by an agent keyed by cluster ID, in registration order."""
+
+    def __init__(self):
+        self._clusters: Dict[str, Cluster] = OrderedDict()
+
+    def add(self, cluster: Cluster) -> Cluster:
+        if cluster.cluster_id in self._clusters:
+            raise ValueError("Cluster '{}' is already registered".format(cluster.cluster_id))
+
+        self._clusters[cluster.cluster_id] = cluster
+        return cluster
+
+    def get(self, cluster_id: str) -> Cluster:
+        return self._clusters.get(cluster_id)
+
+    def remove(self, cluster_id: str) -> Cluster:
+        return self._clusters.pop(cluster_id, None)
 
-    def shutdown(self, kubectl_handler, kubeadm_handler, system_handler):
-        with tempfile.NamedTemporaryFile(mode='w+', encoding="utf-8", prefix="kubeconfig-") as fp:
-            fp.write(self.kubeconfig)
-            env_kubectl = {"KUBECONFIG": fp.name}
+    def active(self) -> List[Cluster]:
+        """Returns the clusters that have not been released and therefore still need heartbeats."""
+        return [c for c in self._clusters.values() if not c.released]
 
-            (status, output) = kubectl_handler(
-                ["get", "nodes", "--output=jsonpath={.items[*].metadata.name}"], env_kubectl)
+    def advertised(self) -> List[Cluster]:
+        """Returns the active clusters that are ready to be handed out or have been handed out already."""
+        return [c for c in self.active() if c.ready or c.state is ClusterState.CLAIMED]
 
-            nodes = []
-            if status == 0 and len(output) > 0:
-                nodes = output.split(" ")
+    def __contains__(self, cluster_id: str) -> bool:
+        return cluster_id in self._clusters
 
-            for name in nodes:
-                kubectl_handler(["drain", name, "--delete-local-data", "--force", "--ignore-daemonsets"], env_kubectl)
-                kubectl_handler(["delete", "node", name], env_kubectl)
+    def __iter__(self) -> Iterator[Cluster]:
+        return iter(list(self._clusters.values()))
 
-            # If we move to a world where there are multiple Kubernetes clusters handled by a single agent then this
-            # code will need to be modified as the agent will not be installed per cluster most likely.
-            kubeadm_handler(["reset"])
-            system_handler("systemctl poweroff")
+    def __len__(self) -> int:
+        return len(self._clusters)
@@ -0,0 +1,127 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from kubernaut.model import Cluster
+from kubernaut.util import encode
+
+CLUSTERS_SNAPSHOT = "clusters-snapshot"
+CLUSTER_HEARTBEAT = "cluster-heartbeat"
+AGENT_SYNC_REQUEST = "agent-sync-request"
+AGENT_SYNC_RESPONSE = "agent-sync-response"
+CLUSTER_REGISTRATION_RESPONSE = "cluster-registration-response"
+CLUSTER_RELEASED = "cluster-released"
+
+
+def agent_sync_request() -> Dict[str, Any]:
+    return {"@type": AGENT_SYNC_REQUEST}
+
+
+def cluster_ids(message: Dict[str, Any]) -> List[str]:
+    """Returns the cluster IDs a message refers to whether ``clusters`` is a list of IDs or an object keyed by ID."""
+    return list(message.get("clusters") or [])
+
+
+def restore_from_sync(clusters: Iterable[Cluster], message: Dict[str, Any]) -> List[Cluster]:
+
+    """Restores cluster claim state from an agent-sync-response.
+
+    :argument clusters the clusters the agent holds in memory.
+    :argument message the decoded agent-sync-response message.
+
+    :return: the clusters the controller no longer knows about and which therefore need to be announced again.
+    """
+
+    known = message.get("clusters") or {}
+    forgotten = []
+    for c in clusters:
+        if c.cluster_id in known and known[c.cluster_id].get("claimStatus"):
+            try:
+                c.state = known[c.cluster_id]["claimStatus"]
+            except ValueError:
+                # A cluster released while the agent was disconnected stays released, whatever the controller says.
+                pass
+        else:
+            forgotten.append(c)
+
+    return forgotten
+
+
+def clusters_snapshot(clusters: Iterable[Cluster]) -> Dict[str, Any]:
+    return {
+        "@type": CLUSTERS_SNAPSHOT,
+        "clusters": {c.cluster_id: c.snapshot() for c in clusters}
+    }
+
+
+def encode_clusters_snapshot(clusters: Iterable[Cluster]) -> bytes:
+
+    """Encodes a clusters-snapshot from each cluster's cached snapshot fragment.
+
+    Produces the same document as ``encode(clusters_snapshot(clusters))`` but only clusters that changed since they were
+    last announced are re-encoded.
+    """
+
+    parts = [encode(c.cluster_id) + b":" + c.snapshot_fragment() for c in clusters]
+    return b'{"@type":"' + CLUSTERS_SNAPSHOT.encode("utf-8") + b'","clusters":{' + b",".join(parts) + b"}}"
+
+
+def cluster_heartbeat(clusters: Iterable[Cluster]) -> Dict[str, Any]:
+    return {
+        "@type": CLUSTER_HEARTBEAT,
+        "clusters": [c.cluster_id for c in clusters]
+    }
+
+
+class Announcer:
+
+    """Decides whether a beat carries a full clusters-snapshot or only a cluster-heartbeat.
+
+    A full snapshot is only sent the first time, after reset() (e.g. on reconnect) or when any field of an announced
+    cluster has changed since the last snapshot. Every other beat is a heartbeat carrying just the cluster IDs.
+    """
+
+    def __init__(self):
+        self._announced: Optional[Tuple] = None
+
+    def reset(self):
+        self._announced = None
+
+    def next_frame(self, clusters: Iterable[Cluster]) -> Tuple[str, bytes]:
+        """Returns the message type and encoded payload for the next beat."""
+        clusters = list(clusters)
+        fingerprint = tuple(c.fingerprint() for c in clusters)
+        if fingerprint != self._announced:
+            self._announced = fingerprint
+            return CLUSTERS_SNAPSHOT, encode_clusters_snapshot(clusters)
+
+        return CLUSTER_HEARTBEAT, encode(cluster_heartbeat(clusters))
+
+
+class TrafficCounter:
+
+    """Counts frames and payload bytes exchanged with the controller, keyed by message type."""
+
+    def __init__(self):
+        self.sent_frames = Counter()
+        self.sent_bytes = Counter()
+        self.received_frames = Counter()
+        self.received_bytes = Counter()
+
+    def record_sent(self, message_type: str, data: str):
+        self.sent_frames[message_type] += 1
+        self.sent_bytes[message_type] += payload_size(data)
+
+    def record_received(self, message_type: str, data: str):
+        self.received_frames[message_type] += 1
+        self.received_bytes[message_type] += payload_size(data)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "sent": {t: {"frames": self.sent_frames[t], "bytes": self.sent_bytes[t]} for t in self.sent_frames},
+            "received": {t: {"frames": self.received_frames[t], "bytes": self.received_bytes[t]}
+                         for t in self.received_frames},
+        }
+
+
+def payload_size(data) -> int:
+    return len(data.encode("utf-8")) if isinstance(data, str) else len(data)
@@ -0,0 +1,147 @@
+import http.client
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from kubernaut.api import ApiClient, Credentials
+from kubernaut.kubernetes import kill_process_group, resolve_tool
+from subprocess import Popen, DEVNULL
+from typing import Mapping
+
+logger = logging.getLogger("proxy")
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    """An HTTP connection to a server listening on a unix domain socket."""
+
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+
+        self.sock = sock
+
+
+class KubectlProxy:
+
+    """Runs ``kubectl proxy`` on a private unix socket, restarting it whenever it is found to have exited.
+
+    The proxy loads the kubeconfig and negotiates TLS with the API server once, then serves any number of plain HTTP
+    requests, so a request costs a local socket round trip rather than a kubectl process. Because kubectl does the
+    authentication, exec credential plugins and other kubeconfig features the agent's own API client does not
+    understand keep working.
+
+    :argument env the environment kubectl runs with, typically just KUBECONFIG.
+    :argument start_timeout seconds to wait for a newly started proxy to listen on its socket.
+    """
+
+    def __init__(self, env: Mapping[str, str] = None, start_timeout: float = 10.0):
+        self.env = dict(env or {})
+        self.start_timeout = start_timeout
+        self.restarts = 0
+        self._directory = tempfile.mkdtemp(prefix="kubernaut-proxy-")
+        self.socket_path = os.path.join(self._directory, "proxy.sock")
+        self.log_path = os.path.join(self._directory, "proxy.log")
+        self._process: Popen = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def ensure_running(self):
+        """Starts the proxy if it has not been started yet or restarts it if it has exited."""
+        with self._lock:
+            if self.running:
+                return
+
+            if self._process is not None:
+                self.restarts += 1
+                logger.warning("kubectl proxy exited with %s, restarting (restarts: %d)",
+                               self._process.returncode, self.restarts)
+
+            self._start()
+
+    def _start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        # The proxy's diagnostics go to a file rather than a pipe that nothing would drain while it runs.
+        with open(self.log_path, "wb") as log:
+            self._process = Popen([resolve_tool("kubectl"), "proxy", "--unix-socket={}".format(self.socket_path)],
+                                  stdout=DEVNULL, stderr=log, env=self.env, start_new_session=True)
+
+        # The socket file exists from the moment it is bound, which may be a little before the proxy listens on it.
+        deadline = time.monotonic() + self.start_timeout
+        while not self._listening():
+            if self._process.poll() is not None:
+                with open(self.log_path, encoding="utf-8", errors="replace") as log:
+                    raise OSError("kubectl proxy exited with {}: {}".format(
+                        self._process.returncode, log.read().strip()))
+
+            if time.monotonic() > deadline:
+                self._kill()
+                raise OSError("kubectl proxy did not listen on {} within {}s".format(
+                    self.socket_path, self.start_timeout))
+
+            time.sleep(0.01)
+
+    def _listening(self) -> bool:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def _kill(self):
+        kill_process_group(self._process)
+        self._process.wait()
+
+    def connect(self, timeout: float = None) -> UnixHTTPConnection:
+        self.ensure_running()
+        return UnixHTTPConnection(self.socket_path, timeout=timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._process is not None:
+                self._kill()
+                self._process = None
+
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+class ProxyApiClient(ApiClient):
+
+    """An ApiClient that sends its requests through a KubectlProxy instead of straight to the API server.
+
+    Connections to the proxy are pooled and kept alive like connections to the API server. A request that fails
+    because the proxy died is retried once on a new connection, which restarts the proxy.
+    """
+
+    def __init__(self, proxy: KubectlProxy, pool_size: int = 4, timeout: float = 10.0):
+        super().__init__(Credentials(server="http://localhost"), pool_size=pool_size, timeout=timeout)
+        self.proxy = proxy
+
+    def _connect(self) -> http.client.HTTPConnection:
+        self.connections_opened += 1
+        return self.proxy.connect(timeout=self.timeout)
+
+    def close(self):
+        super().close()
+        self.proxy.stop()
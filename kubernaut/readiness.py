@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+
+from kubernaut.api import ApiClient, ApiError
+from kubernaut.backoff import Backoff
+from kubernaut.model import _last_line
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("readiness")
+
+# kubectl prints one line per object so that polling does not transfer and parse the full objects.
+NODES_JSONPATH = '{range .items[*]}{.metadata.name}{" "}{.status.conditions[?(@.type=="Ready")].status}{"\\n"}{end}'
+PODS_JSONPATH = ('{range .items[*]}{.metadata.name}{" "}{.status.phase}{" "}{.status.containerStatuses[*].ready}'
+                 '{"\\n"}{end}')
+
+NOT_FOUND = "the server could not find the requested resource"
+
+# API errors that say the agent's own client may not use the API server, which kubectl may still be able to, e.g. with
+# an exec credential plugin.
+UNAUTHORIZED = (401, 403)
+
+# Pods that have finished, e.g. completed jobs or pods evicted under node pressure, which their controllers replace.
+TERMINATED_PHASES = ("Succeeded", "Failed")
+
+
+class ReadinessProbe:
+
+    """Waits until a cluster is ready to be handed to a user.
+
+    A cluster is ready when its API server reports itself ready on /readyz (or /healthz before Kubernetes 1.16), every
+    node has the Ready condition and every pod in kube-system, such as CoreDNS and Calico, is running with all of its
+    containers ready. Pods that have terminated, e.g. evicted ones, are ignored since their controllers replace them.
+    The three checks run concurrently on every poll.
+
+    Polls are spaced by ``backoff``, which is reset whenever the outcome of a poll differs from the one before. A
+    cluster that is coming up is therefore polled often while one that is stuck is polled less and less often.
+
+    :argument name the cluster, for logging.
+    :argument kubectl_handler a coroutine kubectl handler, e.g. kubectl_async(), used when there is no API client or the
+                              API server cannot be reached or refuses its credentials.
+    :argument env_kubectl the environment kubectl runs with.
+    :argument api an optional API client for the cluster.
+    :argument backoff the delays between polls.
+    :argument clock the monotonic clock used to measure the time to ready, replaceable for tests.
+    """
+
+    def __init__(self, name: str, kubectl_handler, env_kubectl: Dict[str, str], api: ApiClient = None,
+                 backoff: Backoff = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.kubectl_handler = kubectl_handler
+        self.env_kubectl = env_kubectl
+        self.api = api
+        self.backoff = backoff or Backoff(base=0.5, cap=10.0)
+        self.polls = 0
+        self.pending: Dict[str, str] = {}
+        self.time_to_ready: Optional[float] = None
+        self._clock = clock
+
+    async def wait(self) -> float:
+
+        """Polls the cluster until it is ready.
+
+        :return: the seconds it took for the cluster to become ready, also kept in ``time_to_ready``.
+        """
+
+        started = self._clock()
+        while True:
+            self.polls += 1
+            pending = await self.check()
+            if not pending:
+                break
+
+            if pending != self.pending:
+                self.backoff.reset()
+                logger.info("Cluster not ready, cluster: %s, %s", self.name,
+                            "; ".join("{}: {}".format(k, v) for k, v in sorted(pending.items())))
+
+            self.pending = pending
+            await asyncio.sleep(self.backoff.next_delay())
+
+        self.pending = {}
+        self.time_to_ready = self._clock() - started
+        return self.time_to_ready
+
+    async def check(self) -> Dict[str, str]:
+
+        """Runs every check once.
+
+        :return: why each check that did not pass failed, keyed by check; empty if the cluster is ready.
+        """
+
+        checks = [("apiserver", self._apiserver()), ("nodes", self._nodes()), ("kube-system", self._pods())]
+        outcomes = await asyncio.gather(*[c for _, c in checks], return_exceptions=True)
+
+        pending = {}
+        for (name, _), outcome in zip(checks, outcomes):
+            if isinstance(outcome, Exception):
+                pending[name] = "{}: {}".format(type(outcome).__name__, outcome)
+            elif outcome:
+                pending[name] = outcome
+
+        return pending
+
+    async def _apiserver(self) -> Optional[str]:
+        if self.api is not None:
+            try:
+                await self._api_call(self.api.health)
+                return None
+            except ApiError as e:
+                if e.status not in UNAUTHORIZED:
+                    return "{} {}: {}".format(e.status, e.reason, _last_line(e.body))
+            except OSError:
+                pass
+
+        (status, output) = await self.kubectl_handler(["get", "--raw", "/readyz"], self.env_kubectl)
+        if status != 0 and NOT_FOUND in output:
+            (status, output) = await self.kubectl_handler(["get", "--raw", "/healthz"], self.env_kubectl)
+
+        return None if status == 0 else "not ready: {}".format(_last_line(output))
+
+    async def _nodes(self) -> Optional[str]:
+        api_call = None if self.api is None else self.api.list_nodes
+        nodes = await self._list(api_call, ["get", "nodes"], NODES_JSONPATH)
+        if isinstance(nodes, dict):
+            nodes = [[n["metadata"]["name"], _ready_condition(n)] for n in nodes.get("items", [])]
+
+        if not nodes:
+            return "no nodes"
+
+        unready = [n[0] for n in nodes if n[1:] != ["True"]]
+        return "not ready: {}".format(_names(unready)) if unready else None
+
+    async def _pods(self) -> Optional[str]:
+        api_call = None if self.api is None else lambda: self.api.list_pods("kube-system")
+        pods = await self._list(api_call, ["get", "pods", "--namespace=kube-system"], PODS_JSONPATH)
+        if isinstance(pods, dict):
+            pods = [[p["metadata"]["name"], p.get("status", {}).get("phase", "")] + _container_readiness(p)
+                    for p in pods.get("items", [])]
+
+        pods = [p for p in pods if p[1] not in TERMINATED_PHASES]
+        if not pods:
+            return "no pods"
+
+        unready = [p[0] for p in pods if not _pod_ready(p[1], p[2:])]
+        return "not ready: {}".format(_names(unready)) if unready else None
+
+    async def _list(self, api_call, args: List[str], jsonpath: str) -> Any:
+        """Lists objects through the API, returning its response, or through kubectl, returning each line's fields."""
+        if api_call is not None:
+            try:
+                return await self._api_call(api_call)
+            except (ApiError, OSError):
+                pass
+
+        (status, output) = await self.kubectl_handler(args + ["--output=jsonpath={}".format(jsonpath)],
+                                                      self.env_kubectl)
+        if status != 0:
+            raise ValueError("kubectl {} exited {}: {}".format(" ".join(args[:2]), status, _last_line(output)))
+
+        return [line.split() for line in output.splitlines() if line.strip()]
+
+    async def _api_call(self, call):
+        return await asyncio.get_event_loop().run_in_executor(None, call)
+
+
+def _ready_condition(node: Dict[str, Any]) -> str:
+    conditions = node.get("status", {}).get("conditions") or []
+    return next((c.get("status", "") for c in conditions if c.get("type") == "Ready"), "")
+
+
+def _container_readiness(pod: Dict[str, Any]) -> List[str]:
+    return ["true" if s.get("ready") else "false" for s in pod.get("status", {}).get("containerStatuses") or []]
+
+
+def _pod_ready(phase: str, containers: List[str]) -> bool:
+    return phase == "Running" and bool(containers) and all(c == "true" for c in containers)
+
+
+def _names(names: List[str], shown: int = 5) -> str:
+    more = len(names) - shown
+    return ", ".join(names[:shown]) + (" and {} more".format(more) if more > 0 else "")
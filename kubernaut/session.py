@@ -0,0 +1,138 @@
+import asyncio
+import inspect
+import logging
+
+from kubernaut.compression import COMPRESSED_PAYLOAD, CompressionStats, PayloadEnvelope, unwrap_payload
+from kubernaut.protocol import TrafficCounter, payload_size
+from kubernaut.util import encode, unjsonify
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger("session")
+
+Handler = Callable[["Session", Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class Session:
+
+    """A full-duplex CAP session over a single websocket.
+
+    Inbound frames are read by a dedicated reader task and dispatched by their ``@type`` to a handler, while outbound
+    messages are put on a queue drained by a dedicated writer task. Neither direction waits on the other so a message
+    pushed by the controller is handled as soon as it arrives and a slow or missing reply never holds up a heartbeat.
+
+    :argument websocket an open websocket connection.
+    :argument handlers a dispatch table of message type to handler. Handlers are called with the session and the decoded
+                       message and may be plain functions or coroutines.
+    :argument traffic a counter that records every frame sent and received.
+    :argument max_outbound the maximum number of messages waiting to be written before new ones are dropped.
+    :argument envelope if given, large outbound frames are wrapped in a compressed-payload message.
+    :argument compression records compressed and uncompressed byte counts for this connection.
+    """
+
+    def __init__(self,
+                 websocket,
+                 handlers: Dict[str, Handler],
+                 traffic: TrafficCounter = None,
+                 max_outbound: int = 64,
+                 envelope: PayloadEnvelope = None,
+                 compression: CompressionStats = None):
+
+        self.websocket = websocket
+        self.handlers = handlers
+        self.traffic = traffic or TrafficCounter()
+        self.envelope = envelope
+        self.compression = compression or CompressionStats()
+        self.outbound = asyncio.Queue(maxsize=max_outbound)
+        self.synced = asyncio.Event()
+        self._stopped = asyncio.Event()
+
+    def send(self, message: Dict[str, Any]):
+        """Queues a message for the writer task without waiting for it to be written."""
+        self.send_encoded(message["@type"], encode(message))
+
+    def send_encoded(self, message_type: str, data: bytes):
+        """Queues an already encoded message for the writer task."""
+        try:
+            self.outbound.put_nowait((message_type, data))
+        except asyncio.QueueFull:
+            logger.warning("Outbound queue full, dropping message: %s", message_type)
+
+    def stop(self):
+        """Ends the session once the current handler returns."""
+        self._stopped.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    async def run(self, *workers: Awaitable[None]):
+
+        """Runs the reader and writer tasks, plus any extra workers, until the session is stopped.
+
+        If any task fails (e.g. the connection is closed) the others are cancelled and the error is raised to the
+        caller.
+        """
+
+        tasks = [asyncio.ensure_future(c) for c in (self._read(), self._write(), self._stopped.wait()) + workers]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for t in done:
+            if not t.cancelled() and t.exception():
+                raise t.exception()
+
+    async def _read(self):
+        while True:
+            data = await self.websocket.recv()
+            wire_size = payload_size(data)
+            try:
+                (data, message) = _decode(data)
+            except Exception as e:
+                # One malformed frame from the controller must not end a session that is otherwise healthy.
+                logger.warning("Dropping malformed frame of %d bytes: %s: %s", wire_size, type(e).__name__, e)
+                continue
+
+            message_type = message.get("@type")
+            self.traffic.record_received(message_type, data)
+            if not self.compression.deflate:
+                self.compression.record_received(payload_size(data), wire_size)
+
+            handler = self.handlers.get(message_type)
+            if handler is None:
+                logger.warning("Received unknown message type: %s", message_type)
+                continue
+
+            try:
+                result = handler(self, message)
+                if inspect.isawaitable(result):
+                    await result
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed handling message type: %s", message_type)
+
+    async def _write(self):
+        while True:
+            message_type, data = await self.outbound.get()
+            wire = self.envelope.wrap(data) if self.envelope else data
+            await self.websocket.send(wire.decode("utf-8"))
+            self.traffic.record_sent(message_type, data)
+            if not self.compression.deflate:
+                self.compression.record_sent(len(data), len(wire))
+
+
+def _decode(data: Union[str, bytes]) -> Tuple[Union[str, bytes], Dict[str, Any]]:
+    """Decodes a frame, unwrapping a compressed payload, into the original frame and the message it carries."""
+    message = unjsonify(data)
+    if isinstance(message, dict) and message.get("@type") == COMPRESSED_PAYLOAD:
+        data = unwrap_payload(message)
+        message = unjsonify(data)
+
+    if not isinstance(message, dict):
+        raise ValueError("expected a JSON object, got {}".format(type(message).__name__))
+
+    return data, message
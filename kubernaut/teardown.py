@@ -0,0 +1,268 @@
+"""Teardown pipelines: named stages with dependencies, per-stage timeouts and timing.
+
+Usage: python -m kubernaut.teardown [--nodes 3] [--parallelism 4] [--drain-seconds 2] [--delete-seconds 0.5]
+                                    [--reset-seconds 5]
+
+Runs a cluster shutdown against simulated kubectl, kubeadm and systemctl handlers and prints how long each stage took
+and the critical path from release to poweroff. Nothing is drained, deleted, reset or powered off.
+"""
+
+import argparse
+import asyncio
+import logging
+
+from kubernaut.api import ApiClient, ApiError
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("teardown")
+
+PENDING = "pending"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMED_OUT = "timed-out"
+
+
+class Stage:
+
+    """A named step of a teardown pipeline.
+
+    :argument name the name of the stage, unique within its pipeline.
+    :argument run a coroutine function doing the work of the stage.
+    :argument after the names of the stages that must finish, successfully or not, before this stage starts.
+    :argument timeout seconds the stage may run before it is cancelled, or None to let it run.
+    """
+
+    def __init__(self, name: str, run: Callable[[], Awaitable[Any]], after: Iterable[str] = (), timeout: float = None):
+        self.name = name
+        self.run = run
+        self.after = list(after)
+        self.timeout = timeout
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+    def __repr__(self):
+        return "Stage({}, status={}, duration={})".format(self.name, self.status, self.duration)
+
+
+class Pipeline:
+
+    """Runs stages as soon as the stages they depend on have finished, so independent stages overlap.
+
+    A failed or timed out stage does not stop the stages that depend on it: a teardown that cannot drain a node must
+    still power off the host. Times are recorded in seconds since the pipeline started.
+
+    :argument stages the stages. Dependencies must name stages of the pipeline and must not form a cycle.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError("Duplicate teardown stage: {}".format(stage.name))
+
+            self.stages[stage.name] = stage
+
+        for stage in stages:
+            for dependency in stage.after:
+                if dependency not in self.stages:
+                    raise ValueError("Teardown stage {} depends on unknown stage {}".format(stage.name, dependency))
+
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError("Teardown stages form a cycle through {}".format(name))
+
+            visiting.add(name)
+            for dependency in self.stages[name].after:
+                visit(dependency)
+
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+
+        return order
+
+    async def run(self) -> Dict[str, Stage]:
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_stage(stage: Stage):
+            dependencies = [tasks[name] for name in stage.after]
+            if dependencies:
+                await asyncio.wait(dependencies)
+
+            stage.started = loop.time() - started
+            try:
+                await asyncio.wait_for(stage.run(), timeout=stage.timeout)
+                stage.status = SUCCEEDED
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                stage.status = TIMED_OUT
+                stage.error = "timed out after {:g}s".format(stage.timeout)
+            except Exception as e:
+                stage.status = FAILED
+                stage.error = "{}: {}".format(type(e).__name__, e)
+            finally:
+                stage.finished = loop.time() - started
+
+            logger.info("Teardown stage %s %s in %.3fs%s", stage.name, stage.status, stage.duration,
+                        ": " + stage.error if stage.error else "")
+
+        # Dependencies come first in topological order so every task a stage waits on already exists.
+        for name in self.order:
+            tasks[name] = asyncio.ensure_future(run_stage(self.stages[name]))
+
+        await asyncio.wait(list(tasks.values()))
+        return self.stages
+
+    def critical_path(self) -> List[Stage]:
+        """Returns the chain of stages that determined when the pipeline finished, first stage first."""
+        finished = [s for s in self.stages.values() if s.finished is not None]
+        if not finished:
+            return []
+
+        path = [max(finished, key=lambda s: s.finished)]
+        while path[-1].after:
+            path.append(max((self.stages[name] for name in path[-1].after), key=lambda s: s.finished or 0.0))
+
+        return list(reversed(path))
+
+    def report(self) -> str:
+        row = "{{:<{}}} {{:<10}} {{:>9}} {{:>9}}  {{}}".format(max(len(name) for name in ["stage"] + self.order))
+        lines = [row.format("stage", "status", "start", "duration", "after")]
+        for name in self.order:
+            stage = self.stages[name]
+            lines.append(row.format(
+                stage.name, stage.status, _seconds(stage.started), _seconds(stage.duration), ", ".join(stage.after)))
+
+        path = self.critical_path()
+        lines.append("critical path: {} ({})".format(
+            " -> ".join(s.name for s in path), _seconds(path[-1].finished if path else None)))
+        return "\n".join(lines)
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "-" if value is None else "{:.3f}s".format(value)
+
+
+class DryRun:
+
+    """Stand-ins for the kubectl, kubeadm and system handlers of Cluster.shutdown that only pretend to tear down.
+
+    Read-only kubectl commands (``get``) are passed to ``kubectl_handler`` when one is given, so a dry run against a
+    real cluster plans with its real nodes; otherwise ``nodes`` is reported. Every other command is recorded and takes
+    the simulated time configured for its verb.
+
+    Likewise ``api``, the cluster's API client, is only used to list nodes: pass Cluster.shutdown the read-only
+    ``DryRun.api`` in its place. Deleting through it is refused so that node deletions fall back to the simulated
+    kubectl.
+
+    :argument nodes the node names reported when there is no real kubectl handler.
+    :argument durations simulated seconds per command verb (drain, delete, reset, systemctl).
+    :argument kubectl_handler an optional real kubectl handler used for read-only commands.
+    :argument api an optional real API client used for read-only requests.
+    """
+
+    def __init__(self, nodes: List[str] = None, durations: Dict[str, float] = None, kubectl_handler=None,
+                 api: ApiClient = None):
+        self.nodes = list(nodes or [])
+        self.durations = dict(durations or {})
+        self.kubectl_handler = kubectl_handler
+        self.api = None if api is None else ReadOnlyApi(api)
+        self.commands: List[Any] = []
+
+    async def kubectl(self, args: List[str], env: Dict[str, str] = None, timeout: float = None):
+        if args[0] == "get":
+            if self.kubectl_handler is not None:
+                result = self.kubectl_handler(args, env)
+                return (await result) if asyncio.iscoroutine(result) else result
+
+            return 0, " ".join(self.nodes)
+
+        return await self._pretend(args[0], args)
+
+    async def kubeadm(self, args: List[str], env: Dict[str, str] = None):
+        return await self._pretend(args[0], args)
+
+    async def system(self, command: str) -> int:
+        await self._pretend(command.split()[0], command)
+        return 0
+
+    async def _pretend(self, verb: str, command):
+        self.commands.append(command)
+        await asyncio.sleep(self.durations.get(verb, 0.0))
+        return 0, ""
+
+
+class ReadOnlyApi:
+
+    """Passes reads to an API client and refuses, with a 405 ApiError, anything that would change the cluster."""
+
+    def __init__(self, api: ApiClient):
+        self._api = api
+
+    def get(self, path: str) -> Dict[str, Any]:
+        return self._api.get(path)
+
+    def list_nodes(self) -> Dict[str, Any]:
+        return self._api.list_nodes()
+
+    def delete(self, path: str) -> Dict[str, Any]:
+        raise ApiError(405, "Method Not Allowed", "dry run, not deleting {}".format(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", default=3, type=int, help="number of simulated nodes")
+    parser.add_argument("--parallelism", default=4, type=int, help="batches drained and deleted concurrently")
+    parser.add_argument("--batch-size", default=None, type=int, help="most nodes per kubectl call")
+    parser.add_argument("--drain-seconds", default=2.0, type=float, help="simulated duration of a drain")
+    parser.add_argument("--delete-seconds", default=0.5, type=float, help="simulated duration of a delete")
+    parser.add_argument("--reset-seconds", default=5.0, type=float, help="simulated duration of kubeadm reset")
+    args = parser.parse_args()
+
+    # Imported here as the model builds its shutdown from this module's pipeline.
+    from kubernaut.model import Cluster
+
+    dry_run = DryRun(
+        nodes=["node-{}".format(n) for n in range(args.nodes)],
+        durations={"drain": args.drain_seconds, "delete": args.delete_seconds, "reset": args.reset_seconds}
+    )
+    cluster = Cluster(cluster_id="dry-run", state="RELEASED", kubeconfig="", token="")
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(cluster.shutdown(
+        kubectl_handler=dry_run.kubectl,
+        kubeadm_handler=dry_run.kubeadm,
+        system_handler=dry_run.system,
+        parallelism=args.parallelism,
+        batch_size=args.batch_size
+    ))
+
+    print(cluster.teardown.report())
+    for result in results:
+        print("node {}: drain {:.3f}s, delete {:.3f}s".format(result.name, result.drain_seconds, result.delete_seconds))
+
+    for command in dry_run.commands:
+        print(" ".join(command) if isinstance(command, list) else command)
+
+
+if __name__ == "__main__":
+    main()
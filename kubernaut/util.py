@@ -1,6 +1,17 @@
 import json
 
-from typing import Any, Dict, TypeVar
+from abc import ABC, abstractmethod
+from typing import Any, Dict, TypeVar, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
 
 T = TypeVar('T')
 
@@ -19,9 +30,101 @@ def require_not_empty(value: T, msg="Value cannot be empty") -> T:
         return value
 
 
-def jsonify(obj: Any, indent=True) -> str:
-    return json.dumps(require(obj), indent=indent)
+def jsonify(obj: Any, indent=None) -> str:
+    if indent:
+        return json.dumps(require(obj), indent=indent)
+
+    return json.dumps(require(obj), separators=(",", ":"))
+
+
+def unjsonify(data: Union[str, bytes]) -> Dict[str, Any]:
+    return codec.decode(data)
+
+
+class Codec(ABC):
+
+    """Encodes messages for the wire as compact UTF-8 JSON bytes and decodes them again."""
+
+    name = None
+
+    @abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: Union[str, bytes]) -> Any:
+        pass
+
+
+class JsonCodec(Codec):
+
+    name = "json"
+
+    def encode(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+
+    name = "orjson"
+
+    def encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+class UjsonCodec(Codec):
+
+    name = "ujson"
+
+    def encode(self, obj: Any) -> bytes:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return ujson.loads(data)
+
+
+def available_codecs() -> Dict[str, Codec]:
+    """Returns the installed codecs, fastest first."""
+    codecs = {}
+    if orjson is not None:
+        codecs[OrjsonCodec.name] = OrjsonCodec()
+    if ujson is not None:
+        codecs[UjsonCodec.name] = UjsonCodec()
+
+    codecs[JsonCodec.name] = JsonCodec()
+    return codecs
+
+
+def get_codec(name: str = "auto") -> Codec:
+    codecs = available_codecs()
+    if name == "auto":
+        return next(iter(codecs.values()))
+
+    if name not in codecs:
+        raise ValueError("JSON codec '{}' is not installed (available: {})".format(name, ", ".join(codecs)))
+
+    return codecs[name]
+
+
+def set_codec(name: str = "auto") -> Codec:
+    global codec
+    codec = get_codec(name)
+    return codec
+
+
+def encode(obj: Any) -> bytes:
+    return codec.encode(require(obj))
+
+
+def decode(data: Union[str, bytes]) -> Any:
+    return codec.decode(data)
 
 
-def unjsonify(data: str) -> Dict[str, Any]:
-    return json.loads(data)
+# Not annotated: Python < 3.8 rejects an annotated module global that set_codec() rebinds with ``global``.
+codec = get_codec()  # type: Codec
@@ -6,13 +6,17 @@ setup(
     name="kubernaut-agent",
     version=versioneer.get_version(),
     cmdclass=versioneer.get_cmdclass(),
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks", "benchmarks.*"]),
     include_package_data=True,
     install_requires=[
         "autobahn",
         "click",
+        "pyyaml",
         "websockets"
     ],
+    extras_require={
+        "speedups": ["orjson"]
+    },
     entry_points="""
         [console_scripts]
         kubernaut-agent=kubernaut.cli:start_agent
@@ -0,0 +1,23 @@
+import asyncio
+import pytest
+
+
+@pytest.fixture
+def run():
+
+    """Runs coroutines to completion on an event loop of the test's own.
+
+    The loop is also made the current event loop, which subprocesses need on Python 3.6 and 3.7 for their child watcher
+    to be attached to it. Each coroutine gets ``timeout`` seconds so that a hung test fails instead of stalling the run.
+    """
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def run_until_complete(coro, timeout: float = 10.0):
+        return loop.run_until_complete(asyncio.wait_for(coro, timeout=timeout))
+
+    yield run_until_complete
+
+    loop.close()
+    asyncio.set_event_loop(None)
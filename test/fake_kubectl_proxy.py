@@ -0,0 +1,67 @@
+"""A stand-in for ``kubectl proxy --unix-socket=PATH`` that answers a few Kubernetes API requests.
+
+Each response reports the process ID of the proxy and the number of the connection it was served on, so tests can
+tell whether a connection was reused and whether the proxy was restarted.
+"""
+
+import itertools
+import json
+import os
+import socketserver
+import sys
+
+from http.server import BaseHTTPRequestHandler
+
+RESOURCES = {
+    "/api/v1/namespaces/default": {"metadata": {"name": "default", "uid": "FAKE-UID"}},
+    "/api/v1/nodes": {"items": [{"metadata": {"name": "node-0"}}]},
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.connection_number = next(self.server.connection_numbers)
+
+    def do_GET(self):
+        if self.path in RESOURCES:
+            self.reply(200, RESOURCES[self.path])
+        else:
+            self.reply(404, {"reason": "NotFound"})
+
+    def do_DELETE(self):
+        self.reply(200, {})
+
+    def reply(self, status, body):
+        body = dict(body, proxy={"pid": os.getpid(), "connection": self.connection_number})
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+    connection_numbers = itertools.count(1)
+
+
+def main():
+    if sys.argv[1:2] != ["proxy"]:
+        sys.stderr.write("fake kubectl only supports proxy\n")
+        sys.exit(1)
+
+    path = next(a.split("=", 1)[1] for a in sys.argv[2:] if a.startswith("--unix-socket="))
+    Server(path, Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
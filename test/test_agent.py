@@ -1,3 +1,283 @@
+import asyncio
+import click
+import kubernaut.agent as agent
+import pytest
+import websockets
+
+from benchmarks.controller import FakeController
+from benchmarks.payloads import make_clusters
+from kubernaut.backoff import Backoff
+from kubernaut.endpoints import EndpointPool
+from kubernaut.heartbeat import Heartbeat
+from kubernaut.model import AgentState, Baseline, ClusterRegistry, ClusterState
+from kubernaut.protocol import Announcer
+from test_model import BASELINE, FakeCluster
+from test_readiness import FakeKubectl
+
+
+@pytest.fixture
+def agent_globals(monkeypatch):
+    """Gives every test a fresh copy of the agent's module state."""
+    monkeypatch.setattr(agent, "agent_id", "00000000-0000-0000-0000-000000000000")
+    monkeypatch.setattr(agent, "agent_state", AgentState.STARTING)
+    monkeypatch.setattr(agent, "clusters", ClusterRegistry())
+    monkeypatch.setattr(agent, "cluster_shutdown_enabled", False)
+    monkeypatch.setattr(agent, "release_action", "shutdown")
+    monkeypatch.setattr(agent, "readiness_gate", False)
+    monkeypatch.setattr(agent, "current_session", None)
+    for name in ["teardowns", "recycles", "baseline_captures", "readiness_probes"]:
+        monkeypatch.setattr(agent, name, {})
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.synced = asyncio.Event()
+        self.stopped = False
+        self.sent = []
+
+    def send_encoded(self, message_type, data):
+        self.sent.append(message_type)
+
+    def stop(self):
+        self.stopped = True
+
+
+async def wait_until(condition, interval: float = 0.01):
+    while not condition():
+        await asyncio.sleep(interval)
+
+
+@pytest.mark.parametrize("option, value", [
+    ("--heartbeat-interval", "0"),
+    ("--heartbeat-interval", "-1"),
+    ("--heartbeat-jitter", "0.6"),
+    ("--heartbeat-jitter", "-0.1"),
+    ("--reconnect-max-delay", "0.1"),
+    ("--controller-probe-interval", "0"),
+    ("--controller-probe-interval", "-5"),
+    ("--shutdown-node-timeout", "-1"),
+    ("--shutdown-budget", "-1"),
+    ("--readiness-max-delay", "0.1"),
+    ("--heartbeat-interval", "soon"),
+])
+def test_agent_rejects_out_of_range_timings(tmpdir, option, value):
+    with pytest.raises(click.BadParameter) as e:
+        agent.run_agent.make_context("run_agent", [option, value, str(tmpdir), "TOKEN"])
+
+    assert e.value.param.opts == [option]
+
+
+def test_agent_parses_service_invocation(tmpdir, monkeypatch):
+    # packer/kubernautlet.service: ExecStart=/usr/local/bin/kubernautlet /tmp/kubeconfig_ip, token in the environment.
+    kubeconfig = tmpdir.join("kubeconfig_ip")
+    kubeconfig.write("")
+    monkeypatch.setenv("KUBERNAUT_CLUSTER_GROUP_TOKEN", "TOKEN")
+
+    context = agent.run_agent.make_context("kubernautlet", [str(kubeconfig)])
+    assert context.params["kubeconfig_file"] == str(kubeconfig)
+    assert context.params["extra_kubeconfigs"] == ()
+    assert context.params["token"] == "TOKEN"
+
+
+def test_agent_takes_extra_kubeconfigs_as_options(tmpdir):
+    first, pool = tmpdir.join("first"), tmpdir.mkdir("pool")
+    first.write("")
+
+    context = agent.run_agent.make_context("kubernautlet", ["--kubeconfig", str(pool), str(first), "TOKEN"])
+    assert context.params["kubeconfig_file"] == str(first)
+    assert context.params["extra_kubeconfigs"] == (str(pool),)
+    assert context.params["token"] == "TOKEN"
+
+
+def test_float_range_accepts_bounds():
+    assert agent.FloatRange(0, 0.5).convert("0.5", None, None) == 0.5
+    assert agent.FloatRange(min=0.25).convert("0.25", None, None) == 0.25
+    assert agent.FloatRange(min=0, min_open=True).convert("0.01", None, None) == 0.01
+
+
+def test_agent_resyncs_after_controller_closes_connection(run, agent_globals):
+    controller = FakeController(ping_interval=0)
+    agent.clusters.add(make_clusters(1, state="UNREGISTERED")[0])
+
+    async def scenario():
+        await controller.start()
+        task = asyncio.ensure_future(agent._run_agent(
+            EndpointPool([controller.url]),
+            cluster_shutdown=False,
+            heartbeat=Heartbeat(interval=0.02, jitter=0.0),
+            backoff=Backoff(base=0.01, cap=0.02)
+        ))
+
+        try:
+            await wait_until(lambda: controller.frames["cluster-heartbeat"] > 0)
+            snapshots = controller.frames["clusters-snapshot"]
+            await controller.disconnect_all()
+
+            await wait_until(lambda: controller.frames["agent-sync-request"] == 2)
+            await wait_until(lambda: controller.frames["clusters-snapshot"] > snapshots)
+            assert agent.agent_state is AgentState.CONNECTED
+
+            await controller.release_all()
+            await task
+        finally:
+            task.cancel()
+            await controller.stop()
+
+    run(scenario())
+
+    assert agent.agent_state is AgentState.SHUTDOWN
+    assert all(c.state is ClusterState.RELEASED for c in agent.clusters)
+
+
+def test_agent_backs_off_from_controller_that_drops_connections(run, agent_globals):
+    connections = []
+    delays = []
+
+    class RecordingBackoff(Backoff):
+        def next_delay(self):
+            delays.append(super().next_delay())
+            return delays[-1]
+
+    async def accept_then_close(websocket, path=None):
+        connections.append(websocket)
+
+    agent.clusters.add(make_clusters(1, state="UNREGISTERED")[0])
+
+    async def scenario():
+        server = await websockets.serve(accept_then_close, "127.0.0.1", 0)
+        url = "ws://127.0.0.1:{}/ws/kapv1".format(server.sockets[0].getsockname()[1])
+        task = asyncio.ensure_future(agent._run_agent(
+            EndpointPool([url]),
+            cluster_shutdown=False,
+            heartbeat=Heartbeat(interval=0.02, jitter=0.0),
+            backoff=RecordingBackoff(base=0.01, cap=1.0)
+        ))
+
+        try:
+            await wait_until(lambda: len(delays) >= 4)
+        finally:
+            task.cancel()
+            server.close()
+            await server.wait_closed()
+
+    run(scenario())
+
+    assert len(connections) >= 4
+    assert delays == sorted(delays) and delays[3] > 2 * delays[0]
+
+
+def test_agent_recycles_released_cluster_to_its_baseline(run, agent_globals, monkeypatch):
+    fake = FakeCluster(**BASELINE)
+    monkeypatch.setattr(agent, "kubectl_async", fake.kubectl)
+    monkeypatch.setattr(agent, "release_action", "recycle")
+    cluster = agent.clusters.add(make_clusters(1, state="UNREGISTERED")[0])
+    session = FakeSession()
+    agent.current_session = session
+
+    async def scenario():
+        agent._transition(cluster, ClusterState.UNCLAIMED)
+        await agent.baseline_captures[cluster.cluster_id]
+        assert cluster.baseline == Baseline(BASELINE)
+
+        fake.objects["namespaces"].append("user-app")
+        agent._transition(cluster, ClusterState.CLAIMED)
+        agent._transition(cluster, ClusterState.RELEASED)
+        agent._update_agent_state(session)
+        assert not session.stopped
+
+        await agent.recycles[cluster.cluster_id]
+
+    run(scenario())
+
+    assert cluster.state is ClusterState.UNREGISTERED
+    assert fake.objects["namespaces"] == BASELINE["namespaces"]
+    assert cluster.baseline is not None
+    assert not session.stopped and agent.recycles == {}
+
+
+def test_agent_shuts_down_cluster_that_fails_recycling(run, agent_globals, monkeypatch):
+    fake = FakeCluster(**BASELINE)
+    monkeypatch.setattr(agent, "kubectl_async", fake.kubectl)
+    monkeypatch.setattr(agent, "release_action", "recycle")
+    cluster = agent.clusters.add(make_clusters(1, state="UNCLAIMED")[0])
+    cluster.baseline = Baseline(BASELINE)
+    session = FakeSession()
+    agent.current_session = session
+
+    async def scenario():
+        fake.objects["namespaces"].remove("kube-system")
+        agent._transition(cluster, ClusterState.RELEASED)
+        agent._update_agent_state(session)
+        await agent.recycles[cluster.cluster_id]
+
+    run(scenario())
+
+    assert cluster.state is ClusterState.RELEASED
+    assert cluster.baseline is None
+    assert session.stopped and agent.agent_state is AgentState.SHUTDOWN
+
+
+def test_agent_dry_run_shutdown_deletes_nothing_through_the_api(run, agent_globals, monkeypatch):
+    class FakeApi:
+        def __init__(self):
+            self.deleted = []
+
+        def list_nodes(self):
+            return {"items": [{"metadata": {"name": "node-0"}}, {"metadata": {"name": "node-1"}}]}
+
+        def delete(self, path):
+            self.deleted.append(path)
+            return {}
+
+    executed = []
+
+    async def real_handler(*args, **kwargs):
+        executed.append(args)
+        return 0, ""
+
+    for name in ["kubectl_async", "kubeadm_async", "system_async"]:
+        monkeypatch.setattr(agent, name, real_handler)
+    monkeypatch.setattr(agent, "shutdown_dry_run", True)
+    cluster = agent.clusters.add(make_clusters(1, state="RELEASED")[0])
+    cluster.api = FakeApi()
+
+    run(agent._shutdown_cluster(cluster, reset_host=True))
+
+    assert cluster.api.deleted == [] and executed == []
+    assert all(s.status == "succeeded" for s in cluster.teardown.stages.values())
+
+
+def test_agent_hides_clusters_until_ready(run, agent_globals, monkeypatch):
+    kubectl = FakeKubectl(nodes="node-0 False\n")
+    monkeypatch.setattr(agent, "kubectl_async", kubectl)
+    monkeypatch.setattr(agent, "readiness_gate", True)
+    cluster = agent.clusters.add(make_clusters(1, state="UNREGISTERED")[0])
+    session = FakeSession()
+    session.synced.set()
+
+    async def scenario():
+        agent._probe_readiness(cluster)
+        beats = asyncio.ensure_future(
+            agent._send_heartbeats(session, Heartbeat(interval=0.02, jitter=0.0), Announcer(), Backoff()))
+        try:
+            await wait_until(lambda: len(kubectl.calls) >= 3)
+            await asyncio.sleep(0.1)
+            assert not cluster.ready
+            assert session.sent == []
+
+            kubectl.nodes = "node-0 True\n"
+            await wait_until(lambda: session.sent)
+        finally:
+            beats.cancel()
+
+    run(scenario())
+
+    assert cluster.ready
+    assert agent.readiness_probes == {}
+    assert session.sent[0] == "clusters-snapshot"
+
+
 # import pytest
 #
 # from kubernaut.agent_original import *
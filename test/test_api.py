@@ -0,0 +1,197 @@
+import base64
+import json
+import kubernaut.api
+import os
+import pytest
+import shutil
+import ssl
+import subprocess
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from kubernaut.api import ApiClient, ApiError, load_credentials
+from kubernaut.kubeconfig import _materialize
+from kubernaut.kubernetes import discover_cluster_id
+from pathlib import Path
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, self.headers.get("Authorization")))
+        if self.path == "/api/v1/namespaces/default":
+            self.reply(200, {"metadata": {"name": "default", "uid": "FAKE-UID"}})
+        elif self.path == "/api/v1/nodes":
+            self.reply(200, {"items": [{"metadata": {"name": "node-0"}}, {"metadata": {"name": "node-1"}}]})
+        elif self.path == "/healthz":
+            self.reply(200, "ok")
+        else:
+            self.reply(404, {"reason": "NotFound"})
+
+    def do_DELETE(self):
+        self.server.requests.append((self.command, self.path, self.headers.get("Authorization")))
+        self.reply(200, {})
+
+    def reply(self, status, body):
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if isinstance(body, str) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeApiServer(HTTPServer):
+
+    def __init__(self, context: ssl.SSLContext):
+        super().__init__(("127.0.0.1", 0), FakeApiHandler)
+        self.context = context
+        self.requests = []
+        self.connections = 0
+
+    def get_request(self):
+        sock, address = super().get_request()
+        self.connections += 1
+        return self.context.wrap_socket(sock, server_side=True), address
+
+
+@pytest.fixture
+def certificate(tmpdir):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is not installed")
+
+    cert = Path(tmpdir) / "server.crt"
+    key = Path(tmpdir) / "server.key"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", str(key), "-out", str(cert)],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+@pytest.fixture
+def api_server(certificate):
+    cert, key = certificate
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(str(cert), str(key))
+    context.load_verify_locations(str(cert))
+    context.verify_mode = ssl.CERT_OPTIONAL
+
+    server = FakeApiServer(context)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def b64(path: Path) -> str:
+    return base64.b64encode(path.read_bytes()).decode("ascii")
+
+
+def make_kubeconfig(server: str, ca: Path, user: str) -> str:
+    return """
+apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: {ca}
+    server: {server}
+  name: kubernetes
+contexts:
+- context:
+    cluster: kubernetes
+    user: admin
+  name: admin@kubernetes
+current-context: admin@kubernetes
+kind: Config
+users:
+- name: admin
+  user:
+{user}
+""".format(ca=b64(ca), server=server, user=user)
+
+
+def test_load_credentials_reads_files_and_data(tmpdir, certificate):
+    cert, key = certificate
+    token_file = Path(tmpdir) / "token"
+    token_file.write_text("FILE-TOKEN\n")
+
+    credentials = load_credentials(make_kubeconfig(
+        "https://127.0.0.1:6443", cert,
+        "    client-certificate: {}\n    client-key-data: {}\n    tokenFile: {}".format(cert, b64(key), token_file)
+    ))
+
+    assert credentials.server == "https://127.0.0.1:6443"
+    assert credentials.ca_data == cert.read_bytes()
+    assert credentials.client_cert_data == cert.read_bytes()
+    assert credentials.client_key_data == key.read_bytes()
+    assert credentials.token == "FILE-TOKEN"
+
+    with pytest.raises(ValueError):
+        load_credentials(make_kubeconfig("https://127.0.0.1:6443", cert, "    token: T"), context="missing")
+
+
+def test_api_client_token_auth_reuses_connection(api_server, certificate):
+    cert, _ = certificate
+    server = "https://127.0.0.1:{}".format(api_server.server_address[1])
+    client = ApiClient.from_kubeconfig(make_kubeconfig(server, cert, "    token: FAKE-TOKEN"))
+
+    assert discover_cluster_id(namespace="default", client=client) == "FAKE-UID"
+    assert [n["metadata"]["name"] for n in client.list_nodes()["items"]] == ["node-0", "node-1"]
+    client.delete("/api/v1/nodes/node-0")
+
+    with pytest.raises(ApiError) as e:
+        client.get("/api/v1/namespaces/missing")
+    assert e.value.status == 404
+
+    assert [r[2] for r in api_server.requests] == ["Bearer FAKE-TOKEN"] * 4
+    assert client.connections_opened == 1
+    assert api_server.connections == 1
+    client.close()
+
+
+def test_api_client_client_certificate_auth(api_server, certificate, monkeypatch):
+    materialized = []
+
+    def materialize(raw, name="kubeconfig"):
+        (path, remove) = _materialize(raw, name)
+        entry = [name, path, True]
+        materialized.append(entry)
+
+        def removed():
+            remove()
+            entry[2] = False
+
+        return path, removed
+
+    monkeypatch.setattr(kubernaut.api, "_materialize", materialize)
+
+    cert, key = certificate
+    server = "https://127.0.0.1:{}".format(api_server.server_address[1])
+    user = "    client-certificate-data: {}\n    client-key-data: {}".format(b64(cert), b64(key))
+    client = ApiClient.from_kubeconfig(make_kubeconfig(server, cert, user))
+
+    # The client's key is loaded from memory and does not outlive loading it.
+    assert [m[0] for m in materialized] == ["client-cert", "client-key"]
+    assert not any(m[2] for m in materialized)
+    if hasattr(os, "memfd_create"):
+        assert all(m[1].startswith("/proc/") for m in materialized)
+
+    assert client.get_namespace("default")["metadata"]["uid"] == "FAKE-UID"
+    assert api_server.requests == [("GET", "/api/v1/namespaces/default", None)]
+    client.close()
+
+
+def test_api_client_health_falls_back_to_healthz(api_server, certificate):
+    cert, _ = certificate
+    server = "https://127.0.0.1:{}".format(api_server.server_address[1])
+    client = ApiClient.from_kubeconfig(make_kubeconfig(server, cert, "    token: T"))
+
+    assert client.health() == "ok"
+    assert [r[1] for r in api_server.requests] == ["/readyz", "/healthz"]
+    assert client.connections_opened == 1
+    client.close()
@@ -0,0 +1,35 @@
+import pytest
+import random
+
+from kubernaut.backoff import Backoff
+
+
+def test_backoff_grows_exponentially_within_jitter_bounds():
+    backoff = Backoff(base=0.25, factor=2.0, cap=30.0, rng=random.Random(7))
+
+    for ceiling in [0.25, 0.5, 1.0, 2.0, 4.0]:
+        delay = backoff.next_delay()
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_backoff_is_capped():
+    backoff = Backoff(base=1.0, factor=10.0, cap=5.0)
+
+    delays = [backoff.next_delay() for _ in range(2000)]
+    assert max(delays) <= 5.0
+    assert min(delays[2:]) >= 2.5
+
+
+def test_backoff_reset_starts_over():
+    backoff = Backoff(base=0.25, cap=30.0)
+    for _ in range(10):
+        backoff.next_delay()
+
+    backoff.reset()
+    assert backoff.next_delay() <= 0.25
+
+
+@pytest.mark.parametrize("base, factor, cap", [(0, 2.0, 1.0), (1.0, 0.5, 2.0), (2.0, 2.0, 1.0)])
+def test_backoff_rejects_invalid_settings(base, factor, cap):
+    with pytest.raises(ValueError):
+        Backoff(base=base, factor=factor, cap=cap)
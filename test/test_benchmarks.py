@@ -0,0 +1,20 @@
+from benchmarks.agent import percentile, run_scenario
+
+
+def test_percentile():
+    samples = [float(n) for n in range(1, 101)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 99) == 99.0
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_agent_benchmark_against_fake_controller(run):
+    result = run(run_scenario(cluster_count=3, duration=0.3, heartbeat_interval=0.02))
+
+    assert result["clusters"] == 3
+    assert result["frames"]["agent-sync-request"] == 1
+    assert result["frames"]["clusters-snapshot"] >= 1
+    assert result["frames"]["cluster-heartbeat"] >= 1
+    assert result["bytes_per_heartbeat"] < result["bytes_per_snapshot"]
+    assert result["ping_rtt_ms"]["samples"] >= 1
+    assert result["startup_to_first_snapshot_ms"] > 0
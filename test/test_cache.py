@@ -0,0 +1,60 @@
+import base64
+
+from kubernaut.cache import ClusterIdCache, cluster_key
+from kubernaut.kubeconfig import Kubeconfig
+from pathlib import Path
+
+
+def make_kubeconfig(server: str, ca: bytes, user: str) -> Kubeconfig:
+    return Kubeconfig("""
+apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: {ca}
+    server: {server}
+  name: kubernetes
+contexts:
+- context:
+    cluster: kubernetes
+    user: {user}
+  name: {user}@kubernetes
+current-context: {user}@kubernetes
+kind: Config
+users:
+- name: {user}
+  user:
+    token: {user}-token
+""".format(ca=base64.b64encode(ca).decode("ascii"), server=server, user=user))
+
+
+def test_cluster_key_identifies_server_and_ca():
+    key = cluster_key(make_kubeconfig("https://10.0.0.1:6443", b"CA-1", "admin"))
+
+    assert key == cluster_key(make_kubeconfig("https://10.0.0.1:6443", b"CA-1", "viewer"))
+    assert key != cluster_key(make_kubeconfig("https://10.0.0.1:6443", b"CA-2", "admin"))
+    assert key != cluster_key(make_kubeconfig("https://10.0.0.2:6443", b"CA-1", "admin"))
+    assert cluster_key(Kubeconfig("FAKE_KUBECONFIG_DATA")) is None
+    assert cluster_key(Kubeconfig("{not: yaml")) is None
+
+
+def test_cluster_id_cache_persists(tmpdir):
+    path = Path(tmpdir) / "cluster-ids.json"
+    cache = ClusterIdCache(path)
+    assert cache.get("key") is None
+
+    cache.put("key", "FAKE-UID")
+    cache.put(None, "IGNORED")
+    assert len(cache) == 1
+    assert ClusterIdCache(path).get("key") == "FAKE-UID"
+    assert [p.name for p in Path(tmpdir).iterdir()] == ["cluster-ids.json"]
+
+
+def test_cluster_id_cache_ignores_unreadable_file(tmpdir):
+    path = Path(tmpdir) / "cluster-ids.json"
+    path.write_text("{not json")
+
+    cache = ClusterIdCache(path)
+    assert len(cache) == 0
+
+    cache.put("key", "FAKE-UID")
+    assert ClusterIdCache(path).get("key") == "FAKE-UID"
@@ -0,0 +1,68 @@
+import pytest
+import websockets
+
+from kubernaut.compression import *
+from kubernaut.util import decode, encode
+
+LARGE_MESSAGE = {"@type": "clusters-snapshot", "clusters": {"A": {"detail": {"kubeconfig": "apiVersion: v1\n" * 200}}}}
+
+
+def test_payload_envelope_round_trip():
+    data = encode(LARGE_MESSAGE)
+    wrapped = PayloadEnvelope(threshold=128).wrap(data)
+
+    message = decode(wrapped)
+    assert message["@type"] == COMPRESSED_PAYLOAD
+    assert len(wrapped) < len(data)
+    assert unwrap_payload(message) == data
+
+
+def test_payload_envelope_skips_small_frames():
+    data = encode({"@type": "cluster-heartbeat", "clusters": ["A"]})
+    assert PayloadEnvelope(threshold=1024).wrap(data) is data
+
+
+def test_payload_envelope_skips_incompressible_frames():
+    data = encode({"@type": "clusters-snapshot", "token": "x7Qz"})
+    assert PayloadEnvelope(threshold=0).wrap(data) is data
+
+
+def test_unwrap_unsupported_encoding():
+    with pytest.raises(ValueError):
+        unwrap_payload({"@type": COMPRESSED_PAYLOAD, "encoding": "brotli", "payload": ""})
+
+
+@pytest.mark.parametrize("level, window_bits", [(0, 15), (10, 15), (6, 8), (6, 16)])
+def test_deflate_extensions_rejects_invalid_settings(level, window_bits):
+    with pytest.raises(ValueError):
+        deflate_extensions(CompressionStats(), level, window_bits)
+
+
+def test_deflate_negotiation_records_compressed_sizes(run):
+    stats = CompressionStats()
+
+    async def echo(websocket, path):
+        async for message in websocket:
+            await websocket.send(message)
+
+    async def scenario():
+        server = await websockets.serve(echo, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            extensions = deflate_extensions(stats, level=9, window_bits=12)
+            async with websockets.connect("ws://127.0.0.1:{}".format(port), compression=None,
+                                          extensions=extensions) as websocket:
+                await websocket.send(encode(LARGE_MESSAGE).decode("utf-8"))
+                await websocket.recv()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    run(scenario(), timeout=5)
+
+    size = len(encode(LARGE_MESSAGE))
+    assert stats.deflate
+    assert stats.uncompressed_sent == size
+    assert stats.compressed_sent < size / 10
+    assert stats.uncompressed_received == size
+    assert stats.compressed_received < size / 10
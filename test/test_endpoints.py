@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+import socket
+import websockets
+
+from kubernaut.endpoints import *
+
+
+def unused_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def fake_probe(rtts):
+    async def probe(endpoint, timeout):
+        return rtts[endpoint.port]
+    return probe
+
+
+def test_endpoint_parses_url():
+    assert Endpoint("wss://next.kubernaut.io/beta/ws/kapv1").port == 443
+    assert Endpoint("ws://127.0.0.1:8080/ws").port == 8080
+    assert Endpoint("wss://127.0.0.1/ws").secure
+
+
+@pytest.mark.parametrize("url", ["http://next.kubernaut.io", "next.kubernaut.io", "ws:///path"])
+def test_endpoint_rejects_invalid_url(url):
+    with pytest.raises(ValueError):
+        Endpoint(url)
+
+
+def test_endpoint_smooths_round_trip_times():
+    endpoint = Endpoint("ws://127.0.0.1:1")
+    endpoint.record_probe(1.0)
+    endpoint.record_probe(2.0)
+    assert endpoint.rtt == pytest.approx(1.3)
+
+    endpoint.record_probe(None)
+    assert not endpoint.healthy
+    assert endpoint.failures == 1
+
+
+def test_pool_selects_fastest_healthy_endpoint(run):
+    pool = EndpointPool(["ws://a:1", "ws://b:2", "ws://c:3"], probe=fake_probe({1: 0.30, 2: 0.05, 3: None}))
+
+    assert run(pool.select()).port == 2
+    assert not pool.endpoints[2].healthy
+
+
+def test_pool_fails_over_without_reprobing(run):
+    probes = []
+
+    async def probe(endpoint, timeout):
+        probes.append(endpoint.port)
+        return {1: 0.05, 2: 0.10}[endpoint.port]
+
+    pool = EndpointPool(["ws://a:1", "ws://b:2"], probe=probe)
+    first = run(pool.select())
+    assert first.port == 1
+
+    assert pool.fail(first)
+    assert run(pool.select()).port == 2
+    assert sorted(probes) == [1, 2]
+
+    assert not pool.fail(pool.endpoints[1])
+
+
+def test_pool_keeps_retrying_when_nothing_answers(run):
+    pool = EndpointPool(["ws://a:1", "ws://b:2"], probe=fake_probe({1: None, 2: None}))
+    first = run(pool.select())
+    pool.fail(first)
+    assert run(pool.select()) is not first
+
+
+def test_pool_probes_local_controllers(run):
+    pings = []
+
+    async def scenario():
+        async def accept(reader, writer):
+            writer.close()
+
+        async def controller(websocket, path):
+            pings.append(path)
+            await websocket.wait_closed()
+
+        servers = [await websockets.serve(controller, "127.0.0.1", 0) for _ in range(2)]
+        not_websocket = await asyncio.start_server(accept, "127.0.0.1", 0)
+        ports = [s.sockets[0].getsockname()[1] for s in servers]
+        down = unused_port()
+        urls = ["ws://127.0.0.1:{}/ws".format(p) for p in [down, not_websocket.sockets[0].getsockname()[1]] + ports]
+        try:
+            pool = EndpointPool(urls, probe_timeout=1.0)
+            selected = await pool.select()
+            return pool, selected, ports
+        finally:
+            for s in servers + [not_websocket]:
+                s.close()
+                await s.wait_closed()
+
+    pool, selected, ports = run(scenario())
+
+    assert not pool.endpoints[0].healthy
+    assert not pool.endpoints[1].healthy
+    assert all(e.healthy and e.rtt is not None for e in pool.endpoints[2:])
+    assert selected.port in ports
+    assert pings == ["/ws", "/ws"]
@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+import random
+
+from kubernaut.heartbeat import Heartbeat
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_heartbeat_first_beat_is_immediate():
+    heartbeat = Heartbeat(interval=5.0, jitter=0.0, clock=FakeClock())
+    assert heartbeat.delay() == 0.0
+
+
+def test_heartbeat_cadence_does_not_drift_with_work_time():
+    clock = FakeClock()
+    heartbeat = Heartbeat(interval=5.0, jitter=0.0, clock=clock)
+
+    heartbeat.delay()
+    clock.now += 1.5  # time spent sending and waiting on the controller
+    assert heartbeat.delay() == pytest.approx(3.5)
+
+    clock.now += 3.5 + 0.25
+    assert heartbeat.delay() == pytest.approx(4.75)
+
+
+def test_heartbeat_skips_missed_beats():
+    clock = FakeClock()
+    heartbeat = Heartbeat(interval=5.0, jitter=0.0, clock=clock)
+
+    heartbeat.delay()
+    clock.now += 12.0
+    assert heartbeat.delay() == pytest.approx(3.0)
+    assert heartbeat.skipped == 2
+
+
+def test_heartbeat_jitter_is_bounded():
+    clock = FakeClock()
+    heartbeat = Heartbeat(interval=10.0, jitter=0.2, clock=clock, rng=random.Random(42))
+
+    start = clock.now
+    heartbeat.delay()
+    for beat in range(1, 100):
+        clock.now += heartbeat.delay()
+        assert abs(clock.now - (start + beat * 10.0)) <= 2.0
+
+
+@pytest.mark.parametrize("interval, jitter", [(0, 0.1), (-1, 0.1), (5, 0.6), (5, -0.1)])
+def test_heartbeat_rejects_invalid_settings(interval, jitter):
+    with pytest.raises(ValueError):
+        Heartbeat(interval=interval, jitter=jitter)
+
+
+def test_heartbeat_wait_yields_to_event_loop(run):
+    heartbeat = Heartbeat(interval=0.05, jitter=0.0)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def beat_twice():
+        task = asyncio.ensure_future(ticker())
+        await heartbeat.wait()
+        await heartbeat.wait()
+        task.cancel()
+
+    run(beat_twice())
+
+    assert heartbeat.beats == 2
+    assert len(ticks) >= 3
@@ -0,0 +1,103 @@
+import os
+import pytest
+import subprocess
+
+from kubernaut import kubeconfig as kubeconfig_module
+from kubernaut.kubeconfig import Kubeconfig, remove_materialized
+from pathlib import Path
+
+KUBECONFIG = """
+apiVersion: v1
+clusters:
+- cluster:
+    certificate-authority-data: Q0EtREFUQQ==
+    server: https://10.0.0.1:6443
+  name: production
+- cluster:
+    server: https://10.0.0.2:6443
+  name: staging
+contexts:
+- context:
+    cluster: production
+    user: admin
+  name: admin@production
+- context:
+    cluster: staging
+  name: staging
+current-context: admin@production
+kind: Config
+users:
+- name: admin
+  user:
+    token: FAKE-TOKEN
+"""
+
+
+def test_kubeconfig_keeps_raw_bytes_and_parses_lazily(tmpdir):
+    path = Path(tmpdir) / "config"
+    path.write_bytes(KUBECONFIG.encode("utf-8"))
+
+    kubeconfig = Kubeconfig.read(path)
+    assert kubeconfig.raw == KUBECONFIG.encode("utf-8")
+    assert kubeconfig.text == KUBECONFIG
+    assert kubeconfig._document is None
+
+    assert kubeconfig.server() == "https://10.0.0.1:6443"
+    assert sorted(kubeconfig.contexts) == ["admin@production", "staging"]
+    assert kubeconfig.user() == {"token": "FAKE-TOKEN"}
+    assert kubeconfig.cluster("staging") == {"server": "https://10.0.0.2:6443"}
+    assert kubeconfig.user("staging") == {}
+
+    with pytest.raises(ValueError):
+        kubeconfig.context("missing")
+
+
+def test_kubeconfig_fingerprint_depends_only_on_content(tmpdir):
+    path = Path(tmpdir) / "config"
+    path.write_text(KUBECONFIG)
+
+    from_file = Kubeconfig.read(path)
+    from_text = Kubeconfig(KUBECONFIG)
+    assert from_file == from_text
+    assert from_file.fingerprint == from_text.fingerprint
+    assert len({from_file, from_text}) == 1
+
+    assert Kubeconfig(KUBECONFIG + "\n").fingerprint != from_text.fingerprint
+
+
+@pytest.mark.parametrize("document", ["just a string", "{not: yaml", "- a list"])
+def test_kubeconfig_rejects_invalid_documents(document):
+    with pytest.raises(ValueError):
+        Kubeconfig(document).server()
+
+
+def test_kubeconfig_path_is_written_once_and_readable_by_tools():
+    kubeconfig = Kubeconfig(KUBECONFIG)
+
+    path = kubeconfig.path
+    assert kubeconfig.path == path
+    assert Path(path).read_text() == KUBECONFIG
+    assert subprocess.check_output(["cat", path]).decode("utf-8") == KUBECONFIG
+    if hasattr(os, "memfd_create"):
+        assert path.startswith("/proc/{}/fd/".format(os.getpid()))
+
+
+def test_kubeconfig_path_falls_back_to_tmpfs_without_memfd(tmpdir, monkeypatch):
+    monkeypatch.delattr(os, "memfd_create", raising=False)
+    monkeypatch.setattr(kubeconfig_module, "TMPFS_DIRECTORIES", [str(tmpdir / "missing"), str(tmpdir)])
+    kubeconfig = Kubeconfig(KUBECONFIG)
+
+    path = Path(kubeconfig.path)
+    assert path.parent == Path(tmpdir)
+    assert path.read_text() == KUBECONFIG
+    assert path.stat().st_mode & 0o777 == 0o600
+
+    remove_materialized()
+    assert not path.exists()
+
+
+def test_kubeconfig_path_uses_source_with_relative_file_references(tmpdir):
+    path = Path(tmpdir) / "config"
+    path.write_text(KUBECONFIG.replace("certificate-authority-data: Q0EtREFUQQ==", "certificate-authority: ca.crt"))
+
+    assert Kubeconfig.read(path).path == str(path.resolve())
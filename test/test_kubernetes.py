@@ -1,4 +1,6 @@
+import asyncio
 import pytest
+import time
 
 from kubernaut.kubernetes import *
 from pathlib import Path
@@ -33,7 +35,9 @@ users:
     kubeconfig_file.write_text(kubeconfig_data)
 
     read_kubeconfig_data = read_kubeconfig(kubeconfig_file)
-    assert read_kubeconfig_data == kubeconfig_data
+    assert read_kubeconfig_data.text == kubeconfig_data
+    assert read_kubeconfig_data.source == kubeconfig_file
+    assert read_kubeconfig_data.server() == "https://52.90.0.114:6443"
 
 
 def test_read_kubeconfig_nonexistent_kubeconfig(tmpdir):
@@ -42,6 +46,87 @@ def test_read_kubeconfig_nonexistent_kubeconfig(tmpdir):
         read_kubeconfig(kubeconfig_file)
 
 
+def test_find_kubeconfigs_expands_directories(tmpdir):
+    root = Path(tmpdir)
+    single = root / "single.yaml"
+    single.write_text("single")
+
+    pool = root / "pool"
+    pool.mkdir()
+    for name in ["b.yaml", "a.yaml", ".hidden"]:
+        (pool / name).write_text(name)
+    (pool / "nested").mkdir()
+
+    assert find_kubeconfigs([single, pool]) == [single, pool / "a.yaml", pool / "b.yaml"]
+
+
+def make_tool(directory: Path, name: str, output: str) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    tool = directory / name
+    tool.write_text("#!/bin/sh\necho {} \"$@\"\n".format(output))
+    tool.chmod(0o755)
+    return tool
+
+
+@pytest.fixture
+def tools(tmpdir, monkeypatch):
+    invalidate_tool()
+    root = Path(tmpdir)
+    monkeypatch.setenv("PATH", os.pathsep.join([str(root / "path-bin"), str(root / "upgraded"), "/bin"]))
+    monkeypatch.delenv("KUBERNAUT_KUBECTL", raising=False)
+    monkeypatch.delenv("KUBERNAUT_KUBEADM", raising=False)
+    yield Path(tmpdir)
+    invalidate_tool()
+
+
+def test_search_paths_honors_path_first(tools):
+    paths = search_paths()
+    assert paths[0] == str(tools / "path-bin")
+    assert paths.count("/bin") == 1
+    assert "/usr/local/bin" in paths
+
+
+def test_resolve_tool_is_remembered(tools):
+    tool = make_tool(tools / "path-bin", "kubectl", "from-path")
+    assert resolve_tool("kubectl") == str(tool)
+
+    tool.unlink()
+    assert resolve_tool("kubectl") == str(tool)
+
+    invalidate_tool("kubectl")
+    with pytest.raises(ValueError):
+        resolve_tool("kubectl")
+
+
+def test_resolve_tool_override(tools, monkeypatch):
+    make_tool(tools / "path-bin", "kubectl", "from-path")
+    override = make_tool(tools / "elsewhere", "kubectl-1.10", "from-override")
+
+    monkeypatch.setenv("KUBERNAUT_KUBECTL", str(override))
+    assert resolve_tool("kubectl") == str(override)
+
+    monkeypatch.setenv("KUBERNAUT_KUBECTL", "kubectl")
+    assert resolve_tool("kubectl") == str(tools / "path-bin" / "kubectl")
+
+
+def test_kubectl_re_resolves_missing_tool(tools):
+    original = make_tool(tools / "path-bin", "kubectl", "original")
+    assert kubectl(["version"]) == (0, "original version\n")
+
+    original.unlink()
+    make_tool(tools / "upgraded", "kubectl", "replacement")
+    args = ["version"]
+    assert kubectl(args) == (0, "replacement version\n")
+    assert args == ["version"]
+
+
+def test_kubectl_async(tools, run):
+    make_tool(tools / "path-bin", "kubectl", "async")
+
+    assert run(kubectl_async(["get", "nodes"])) == (0, "async get nodes\n")
+    assert run(system_async("exit 3")) == 3
+
+
 # def test_discover_cluster_id():
 #     kube_system_ns_uid = discover_cluster_id()
 #     assert kube_system_ns_uid is not None
@@ -49,3 +134,117 @@ def test_read_kubeconfig_nonexistent_kubeconfig(tmpdir):
 #     default_ns_uid = discover_cluster_id(namespace="default")
 #     assert default_ns_uid is not None
 #     assert default_ns_uid != kube_system_ns_uid
+
+
+def test_output_buffer_discards_oldest_lines():
+    output = OutputBuffer(limit=10)
+    output.extend(["first\n", "second\n", "third\n"])
+    assert output.text() == "third\n"
+    assert output.discarded == 2 and output.truncated
+
+    output.append("a much longer line\n")
+    assert output.text() == "a much longer line\n"
+
+
+def test_iter_lines_handles_split_characters():
+    snowman = "☃".encode("utf-8")
+    chunks = [b"one\ntw", b"o " + snowman[:1], snowman[1:] + b"\nlast"]
+    assert list(iter_lines(chunks)) == ["one\n", "two ☃\n", "last"]
+
+
+def test_iter_json_decodes_documents_as_they_complete():
+    lines = iter(['{\n', '    "kind": "Namespace",\n', '    "items": [{"a": "}"}]\n', '}\n', '{"kind": "Node"}\n'])
+    documents = iter_json(lines)
+
+    assert next(documents) == {"kind": "Namespace", "items": [{"a": "}"}]}
+    assert next(lines) == '{"kind": "Node"}\n'
+    assert list(documents) == []
+
+    with pytest.raises(ValueError):
+        list(iter_json(['{"kind":\n']))
+
+
+def test_discover_cluster_id_streams_kubectl_output(tools):
+    tool = tools / "path-bin" / "kubectl"
+    tool.parent.mkdir()
+    tool.write_text("#!/bin/sh\n"
+                    "echo 'Warning: something' >&2\n"
+                    "printf '{\\n  \"metadata\": {\\n    \"uid\": \"FAKE-UID\"\\n  }\\n}\\n'\n"
+                    "[ \"$3\" = default ] || { echo \"not found: $3\" >&2; exit 1; }\n")
+    tool.chmod(0o755)
+
+    assert discover_cluster_id(namespace="default", kubeconfig=tools / "config") == "FAKE-UID"
+    with pytest.raises(ValueError) as e:
+        discover_cluster_id(namespace="missing", kubeconfig=tools / "config")
+    assert "not found: missing" in str(e.value)
+
+
+def test_run_tool_retains_most_recent_output(tools, run):
+    tool = tools / "path-bin" / "kubectl"
+    tool.parent.mkdir()
+    tool.write_text("#!/bin/sh\nfor i in 1 2 3 4 5; do echo \"line $i\"; done\necho oops >&2\nexit 2\n")
+    tool.chmod(0o755)
+
+    assert run_tool("kubectl", [], limit=14) == (2, "line 5\noops\n")
+
+    assert run(run_tool_async("kubectl", [], limit=14)) == (2, "line 5\noops\n")
+
+
+def test_tool_result_unpacks_like_a_tuple():
+    result = ToolResult(1, "output", timed_out=True, duration=2.5)
+    (status, output) = result
+
+    assert (status, output) == (1, "output") == result
+    assert result.status == 1 and result.output == "output"
+    assert result.timed_out and result.duration == 2.5
+
+
+def make_hanging_tool(directory: Path, pid_file: Path) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    tool = directory / "kubectl"
+    tool.write_text("#!/bin/sh\necho started\nsleep 30 &\necho $! > {}\nwait\n".format(pid_file))
+    tool.chmod(0o755)
+    return tool
+
+
+def assert_killed(pid_file: Path):
+    status = Path("/proc") / pid_file.read_text().strip() / "status"
+    for _ in range(50):
+        # A killed process that nothing has reaped yet lingers as a zombie.
+        try:
+            if "State:\tZ" in status.read_text():
+                return
+        except FileNotFoundError:
+            return
+        time.sleep(0.02)
+
+    raise AssertionError("Process outlived its tool: {}".format(status))
+
+
+def test_run_tool_timeout_kills_process_group(tools):
+    make_hanging_tool(tools / "path-bin", tools / "child.pid")
+
+    result = run_tool("kubectl", [], timeout=0.2)
+    assert result.timed_out
+    assert result.output == "started\n"
+    assert result.status < 0
+    assert 0.2 <= result.duration < 5
+    assert_killed(tools / "child.pid")
+
+
+def test_run_tool_async_timeout_and_cancellation_kill_process_group(tools, run):
+    make_hanging_tool(tools / "path-bin", tools / "child.pid")
+
+    result = run(run_tool_async("kubectl", [], timeout=0.2))
+    assert result.timed_out and result.output == "started\n"
+    assert_killed(tools / "child.pid")
+
+    async def cancel_after(delay):
+        task = asyncio.ensure_future(kubectl_async([]))
+        await asyncio.sleep(delay)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(cancel_after(0.2))
+    assert_killed(tools / "child.pid")
@@ -1,9 +1,12 @@
+import asyncio
 import pytest
 
-from kubernaut.model import Cluster
+from kubernaut.kubernetes import ToolResult
+from kubernaut.model import Baseline, Cluster, ClusterLifecycle, ClusterRegistry, ClusterState, NodeTeardown
+from kubernaut.model import NAMESPACED_KINDS
 
 
-def test_cluster_shutdown():
+def test_cluster_shutdown(run):
 
     call_invocations = []
 
@@ -15,11 +18,11 @@ def test_cluster_shutdown():
         cluster_id="FAKE_CLUSTER_ID", state="discarded", kubeconfig="FAKE_KUBECONFIG_DATA", token="FAKE_TOKEN"
     )
 
-    cluster.shutdown(
+    run(cluster.shutdown(
         kubectl_handler=fake_handler,
         kubeadm_handler=fake_handler,
         system_handler=fake_handler
-    )
+    ))
 
     get_nodes_call = call_invocations[0]
     assert get_nodes_call[0][0] == ["get", "nodes", "--output=jsonpath={.items[*].metadata.name}"]
@@ -27,3 +30,549 @@ def test_cluster_shutdown():
 
     assert call_invocations[-1 - 1] == ((["reset"],), {})
     assert call_invocations[-1] == (("systemctl poweroff",), {})
+
+
+def test_cluster_shutdown_with_async_handlers(run):
+
+    call_invocations = []
+
+    async def fake_handler(*args):
+        await asyncio.sleep(0)
+        call_invocations.append(args)
+        return 0, "node-0"
+
+    cluster = Cluster(
+        cluster_id="FAKE_CLUSTER_ID", state="discarded", kubeconfig="FAKE_KUBECONFIG_DATA", token="FAKE_TOKEN"
+    )
+
+    run(cluster.shutdown(
+        kubectl_handler=fake_handler,
+        kubeadm_handler=fake_handler,
+        system_handler=fake_handler
+    ))
+
+    assert [c[0] for c in call_invocations] == [
+        ["get", "nodes", "--output=jsonpath={.items[*].metadata.name}"],
+        ["drain", "node-0", "--delete-local-data", "--force", "--ignore-daemonsets"],
+        ["delete", "node", "node-0"],
+        ["reset"],
+        "systemctl poweroff"
+    ]
+
+
+def test_cluster_shutdown_without_host_reset(run):
+
+    call_invocations = []
+
+    def fake_handler(*args, **kwargs):
+        call_invocations.append((args, kwargs))
+        return 0, "node-0 node-1"
+
+    cluster = Cluster(
+        cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="FAKE_TOKEN"
+    )
+
+    run(cluster.shutdown(
+        kubectl_handler=fake_handler,
+        kubeadm_handler=fake_handler,
+        system_handler=fake_handler,
+        reset_host=False
+    ))
+
+    assert [c[0][0][0] for c in call_invocations] == ["get", "drain", "delete", "drain", "delete"]
+
+
+def test_cluster_registry():
+    registry = ClusterRegistry()
+    first = registry.add(Cluster(cluster_id="A", state="UNCLAIMED", kubeconfig="A_DATA", token="FAKE_TOKEN"))
+    second = registry.add(Cluster(cluster_id="B", state="CLAIMED", kubeconfig="B_DATA", token="FAKE_TOKEN"))
+
+    assert len(registry) == 2
+    assert "A" in registry
+    assert registry.get("B") is second
+    assert list(registry) == [first, second]
+
+    with pytest.raises(ValueError):
+        registry.add(Cluster(cluster_id="A", state="UNCLAIMED", kubeconfig="A_DATA", token="FAKE_TOKEN"))
+
+    second.state = "DISCARDED"
+    assert registry.active() == [first]
+
+    assert registry.remove("A") is first
+    assert "A" not in registry
+
+
+def test_cluster_registry_advertises_ready_or_claimed_clusters():
+    registry = ClusterRegistry()
+    ready = registry.add(Cluster(cluster_id="A", state="UNCLAIMED", kubeconfig="A_DATA", token="FAKE_TOKEN"))
+    starting = registry.add(Cluster(cluster_id="B", state="UNREGISTERED", kubeconfig="B_DATA", token="FAKE_TOKEN"))
+    claimed = registry.add(Cluster(cluster_id="C", state="CLAIMED", kubeconfig="C_DATA", token="FAKE_TOKEN"))
+    starting.ready = claimed.ready = False
+
+    assert registry.advertised() == [ready, claimed]
+
+    starting.ready = True
+    assert registry.advertised() == [ready, starting, claimed]
+
+
+def test_cluster_snapshot_fragment_is_cached_until_changed():
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="UNCLAIMED", kubeconfig="FAKE_KUBECONFIG_DATA", token="TOKEN")
+    assert cluster.dirty
+
+    fragment = cluster.snapshot_fragment()
+    assert not cluster.dirty
+    assert cluster.snapshot_fragment() is fragment
+
+    cluster.state = "UNCLAIMED"
+    assert cluster.snapshot_fragment() is fragment
+    assert cluster.revision == 0
+
+    for field, value in [("state", "CLAIMED"), ("kubeconfig", "NEW_KUBECONFIG_DATA"), ("token", "NEW_TOKEN")]:
+        setattr(cluster, field, value)
+        assert cluster.dirty
+        assert cluster.snapshot_fragment() != fragment
+        fragment = cluster.snapshot_fragment()
+
+    assert cluster.revision == 3
+    assert b'"status":"CLAIMED"' in fragment
+
+
+def test_cluster_shutdown_with_api_client(run):
+
+    call_invocations = []
+
+    class FakeApi:
+        def list_nodes(self):
+            return {"items": [{"metadata": {"name": "node-0"}}]}
+
+        def delete(self, path):
+            call_invocations.append(("api-delete", path))
+
+    def fake_handler(*args):
+        call_invocations.append(args[0][0])
+        return 0, ""
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA",
+                      token="FAKE_TOKEN", api=FakeApi())
+
+    run(cluster.shutdown(
+        kubectl_handler=fake_handler,
+        kubeadm_handler=fake_handler,
+        system_handler=fake_handler,
+        reset_host=False
+    ))
+
+    assert call_invocations == ["drain", ("api-delete", "/api/v1/nodes/node-0")]
+
+
+def test_cluster_shutdown_drains_nodes_concurrently_within_bound(run):
+
+    running = []
+    peak = []
+
+    async def fake_kubectl(args, env):
+        if args[0] == "get":
+            return 0, "node-0 node-1 node-2 node-3 node-4"
+
+        running.append(args[1])
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(args[1])
+        return 0, ""
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=fake_kubectl,
+        system_handler=fake_kubectl,
+        reset_host=False,
+        parallelism=2
+    ))
+
+    assert max(peak) == 2
+    assert [r.name for r in results] == ["node-0", "node-1", "node-2", "node-3", "node-4"]
+    assert all(r.ok and r.drain_seconds >= 0.01 and r.delete_seconds >= 0.01 for r in results)
+
+
+def test_cluster_shutdown_collects_node_failures(run):
+
+    invocations = []
+
+    async def fake_kubectl(args, env=None, timeout=None):
+        invocations.append(args)
+        if args[0] == "get":
+            return 0, "stuck broken fine"
+        if args[:2] == ["drain", "stuck"]:
+            await asyncio.sleep(10)
+        if args[:3] == ["delete", "node", "broken"]:
+            return 1, "some warning\nerror: nodes \"broken\" is forbidden\n"
+
+        return 0, ""
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=fake_kubectl,
+        system_handler=fake_kubectl,
+        node_timeout=0.2
+    ))
+
+    assert [(r.name, r.error) for r in results] == [
+        ("stuck", "drain timed out after 0.2s"),
+        ("broken", "delete exited 1: error: nodes \"broken\" is forbidden"),
+        ("fine", None),
+    ]
+    assert invocations[-2:] == [["reset"], "systemctl poweroff"]
+
+
+def test_cluster_shutdown_budget_abandons_nodes_and_powers_off(run):
+
+    invocations = []
+
+    async def fake_kubectl(args, env=None):
+        invocations.append(args)
+        if args[0] == "get":
+            return 0, "quick stuck"
+        if args[:2] == ["drain", "stuck"]:
+            await asyncio.sleep(10)
+
+        return ToolResult(0, "", duration=0.0)
+
+    async def hanging_kubeadm(args):
+        invocations.append(args)
+        await asyncio.sleep(10)
+
+    def fake_system(command):
+        invocations.append(command)
+        return 0
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=hanging_kubeadm,
+        system_handler=fake_system,
+        budget=0.1,
+        reset_timeout=0.05
+    ))
+
+    assert [(r.name, r.error) for r in results] == [
+        ("quick", None),
+        ("stuck", "abandoned, shutdown budget of 0.1s exhausted"),
+    ]
+    assert invocations[-2:] == [["reset"], "systemctl poweroff"]
+
+
+def test_cluster_shutdown_retries_hung_batch_per_node_and_deletes(run):
+
+    invocations = []
+
+    async def fake_kubectl(args, env=None, timeout=None):
+        invocations.append((args, timeout))
+        if args[0] == "get":
+            return 0, "node-a node-b"
+        if args[0] == "drain" and "node-b" in args:
+            await asyncio.sleep(10)
+
+        return ToolResult(0, "", duration=0.0)
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=fake_kubectl,
+        system_handler=fake_kubectl,
+        reset_host=False,
+        batch_size=2,
+        node_timeout=0.1
+    ))
+
+    assert [(r.name, r.error) for r in results] == [("node-a", None), ("node-b", "drain timed out after 0.1s")]
+    assert [(a[:2], t) for a, t in invocations[1:]] == [
+        (["drain", "node-a"], 0.2),
+        (["drain", "node-a"], 0.1),
+        (["drain", "node-b"], 0.1),
+        (["delete", "node"], 0.2),
+    ]
+    assert invocations[-1][0] == ["delete", "node", "node-a", "node-b"]
+
+
+def test_node_teardown_reports_tool_timeouts():
+    result = NodeTeardown("node-0")
+    result.check("drain", ToolResult(-9, "evicting pod", timed_out=True, duration=30.0))
+    result.check("delete", (0, ""))
+
+    assert result.error == "drain timed out after 30.0s"
+
+
+def test_cluster_shutdown_batches_kubectl_invocations(run):
+
+    invocations = []
+
+    def fake_kubectl(args, env=None):
+        invocations.append(args)
+        return 0, "node-0 node-1 node-2 node-3 node-4" if args[0] == "get" else ""
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=fake_kubectl,
+        system_handler=fake_kubectl,
+        reset_host=False,
+        parallelism=2
+    ))
+
+    assert all(r.ok for r in results)
+    assert invocations[1:] == [
+        ["drain", "node-0", "node-1", "node-2", "--delete-local-data", "--force", "--ignore-daemonsets"],
+        ["delete", "node", "node-0", "node-1", "node-2"],
+        ["drain", "node-3", "node-4", "--delete-local-data", "--force", "--ignore-daemonsets"],
+        ["delete", "node", "node-3", "node-4"],
+    ]
+
+
+def test_cluster_shutdown_retries_failed_batch_per_node(run):
+
+    invocations = []
+
+    def fake_kubectl(args, env=None):
+        invocations.append(args)
+        if args[0] == "get":
+            return 0, "node-0 node-1"
+        if args[0] == "delete" and "node-1" in args and "--ignore-not-found" not in args:
+            return 1, "error: node-1 is protected"
+        if args[0] == "delete" and args[2] == "node-1":
+            return 1, "error: node-1 is protected"
+
+        return 0, ""
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    results = run(cluster.shutdown(
+        kubectl_handler=fake_kubectl,
+        kubeadm_handler=fake_kubectl,
+        system_handler=fake_kubectl,
+        reset_host=False,
+        batch_size=10
+    ))
+
+    assert [(r.name, r.error) for r in results] == [
+        ("node-0", None),
+        ("node-1", "delete exited 1: error: node-1 is protected"),
+    ]
+    assert [a for a in invocations if a[0] == "delete"] == [
+        ["delete", "node", "node-0", "node-1"],
+        ["delete", "node", "node-0", "--ignore-not-found"],
+        ["delete", "node", "node-1", "--ignore-not-found"],
+    ]
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cluster_lifecycle_records_timings_and_runs_hooks():
+    clock = FakeClock()
+    lifecycle = ClusterLifecycle(ClusterState.UNREGISTERED, clock=clock)
+    calls = []
+    lifecycle.on_exit(ClusterState.UNCLAIMED, lambda lc, previous, next_state: calls.append(("exit", next_state)))
+    lifecycle.on_enter(ClusterState.CLAIMED, lambda lc, previous, next_state: calls.append(("enter", lc.state)))
+
+    for state, elapsed in [(ClusterState.UNCLAIMED, 1.0), (ClusterState.CLAIMED, 2.0), (ClusterState.RELEASED, 30.0)]:
+        clock.now += elapsed
+        assert lifecycle.transition(state)
+
+    clock.now += 5.0
+    assert not lifecycle.transition(ClusterState.RELEASED)
+    assert calls == [("exit", ClusterState.CLAIMED), ("enter", ClusterState.CLAIMED)]
+    assert lifecycle.latency(ClusterState.CLAIMED, ClusterState.RELEASED) == 30.0
+    assert lifecycle.latency(ClusterState.RELEASED, ClusterState.CLAIMED) is None
+    assert lifecycle.timings() == {"UNREGISTERED": 1.0, "UNCLAIMED": 2.0, "CLAIMED": 30.0, "RELEASED": 5.0}
+
+
+def test_cluster_state_transitions_are_checked():
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="unclaimed", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    assert cluster.state is ClusterState.UNCLAIMED
+
+    cluster.state = "CLAIMED"
+    cluster.state = ClusterState.DISCARDED
+    assert cluster.released
+    assert cluster.snapshot()["status"] == "DISCARDED"
+
+    revision = cluster.revision
+    with pytest.raises(ValueError):
+        cluster.state = "UNCLAIMED"
+    with pytest.raises(ValueError):
+        cluster.state = "NOT_A_STATE"
+
+    assert cluster.state is ClusterState.DISCARDED
+    assert cluster.revision == revision
+
+
+class FakeCluster:
+
+    """A kubectl handler for a cluster holding a few objects, namespaced ones named namespace/name.
+
+    Owned namespaced objects are named namespace/name followed by the kind of their owner, as kubectl lists them. The
+    cluster's API server reports ``namespaced_kinds``, or fails to, if they are None.
+    """
+
+    def __init__(self, **objects):
+        self.objects = {kind: list(names) for kind, names in objects.items()}
+        self.namespaced_kinds = NAMESPACED_KINDS
+        self.deletes = []
+
+    async def kubectl(self, args, env=None):
+        verb, kind, rest = args[0], args[1], args[2:]
+        if verb == "api-resources":
+            if self.namespaced_kinds is None:
+                return 1, "error: unable to retrieve the complete list of server APIs"
+
+            return 0, "\n".join(self.namespaced_kinds)
+
+        if verb == "get":
+            return 0, "\n".join(self.objects.get(kind, []))
+
+        self.deletes.append(kind)
+        await asyncio.sleep(0.05)
+        prefix = "".join(a[len("--namespace="):] + "/" for a in rest if a.startswith("--namespace="))
+        names = [prefix + n for n in rest if not n.startswith("--")]
+        self.objects[kind] = [n for n in self.objects[kind] if n not in names]
+        if kind == "namespaces":
+            # Deleting a namespace deletes everything in it.
+            for k in self.objects:
+                self.objects[k] = [n for n in self.objects[k] if "/" not in n or n.split("/")[0] not in names]
+
+        return 0, ""
+
+
+BASELINE = {"namespaces": ["default", "kube-system"], "customresourcedefinitions": ["ippools.crd.projectcalico.org"]}
+
+
+def test_cluster_recycle_deletes_objects_added_since_baseline(run):
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    cluster.baseline = Baseline(BASELINE)
+    fake = FakeCluster(
+        namespaces=["default", "kube-system", "user-app"],
+        customresourcedefinitions=["ippools.crd.projectcalico.org", "widgets.example.com"],
+        persistentvolumes=["pv-user-app"]
+    )
+    revision = cluster.revision
+
+    assert run(cluster.recycle(fake.kubectl))
+
+    assert cluster.state is ClusterState.UNREGISTERED
+    assert cluster.revision > revision
+    assert fake.objects == dict(BASELINE, persistentvolumes=[])
+    assert fake.deletes.index("persistentvolumes") > fake.deletes.index("namespaces")
+
+    stages = cluster.teardown.stages
+    assert stages["delete-customresourcedefinitions"].started < stages["delete-namespaces"].finished
+    assert stages["delete-persistentvolumes"].started >= stages["delete-namespaces"].finished
+
+
+def test_cluster_recycle_deletes_objects_added_to_baseline_namespaces(run):
+    baseline = dict(
+        BASELINE,
+        deployments=["kube-system/coredns"],
+        services=["default/kubernetes", "kube-system/kube-dns"],
+        clusterrolebindings=["cluster-admin"]
+    )
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    cluster.baseline = Baseline(baseline)
+    fake = FakeCluster(
+        namespaces=["default", "kube-system", "user-app"],
+        customresourcedefinitions=["ippools.crd.projectcalico.org"],
+        deployments=["default/web", "kube-system/coredns", "user-app/api"],
+        services=["default/kubernetes", "default/web", "kube-system/kube-dns"],
+        secrets=["kube-system/bootstrap-token-abcdef"],
+        clusterrolebindings=["cluster-admin", "web-admin"],
+        validatingwebhookconfigurations=["web-policy"]
+    )
+
+    assert run(cluster.recycle(fake.kubectl))
+
+    assert cluster.state is ClusterState.UNREGISTERED
+    assert fake.objects == dict(
+        baseline,
+        secrets=["kube-system/bootstrap-token-abcdef"],
+        validatingwebhookconfigurations=[]
+    )
+    assert fake.deletes.index("validatingwebhookconfigurations") < fake.deletes.index("deployments")
+
+    stages = cluster.teardown.stages
+    assert stages["delete-deployments"].started >= stages["delete-validatingwebhookconfigurations"].finished
+
+
+def test_cluster_recycle_deletes_pods_and_jobs_left_in_baseline_namespaces(run):
+    baseline = dict(BASELINE, pods=["kube-system/etcd-master"])
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    cluster.baseline = Baseline(baseline)
+    fake = FakeCluster(
+        namespaces=["default", "kube-system"],
+        customresourcedefinitions=["ippools.crd.projectcalico.org"],
+        pods=["default/debug", "kube-system/etcd-master"],
+        jobs=["default/migrate"]
+    )
+
+    assert run(cluster.recycle(fake.kubectl))
+
+    assert fake.objects == dict(baseline, jobs=[])
+
+
+def test_baseline_capture_discovers_namespaced_kinds_and_skips_owned_objects(run):
+    fake = FakeCluster(**dict(
+        BASELINE,
+        pods=["default/debug ", "kube-system/coredns-5d4b6c-x7k2q ReplicaSet"],
+        events=["default/debug.16b2"],
+        **{"networkpolicies.crd.projectcalico.org": ["default/deny-all "]}
+    ))
+    fake.namespaced_kinds = ["pods", "events", "networkpolicies.crd.projectcalico.org"]
+
+    baseline = run(Baseline.capture(fake.kubectl, {}))
+
+    assert baseline.namespaced_kinds == ["pods", "networkpolicies.crd.projectcalico.org"]
+    assert baseline.objects["pods"] == {"default/debug"}
+    assert baseline.objects["networkpolicies.crd.projectcalico.org"] == {"default/deny-all"}
+    assert "events" not in baseline.objects
+
+    fake.namespaced_kinds = None
+    assert run(Baseline.capture(fake.kubectl, {})).namespaced_kinds == NAMESPACED_KINDS
+
+
+def test_cluster_recycle_fails_when_cluster_differs_from_baseline(run):
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    cluster.baseline = Baseline(BASELINE)
+    fake = FakeCluster(namespaces=["default"], customresourcedefinitions=["ippools.crd.projectcalico.org"])
+
+    assert not run(cluster.recycle(fake.kubectl))
+
+    assert cluster.state is ClusterState.RELEASED
+    assert cluster.teardown.stages["verify-baseline"].error == \
+        "ValueError: cluster differs from its baseline: namespaces missing: kube-system"
+
+
+def test_cluster_recycle_requires_released_cluster_with_baseline(run):
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="released", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    with pytest.raises(ValueError, match="no baseline"):
+        run(cluster.recycle(FakeCluster().kubectl))
+
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="claimed", kubeconfig="FAKE_KUBECONFIG_DATA", token="T")
+    cluster.baseline = Baseline(BASELINE)
+    with pytest.raises(ValueError, match="CLAIMED"):
+        run(cluster.recycle(FakeCluster().kubectl))
+
+
+def test_cluster_lifecycle_recycle_only_leaves_released_states():
+    lifecycle = ClusterLifecycle(ClusterState.DISCARDED)
+    with pytest.raises(ValueError):
+        lifecycle.transition(ClusterState.UNCLAIMED)
+
+    lifecycle.recycle()
+    assert lifecycle.state is ClusterState.UNREGISTERED
+
+    with pytest.raises(ValueError):
+        lifecycle.recycle()
@@ -0,0 +1,102 @@
+from kubernaut.model import Cluster
+from kubernaut.protocol import *
+from kubernaut.util import decode, encode
+
+
+def make_cluster(cluster_id="FAKE_CLUSTER_ID", state="UNREGISTERED"):
+    return Cluster(cluster_id=cluster_id, state=state, kubeconfig="FAKE_KUBECONFIG_DATA", token="FAKE_TOKEN")
+
+
+def test_announcer_sends_snapshot_first_then_heartbeats():
+    cluster = make_cluster()
+    announcer = Announcer()
+
+    message_type, data = announcer.next_frame([cluster])
+    assert message_type == CLUSTERS_SNAPSHOT
+    assert decode(data)["clusters"]["FAKE_CLUSTER_ID"]["detail"]["kubeconfig"] == "FAKE_KUBECONFIG_DATA"
+
+    message_type, data = announcer.next_frame([cluster])
+    assert message_type == CLUSTER_HEARTBEAT
+    assert decode(data) == {"@type": CLUSTER_HEARTBEAT, "clusters": ["FAKE_CLUSTER_ID"]}
+
+
+def test_announcer_resends_snapshot_when_cluster_changes():
+    cluster = make_cluster()
+    announcer = Announcer()
+    announcer.next_frame([cluster])
+
+    cluster.state = "UNCLAIMED"
+    assert announcer.next_frame([cluster])[0] == CLUSTERS_SNAPSHOT
+    assert announcer.next_frame([cluster])[0] == CLUSTER_HEARTBEAT
+
+    cluster.state = "UNCLAIMED"
+    assert announcer.next_frame([cluster])[0] == CLUSTER_HEARTBEAT
+
+
+def test_announcer_resends_snapshot_after_reset():
+    cluster = make_cluster()
+    announcer = Announcer()
+    announcer.next_frame([cluster])
+
+    announcer.reset()
+    assert announcer.next_frame([cluster])[0] == CLUSTERS_SNAPSHOT
+
+
+def test_encode_clusters_snapshot_matches_full_encoding():
+    clusters = [make_cluster(cluster_id="A"), make_cluster(cluster_id="B", state="CLAIMED")]
+    assert encode_clusters_snapshot(clusters) == encode(clusters_snapshot(clusters))
+
+    clusters[0].state = "RELEASED"
+    assert encode_clusters_snapshot(clusters) == encode(clusters_snapshot(clusters))
+    assert encode_clusters_snapshot([]) == encode(clusters_snapshot([]))
+
+
+def test_traffic_counter_counts_bytes_per_message_type():
+    traffic = TrafficCounter()
+    traffic.record_sent(CLUSTERS_SNAPSHOT, "x" * 100)
+    traffic.record_sent(CLUSTER_HEARTBEAT, "y" * 10)
+    traffic.record_sent(CLUSTER_HEARTBEAT, "y" * 10)
+    traffic.record_received(CLUSTERS_SNAPSHOT, b"z" * 7)
+
+    assert traffic.summary() == {
+        "sent": {
+            CLUSTERS_SNAPSHOT: {"frames": 1, "bytes": 100},
+            CLUSTER_HEARTBEAT: {"frames": 2, "bytes": 20},
+        },
+        "received": {
+            CLUSTERS_SNAPSHOT: {"frames": 1, "bytes": 7},
+        }
+    }
+
+
+def test_restore_from_sync_applies_claim_status():
+    claimed = make_cluster(cluster_id="CLAIMED_ID", state="UNCLAIMED")
+    purged = make_cluster(cluster_id="PURGED_ID", state="UNCLAIMED")
+
+    forgotten = restore_from_sync([claimed, purged], {
+        "@type": AGENT_SYNC_RESPONSE,
+        "clusters": {"CLAIMED_ID": {"claimStatus": "CLAIMED"}}
+    })
+
+    assert claimed.state == "CLAIMED"
+    assert purged.state == "UNCLAIMED"
+    assert forgotten == [purged]
+
+
+def test_restore_from_sync_with_empty_response():
+    cluster = make_cluster()
+    assert restore_from_sync([cluster], {"@type": AGENT_SYNC_RESPONSE, "clusters": {}}) == [cluster]
+
+
+def test_cluster_ids_accepts_list_or_object():
+    assert cluster_ids({"@type": CLUSTER_RELEASED, "clusters": ["A", "B"]}) == ["A", "B"]
+    assert cluster_ids({"@type": CLUSTER_RELEASED, "clusters": {"A": {}}}) == ["A"]
+    assert cluster_ids({"@type": CLUSTER_RELEASED}) == []
+
+
+def test_restore_from_sync_keeps_released_clusters_released():
+    released = make_cluster(cluster_id="RELEASED_ID", state="RELEASED")
+    forgotten = restore_from_sync([released], {"clusters": {"RELEASED_ID": {"claimStatus": "CLAIMED"}}})
+
+    assert forgotten == []
+    assert released.state == "RELEASED"
@@ -0,0 +1,60 @@
+import os
+import pytest
+import signal
+import sys
+
+from kubernaut.kubernetes import discover_cluster_id, invalidate_tool
+from kubernaut.proxy import KubectlProxy, ProxyApiClient
+from pathlib import Path
+
+FAKE_PROXY = Path(__file__).parent / "fake_kubectl_proxy.py"
+
+
+@pytest.fixture
+def proxy(tmpdir, monkeypatch):
+    invalidate_tool()
+    tool = Path(tmpdir) / "kubectl"
+    tool.write_text("#!/bin/sh\nexec {} {} \"$@\"\n".format(sys.executable, FAKE_PROXY))
+    tool.chmod(0o755)
+    monkeypatch.setenv("KUBERNAUT_KUBECTL", str(tool))
+
+    proxy = KubectlProxy(env={"KUBECONFIG": str(Path(tmpdir) / "config")})
+    yield proxy
+    proxy.stop()
+    invalidate_tool()
+
+
+@pytest.fixture
+def client(proxy):
+    client = ProxyApiClient(proxy)
+    yield client
+    client.close()
+
+
+def test_proxy_api_client_reuses_connection(client):
+    namespace = client.get_namespace("default")
+    assert discover_cluster_id(namespace="default", client=client) == "FAKE-UID"
+    nodes = client.list_nodes()
+    assert [n["metadata"]["name"] for n in nodes["items"]] == ["node-0"]
+    assert nodes["proxy"]["connection"] == namespace["proxy"]["connection"]
+    assert client.connections_opened == 1
+
+
+def test_proxy_is_restarted_when_it_dies(proxy, client):
+    first = client.get_namespace("default")["proxy"]["pid"]
+
+    os.kill(first, signal.SIGKILL)
+    proxy._process.wait()
+
+    second = client.get_namespace("default")["proxy"]["pid"]
+    assert second != first
+    assert proxy.restarts == 1
+
+
+def test_proxy_stop_removes_socket(proxy):
+    proxy.ensure_running()
+    assert os.path.exists(proxy.socket_path)
+
+    proxy.stop()
+    assert not proxy.running
+    assert not os.path.exists(proxy.socket_path)
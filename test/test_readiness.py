@@ -0,0 +1,130 @@
+import asyncio
+
+from kubernaut.api import ApiError
+from kubernaut.backoff import Backoff
+from kubernaut.readiness import ReadinessProbe
+
+
+class FakeKubectl:
+
+    """Answers the readiness probe's kubectl commands from a description of the cluster."""
+
+    def __init__(self, readyz=(0, "ok"), healthz=(0, "ok"), nodes="node-0 True\n", pods="coredns-0 Running true\n"):
+        self.readyz = readyz
+        self.healthz = healthz
+        self.nodes = nodes
+        self.pods = pods
+        self.calls = []
+
+    async def __call__(self, args, env=None):
+        self.calls.append(args)
+        if args[:2] == ["get", "--raw"]:
+            return self.readyz if args[2] == "/readyz" else self.healthz
+
+        return 0, self.nodes if args[1] == "nodes" else self.pods
+
+
+def probe(kubectl, api=None) -> ReadinessProbe:
+    return ReadinessProbe("FAKE_CLUSTER_ID", kubectl, {"KUBECONFIG": "/fake"}, api=api,
+                          backoff=Backoff(base=0.01, cap=0.02))
+
+
+def test_readiness_probe_passes_ready_cluster(run):
+    kubectl = FakeKubectl(pods="coredns-0 Running true true\ncalico-node-0 Running true\nsetup-0 Succeeded\n")
+    assert run(probe(kubectl).check()) == {}
+    assert ["get", "pods", "--namespace=kube-system"] in [c[:3] for c in kubectl.calls]
+
+
+def test_readiness_probe_reports_what_is_not_ready(run):
+    kubectl = FakeKubectl(
+        readyz=(1, "Error from server (InternalError): [-]poststarthook/rbac failed"),
+        nodes="node-0 True\nnode-1 False\nnode-2\n",
+        pods="coredns-0 Running true false\ncalico-node-0 Pending\nkube-proxy-0 Running true\n"
+    )
+
+    assert run(probe(kubectl).check()) == {
+        "apiserver": "not ready: Error from server (InternalError): [-]poststarthook/rbac failed",
+        "nodes": "not ready: node-1, node-2",
+        "kube-system": "not ready: coredns-0, calico-node-0",
+    }
+
+
+def test_readiness_probe_requires_nodes_and_pods(run):
+    assert run(probe(FakeKubectl(nodes="", pods="")).check()) == {"nodes": "no nodes", "kube-system": "no pods"}
+    assert run(probe(FakeKubectl(pods="coredns-0 Failed false\n")).check()) == {"kube-system": "no pods"}
+
+
+def test_readiness_probe_ignores_evicted_pods(run):
+    kubectl = FakeKubectl(pods="coredns-0 Failed false\ncoredns-1 Running true\n")
+    assert run(probe(kubectl).check()) == {}
+
+
+def test_readiness_probe_falls_back_to_healthz(run):
+    kubectl = FakeKubectl(readyz=(1, "Error from server (NotFound): the server could not find the requested resource"))
+    assert run(probe(kubectl).check()) == {}
+    assert ["get", "--raw", "/healthz"] in kubectl.calls
+
+
+def test_readiness_probe_waits_until_ready(run):
+    kubectl = FakeKubectl(nodes="node-0 False\n")
+    readiness = probe(kubectl)
+
+    async def become_ready():
+        await asyncio.sleep(0.1)
+        kubectl.nodes = "node-0 True\n"
+
+    async def wait():
+        ready = asyncio.ensure_future(become_ready())
+        time_to_ready = await readiness.wait()
+        await ready
+        return time_to_ready
+
+    assert run(wait()) >= 0.1
+    assert readiness.polls > 1
+    assert readiness.pending == {}
+    assert readiness.time_to_ready >= 0.1
+
+
+class FakeApi:
+
+    def __init__(self, unreachable=False, status=500):
+        self.unreachable = unreachable
+        self.status = status
+
+    def health(self):
+        if self.unreachable:
+            raise ConnectionRefusedError("connection refused")
+        if self.status == 403:
+            raise ApiError(403, "Forbidden", 'forbidden: User "system:anonymous" cannot get path "/readyz"')
+
+        raise ApiError(500, "Internal Server Error", "[-]etcd failed\nreadyz check failed")
+
+    def list_nodes(self):
+        return {"items": [{"metadata": {"name": "node-0"},
+                           "status": {"conditions": [{"type": "Ready", "status": "True"}]}}]}
+
+    def list_pods(self, namespace):
+        assert namespace == "kube-system"
+        return {"items": [{"metadata": {"name": "coredns-0"},
+                           "status": {"phase": "Running", "containerStatuses": [{"ready": False}]}}]}
+
+
+def test_readiness_probe_uses_api_client(run):
+    kubectl = FakeKubectl()
+    assert run(probe(kubectl, api=FakeApi()).check()) == {
+        "apiserver": "500 Internal Server Error: readyz check failed",
+        "kube-system": "not ready: coredns-0",
+    }
+    assert kubectl.calls == []
+
+
+def test_readiness_probe_falls_back_to_kubectl_when_api_is_unreachable(run):
+    kubectl = FakeKubectl()
+    assert run(probe(kubectl, api=FakeApi(unreachable=True)).check()) == {"kube-system": "not ready: coredns-0"}
+    assert kubectl.calls == [["get", "--raw", "/readyz"]]
+
+
+def test_readiness_probe_falls_back_to_kubectl_when_api_refuses_credentials(run):
+    kubectl = FakeKubectl()
+    assert run(probe(kubectl, api=FakeApi(status=403)).check()) == {"kube-system": "not ready: coredns-0"}
+    assert kubectl.calls == [["get", "--raw", "/readyz"]]
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import pytest
+
+from kubernaut.compression import COMPRESSED_PAYLOAD, PayloadEnvelope
+from kubernaut.session import Session
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.inbound = asyncio.Queue()
+        self.sent = []
+
+    async def recv(self):
+        data = await self.inbound.get()
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def push(self, message):
+        self.inbound.put_nowait(json.dumps(message))
+
+
+def test_session_dispatches_by_type_while_writer_runs(run):
+    handled = []
+
+    async def scenario():
+        websocket = FakeWebSocket()
+
+        def on_release(session, message):
+            handled.append(message["clusters"])
+            session.stop()
+
+        session = Session(websocket, {"cluster-released": on_release})
+
+        async def beats():
+            for n in range(3):
+                session.send({"@type": "cluster-heartbeat", "clusters": [str(n)]})
+                await asyncio.sleep(0.01)
+            websocket.push({"@type": "cluster-released", "clusters": ["C1"]})
+            await asyncio.sleep(10)
+
+        await session.run(beats())
+        return websocket, session
+
+    websocket, session = run(scenario())
+
+    assert handled == [["C1"]]
+    assert [m["clusters"] for m in websocket.sent] == [["0"], ["1"], ["2"]]
+    assert session.traffic.sent_frames["cluster-heartbeat"] == 3
+    assert session.traffic.received_frames["cluster-released"] == 1
+
+
+def test_session_survives_unknown_and_failing_messages(run):
+    handled = []
+
+    async def scenario():
+        websocket = FakeWebSocket()
+
+        def broken(session, message):
+            raise KeyError("clusters")
+
+        async def stop(session, message):
+            handled.append(message["@type"])
+            session.stop()
+
+        session = Session(websocket, {"broken": broken, "stop": stop})
+        websocket.push({"@type": "not-a-real-type"})
+        websocket.push({"@type": "broken"})
+        websocket.push({"@type": "stop"})
+        await session.run()
+
+    run(scenario())
+    assert handled == ["stop"]
+
+
+def test_session_drops_malformed_frames(run):
+    handled = []
+
+    async def scenario():
+        websocket = FakeWebSocket()
+
+        def stop(session, message):
+            handled.append(message["@type"])
+            session.stop()
+
+        session = Session(websocket, {"stop": stop})
+        websocket.inbound.put_nowait("{not json")
+        websocket.inbound.put_nowait("[1, 2]")
+        websocket.push({"@type": COMPRESSED_PAYLOAD, "encoding": "deflate", "payload": "bm90IGRlZmxhdGU="})
+        websocket.push({"@type": COMPRESSED_PAYLOAD, "encoding": "gzip", "payload": ""})
+        websocket.push({"@type": "stop"})
+        await session.run()
+        return session
+
+    session = run(scenario())
+    assert handled == ["stop"]
+    assert dict(session.traffic.received_frames) == {"stop": 1}
+
+
+def test_session_raises_when_connection_fails(run):
+    class Closed(Exception):
+        pass
+
+    async def scenario():
+        websocket = FakeWebSocket()
+        session = Session(websocket, {})
+        websocket.inbound.put_nowait(Closed())
+        await session.run()
+
+    with pytest.raises(Closed):
+        run(scenario())
+
+
+def test_session_drops_messages_when_outbound_queue_is_full(run):
+    async def scenario():
+        session = Session(FakeWebSocket(), {}, max_outbound=2)
+        for n in range(5):
+            session.send({"@type": "cluster-heartbeat", "clusters": [str(n)]})
+        return session.outbound.qsize()
+
+    assert run(scenario()) == 2
+
+
+def test_session_wraps_and_unwraps_compressed_payloads(run):
+    handled = []
+    kubeconfig = "apiVersion: v1\n" * 200
+
+    async def scenario():
+        websocket = FakeWebSocket()
+
+        def on_snapshot(session, message):
+            handled.append(message["clusters"]["A"]["kubeconfig"])
+            session.stop()
+
+        session = Session(websocket, {"clusters-snapshot": on_snapshot}, envelope=PayloadEnvelope())
+        session.send({"@type": "clusters-snapshot", "clusters": {"A": {"kubeconfig": kubeconfig}}})
+
+        async def echo():
+            while not websocket.sent:
+                await asyncio.sleep(0.01)
+            websocket.push(websocket.sent[0])
+            await asyncio.sleep(10)
+
+        await session.run(echo())
+        return websocket, session
+
+    websocket, session = run(scenario())
+
+    assert websocket.sent[0]["@type"] == COMPRESSED_PAYLOAD
+    assert handled == [kubeconfig]
+    assert session.compression.compressed_sent < session.compression.uncompressed_sent
+    assert session.compression.compressed_received < session.compression.uncompressed_received
+    assert session.traffic.received_frames["clusters-snapshot"] == 1
@@ -0,0 +1,160 @@
+import asyncio
+import pytest
+
+from kubernaut.model import Cluster
+from kubernaut.teardown import DryRun, Pipeline, Stage, FAILED, SUCCEEDED, TIMED_OUT
+
+
+def sleeper(seconds: float, log: list = None, name: str = None):
+    async def stage():
+        if log is not None:
+            log.append(name)
+        await asyncio.sleep(seconds)
+
+    return stage
+
+
+def test_pipeline_runs_stages_after_their_dependencies(run):
+    log = []
+    pipeline = Pipeline([
+        Stage("c", sleeper(0, log, "c"), after=["b"]),
+        Stage("b", sleeper(0, log, "b"), after=["a"]),
+        Stage("a", sleeper(0, log, "a")),
+    ])
+
+    run(pipeline.run())
+
+    assert log == ["a", "b", "c"]
+    assert all(s.status == SUCCEEDED for s in pipeline.stages.values())
+
+
+def test_pipeline_overlaps_independent_stages(run):
+    pipeline = Pipeline([
+        Stage("a", sleeper(0.2)),
+        Stage("b", sleeper(0.2)),
+        Stage("c", sleeper(0), after=["a", "b"]),
+    ])
+
+    run(pipeline.run())
+
+    assert pipeline.stages["b"].started < pipeline.stages["a"].finished
+    assert pipeline.stages["c"].started >= max(pipeline.stages["a"].finished, pipeline.stages["b"].finished)
+    assert pipeline.stages["c"].finished < 0.35
+
+
+def test_pipeline_continues_after_failed_and_timed_out_stages(run):
+    async def broken():
+        raise OSError("no route to host")
+
+    pipeline = Pipeline([
+        Stage("broken", broken),
+        Stage("slow", sleeper(10), after=["broken"], timeout=0.1),
+        Stage("last", sleeper(0), after=["slow"]),
+    ])
+
+    run(pipeline.run())
+
+    assert pipeline.stages["broken"].status == FAILED
+    assert pipeline.stages["broken"].error == "OSError: no route to host"
+    assert pipeline.stages["slow"].status == TIMED_OUT
+    assert 0.1 <= pipeline.stages["slow"].duration < 1
+    assert pipeline.stages["last"].status == SUCCEEDED
+
+
+def test_pipeline_critical_path_follows_the_slowest_dependency(run):
+    pipeline = Pipeline([
+        Stage("fast", sleeper(0)),
+        Stage("slow", sleeper(0.1)),
+        Stage("join", sleeper(0), after=["fast", "slow"]),
+        Stage("end", sleeper(0), after=["join"]),
+    ])
+
+    run(pipeline.run())
+
+    assert [s.name for s in pipeline.critical_path()] == ["slow", "join", "end"]
+    assert "critical path: slow -> join -> end" in pipeline.report()
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", sleeper(0)), Stage("a", sleeper(0))], "Duplicate"),
+    ([Stage("a", sleeper(0), after=["b"])], "unknown stage b"),
+    ([Stage("a", sleeper(0), after=["b"]), Stage("b", sleeper(0), after=["a"])], "cycle"),
+])
+def test_pipeline_rejects_invalid_stages(stages, message):
+    with pytest.raises(ValueError, match=message):
+        Pipeline(stages)
+
+
+def test_cluster_shutdown_dry_run(run):
+    dry_run = DryRun(nodes=["node-0", "node-1"], durations={"reset": 0.1})
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="discarded", kubeconfig="FAKE_KUBECONFIG_DATA",
+                      token="FAKE_TOKEN")
+
+    results = run(cluster.shutdown(
+        kubectl_handler=dry_run.kubectl,
+        kubeadm_handler=dry_run.kubeadm,
+        system_handler=dry_run.system,
+        batch_size=2
+    ))
+
+    assert [r.name for r in results] == ["node-0", "node-1"]
+    assert all(r.ok for r in results)
+    assert dry_run.commands == [
+        ["drain", "node-0", "node-1", "--delete-local-data", "--force", "--ignore-daemonsets"],
+        ["delete", "node", "node-0", "node-1"],
+        ["reset"],
+        "systemctl poweroff",
+    ]
+
+    stages = cluster.teardown.stages
+    assert list(stages) == ["list-nodes", "drain-delete-nodes", "kubeadm-reset", "poweroff"]
+    assert stages["kubeadm-reset"].duration >= 0.1
+    assert [s.name for s in cluster.teardown.critical_path()] == list(stages)
+
+
+def test_cluster_shutdown_dry_run_lists_but_does_not_delete_through_the_api(run):
+    class FakeApi:
+        def __init__(self):
+            self.deleted = []
+
+        def list_nodes(self):
+            return {"items": [{"metadata": {"name": "node-0"}}, {"metadata": {"name": "node-1"}}]}
+
+        def delete(self, path):
+            self.deleted.append(path)
+            return {}
+
+    api = FakeApi()
+    dry_run = DryRun(api=api)
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="discarded", kubeconfig="FAKE_KUBECONFIG_DATA",
+                      token="FAKE_TOKEN", api=api)
+
+    results = run(cluster.shutdown(
+        kubectl_handler=dry_run.kubectl,
+        kubeadm_handler=dry_run.kubeadm,
+        system_handler=dry_run.system,
+        batch_size=2,
+        api=dry_run.api
+    ))
+
+    assert [r.name for r in results] == ["node-0", "node-1"]
+    assert all(r.ok for r in results)
+    assert api.deleted == []
+    assert ["delete", "node", "node-0", "node-1"] in dry_run.commands
+
+
+def test_cluster_shutdown_powers_off_after_reset_times_out(run):
+    dry_run = DryRun(nodes=["node-0"], durations={"reset": 10})
+    cluster = Cluster(cluster_id="FAKE_CLUSTER_ID", state="discarded", kubeconfig="FAKE_KUBECONFIG_DATA",
+                      token="FAKE_TOKEN")
+
+    run(cluster.shutdown(
+        kubectl_handler=dry_run.kubectl,
+        kubeadm_handler=dry_run.kubeadm,
+        system_handler=dry_run.system,
+        reset_timeout=0.1
+    ))
+
+    assert cluster.teardown.stages["kubeadm-reset"].status == TIMED_OUT
+    assert cluster.teardown.stages["poweroff"].status == SUCCEEDED
+    assert dry_run.commands[-1] == "systemctl poweroff"
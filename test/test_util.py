@@ -0,0 +1,48 @@
+import pytest
+
+from kubernaut.util import *
+
+MESSAGE = {
+    "@type": "clusters-snapshot",
+    "clusters": {"FAKE_CLUSTER_ID": {"id": "FAKE_CLUSTER_ID", "detail": {"kubeconfig": "apiVersion: v1\nkind: Config"}}}
+}
+
+
+def test_jsonify_is_compact_by_default():
+    assert jsonify({"a": [1, 2]}) == '{"a":[1,2]}'
+    assert jsonify({"a": 1}, indent=2) == '{\n  "a": 1\n}'
+
+
+@pytest.mark.parametrize("name", list(available_codecs()))
+def test_codec_round_trip(name):
+    codec = get_codec(name)
+
+    data = codec.encode(MESSAGE)
+    assert isinstance(data, bytes)
+    assert data.startswith(b'{"@type":"clusters-snapshot","clusters":{"FAKE_CLUSTER_ID":{')
+    assert codec.decode(data) == MESSAGE
+    assert codec.decode(data.decode("utf-8")) == MESSAGE
+
+
+def test_codecs_encode_identically():
+    encoded = {c.encode(MESSAGE) for c in available_codecs().values()}
+    assert len(encoded) == 1
+
+
+def test_json_codec_is_always_available():
+    assert isinstance(get_codec("json"), JsonCodec)
+    assert list(available_codecs())[-1] == "json"
+
+
+def test_get_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("simplejson")
+
+
+def test_set_codec_changes_encoder():
+    previous = codec.name
+    try:
+        assert set_codec("json").name == "json"
+        assert encode({"a": 1}) == b'{"a":1}'
+    finally:
+        set_codec(previous)